@@ -0,0 +1,69 @@
+"""
+Benchmark - nutrition_cache row size and decode time: plain JSON vs nutrition_codec
+
+Uses a realistic 5-result search payload (the page size NutritionAgent uses).
+"Decode" for plain JSON is json.loads of the stored text, which is what the
+JSON column does on every DB hit; for the codec it is nutrition_codec.unpack()
+of the bytes the binary column returns.
+
+Usage:
+    python -m benchmarks.bench_cache_codec [--rounds 20000]
+"""
+
+import argparse
+import json
+import time
+
+from src.utils import nutrition_codec
+
+SEARCH_RESULTS = [
+    {"fdc_id": 171287, "description": "Egg, whole, raw, fresh", "data_type": "SR Legacy", "serving_size": 100,
+     "serving_unit": "g", "calories": 143, "protein": 12.56, "carbs": 0.72, "fat": 9.51, "fiber": 0, "sugar": 0.37,
+     "portions": {"large": 50.0, "medium": 44.0, "cup": 243.0}},
+    {"fdc_id": 172186, "description": "Egg, whole, cooked, scrambled", "data_type": "SR Legacy", "serving_size": 100,
+     "serving_unit": "g", "calories": 149, "protein": 9.99, "carbs": 1.61, "fat": 10.98, "fiber": 0, "sugar": 1.39,
+     "portions": {"large": 61.0, "cup": 220.0}},
+    {"fdc_id": 2705416, "description": "Egg, whole, fried, no added fat", "data_type": "Survey (FNDDS)",
+     "serving_size": 100, "serving_unit": "g", "calories": 159, "protein": 13.1, "carbs": 0.83, "fat": 11.0,
+     "fiber": 0, "sugar": 0.4, "portions": {"large": 46.0, "medium": 40.0}},
+    {"fdc_id": 748967, "description": "Eggs, Grade A, Large, egg whole", "data_type": "Foundation",
+     "serving_size": 100, "serving_unit": "g", "calories": 148, "protein": 12.4, "carbs": 0.96, "fat": 9.96,
+     "portions": {}},
+    {"fdc_id": 172183, "description": "Egg, white, raw, fresh", "data_type": "SR Legacy", "serving_size": 100,
+     "serving_unit": "g", "calories": 52, "protein": 10.9, "carbs": 0.73, "fat": 0.17, "fiber": 0, "sugar": 0.71,
+     "portions": {"large": 33.0, "cup": 243.0}},
+]
+
+
+def _time_per_call(fn, rounds: int, repeats: int = 5) -> float:
+    """Best of `repeats` runs, in microseconds per call (the minimum is the least noisy)."""
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        best = min(best, time.perf_counter() - started)
+    return best / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20000)
+    args = parser.parse_args()
+
+    plain = json.dumps(SEARCH_RESULTS)
+    compact = nutrition_codec.pack(SEARCH_RESULTS)
+    assert nutrition_codec.unpack(compact) == SEARCH_RESULTS
+
+    plain_us = _time_per_call(lambda: json.loads(plain), args.rounds)
+    compact_us = _time_per_call(lambda: nutrition_codec.unpack(compact), args.rounds)
+    encode_us = _time_per_call(lambda: nutrition_codec.pack(SEARCH_RESULTS), args.rounds)
+
+    print(f"row size    plain JSON: {len(plain):5d} bytes   codec: {len(compact):5d} bytes "
+          f"({len(compact) / len(plain):.0%})")
+    print(f"decode      plain JSON: {plain_us:6.1f} us      codec: {compact_us:6.1f} us")
+    print(f"encode      codec: {encode_us:.1f} us (once per USDA fetch)")
+
+
+if __name__ == "__main__":
+    main()
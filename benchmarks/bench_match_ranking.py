@@ -0,0 +1,80 @@
+"""
+Benchmark - Accuracy and cost of picking a USDA match: first result vs match_ranker
+
+Each labeled case is a query, the candidates USDA returns for it (in USDA's
+order) and the fdc_id a dietitian would pick. Reports how often each
+strategy picks the labeled food, and the per-query ranking time.
+
+Usage:
+    python -m benchmarks.bench_match_ranking [--rounds 2000]
+"""
+
+import argparse
+import time
+
+from src.utils.match_ranker import best_match
+
+
+def _c(fdc_id, description, data_type="SR Legacy"):
+    return {"fdc_id": fdc_id, "description": description, "data_type": data_type}
+
+
+# (query, candidates in USDA order, expected fdc_id)
+LABELED_QUERIES = [
+    ("egg", [_c(1, "Bread, egg"), _c(2, "Egg, whole, dried"), _c(3, "Egg, whole, raw, fresh")], 3),
+    ("scrambled eggs", [_c(1, "Egg substitute, powder"), _c(2, "Egg, whole, cooked, scrambled"),
+                        _c(3, "Egg, whole, raw, fresh")], 2),
+    ("banana", [_c(1, "Bananas, dehydrated, or banana powder"), _c(2, "Bananas, raw"),
+                _c(3, "BANANA CHIPS", "Branded")], 2),
+    ("brown rice", [_c(1, "Rice flour, brown"), _c(2, "Rice, brown, long-grain, cooked"),
+                    _c(3, "Rice, white, long-grain, cooked")], 2),
+    ("whole milk", [_c(1, "Milk, dry, whole"), _c(2, "Milk, whole, 3.25% milkfat"),
+                    _c(3, "Milk, chocolate, whole")], 2),
+    ("chicken breast", [_c(1, "Chicken, broilers or fryers, breast, meat only, raw"),
+                        _c(2, "CHICKEN BREAST STRIPS", "Branded"),
+                        _c(3, "Chicken breast, baked", "Survey (FNDDS)")], 3),
+    ("orange juice", [_c(1, "Orange juice, frozen concentrate, unsweetened"), _c(2, "Orange juice, raw"),
+                      _c(3, "Oranges, raw, all commercial varieties")], 2),
+    ("apple", [_c(1, "Apple juice, canned"), _c(2, "Apples, raw, with skin"), _c(3, "Babyfood, apples")], 2),
+    ("oatmeal", [_c(1, "Cereals, oats, instant, dry"), _c(2, "Oatmeal, cooked", "Survey (FNDDS)"),
+                 _c(3, "Oatmeal cookie", "Survey (FNDDS)")], 2),
+    ("peanut butter", [_c(1, "Peanut butter cookie", "Survey (FNDDS)"),
+                       _c(2, "Peanut butter, smooth style, with salt"), _c(3, "Peanut flour, defatted")], 2),
+    ("spinach", [_c(1, "Spinach, frozen, chopped or leaf, unprepared"), _c(2, "Spinach, raw"),
+                 _c(3, "Spinach souffle")], 2),
+    ("salmon", [_c(1, "Fish, salmon, Atlantic, farmed, raw"), _c(2, "Salmon, canned", "Survey (FNDDS)"),
+                _c(3, "Fish, salmon, pink, canned")], 1),
+    ("toast", [_c(1, "Bread, white, commercially prepared, toasted"), _c(2, "Toaster pastry", "Survey (FNDDS)"),
+               _c(3, "French toast, plain", "Survey (FNDDS)")], 1),
+    ("boiled potato", [_c(1, "Potato flour"), _c(2, "Potatoes, boiled, cooked in skin, flesh, without salt"),
+                       _c(3, "Potatoes, baked, flesh and skin, without salt")], 2),
+]
+
+
+def _accuracy(pick) -> float:
+    correct = sum(1 for query, candidates, expected in LABELED_QUERIES if pick(query, candidates)["fdc_id"] == expected)
+    return correct / len(LABELED_QUERIES)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    first = _accuracy(lambda query, candidates: candidates[0])
+    ranked = _accuracy(best_match)
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for query, candidates, _ in LABELED_QUERIES:
+            best_match(query, candidates)
+    per_query_us = (time.perf_counter() - started) / (args.rounds * len(LABELED_QUERIES)) * 1e6
+
+    print(f"labeled queries:        {len(LABELED_QUERIES)}")
+    print(f"first result accuracy:  {first:.0%}")
+    print(f"match_ranker accuracy:  {ranked:.0%}")
+    print(f"ranking time per query: {per_query_us:.1f} us (warm token index)")
+
+
+if __name__ == "__main__":
+    main()
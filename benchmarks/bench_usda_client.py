@@ -0,0 +1,122 @@
+"""
+Benchmark - Per-lookup latency of a fresh httpx client vs the pooled USDAService client
+
+Runs against a local stand-in for the USDA search endpoint, so it measures
+connection setup overhead only (no TLS, no real API latency). Against
+api.nal.usda.gov the pooled client also skips the TLS handshake, so the
+real-world win is larger than what this shows.
+
+Usage:
+    python -m benchmarks.bench_usda_client [--requests 200]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+FAKE_SEARCH_RESPONSE = json.dumps({
+    "foods": [
+        {
+            "fdcId": 171287,
+            "description": "Egg, whole, raw, fresh",
+            "dataType": "SR Legacy",
+            "foodNutrients": [
+                {"nutrientId": 1008, "nutrientName": "Energy", "unitName": "KCAL", "value": 143},
+                {"nutrientId": 1003, "nutrientName": "Protein", "unitName": "G", "value": 12.56},
+                {"nutrientId": 1005, "nutrientName": "Carbohydrate, by difference", "unitName": "G", "value": 0.72},
+                {"nutrientId": 1004, "nutrientName": "Total lipid (fat)", "unitName": "G", "value": 9.51},
+            ],
+        }
+    ]
+}).encode()
+
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Answers every GET with a canned USDA search payload over a keep-alive connection."""
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without this, Nagle + delayed ACK
+    # adds ~40 ms to every request on a reused connection.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(FAKE_SEARCH_RESPONSE)))
+        self.end_headers()
+        self.wfile.write(FAKE_SEARCH_RESPONSE)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_server() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _time_calls(fn, n: int) -> list[float]:
+    timings = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _report(label: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<28} mean {statistics.mean(timings):7.3f} ms   p50 {statistics.median(timings):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="lookups per variant")
+    args = parser.parse_args()
+
+    server = _start_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/fdc/v1"
+
+    # USDAService reads its config from the environment; fill in placeholders for the bench.
+    os.environ["USDA_BASE_URL"] = base_url
+    for key, value in {
+        "GOOGLE_API_KEY": "bench", "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_APP_TOKEN": "xapp-bench", "SLACK_SIGNING_SECRET": "bench",
+    }.items():
+        os.environ.setdefault(key, value)
+
+    from src.services.usda_service import USDAService
+
+    params = {"query": "egg", "pageSize": 5}
+
+    def fresh_client_lookup():
+        with httpx.Client(timeout=10.0) as client:
+            client.get(f"{base_url}/foods/search", params=params).raise_for_status()
+
+    service = USDAService()
+
+    def pooled_lookup():
+        service._get_json("/foods/search", dict(params))
+
+    # Warm up both paths so the comparison excludes first-import costs
+    fresh_client_lookup()
+    pooled_lookup()
+
+    print(f"{args.requests} lookups against {base_url}")
+    _report("new client per lookup", _time_calls(fresh_client_lookup, args.requests))
+    _report("pooled USDAService client", _time_calls(pooled_lookup, args.requests))
+
+    service.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
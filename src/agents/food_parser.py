@@ -5,17 +5,35 @@ Food Parser Agent - Extracts structured food data from natural language
 import logging
 from typing import Dict, List, Any, Optional
 from datetime import datetime
+from ..config import get_settings
 from ..services.ai_service import get_ai_service
+from ..services.parse_cache import ParseCache
+from ..utils.message_text import is_referential
+from ..utils.rule_parser import parse_food_text
 
 logger = logging.getLogger(__name__)
 
+MEAL_TIME_HINTS = {
+    "morning": "morning (likely breakfast)",
+    "afternoon": "afternoon (likely lunch)",
+    "evening": "evening (likely dinner)",
+    "late night": "late night (likely snack)",
+}
+
+MEAL_TYPE_BY_TIME = {"morning": "breakfast", "afternoon": "lunch", "evening": "dinner", "late night": "snack"}
+
 
 class FoodParserAgent:
     """Agent that parses natural language food descriptions"""
     
     def __init__(self):
         """Initialize food parser agent"""
+        settings = get_settings()
         self.ai_service = get_ai_service()
+        self.parse_cache = ParseCache()
+        self.rule_parser_enabled = settings.rule_parser_enabled
+        self.rule_parser_min_confidence = settings.rule_parser_min_confidence
+        self.local_parses = 0
     
     def parse(
         self,
@@ -24,10 +42,83 @@ class FoodParserAgent:
         history: Optional[List[Dict[str, str]]] = None
     ) -> Dict[str, Any]:
         """Parse food message into structured data with items, meal type, and confidence."""
-        context_str = self._build_context_string(context)
+        local = self.parse_locally(message, history)
+        if local is not None:
+            return self._finish(local, message)
 
-        result = self.ai_service.parse_food_message(message, context_str, history=history)
-        
+        cache_key = self._cache_key(message, context, history)
+        result = self.parse_cache.get(cache_key) if cache_key else None
+        if result is None:
+            result = self.ai_service.parse_food_message(message, self._build_context_string(context), history=history)
+            if cache_key:
+                self.parse_cache.set(cache_key, result)
+        return self._finish(result, message)
+
+    def parse_locally(
+        self,
+        message: str,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Rule-based parse of a simple message ("2 eggs and toast"), or None if it isn't confident.
+
+        Messages that refer back to the conversation always go to Gemini.
+        """
+        if not self.rule_parser_enabled or is_referential(message, history):
+            return None
+        result = parse_food_text(message)
+        if result is None or result["confidence_score"] < self.rule_parser_min_confidence:
+            return None
+
+        meal_type = result["meal_type"] or MEAL_TYPE_BY_TIME[self._meal_time_bucket(datetime.now())]
+        result["meal_type"] = meal_type
+        for food in result["foods"]:
+            food["meal_type"] = food["meal_type"] or meal_type
+        self.local_parses += 1
+        logger.info(f"Parsed locally (confidence {result['confidence_score']}), skipped Gemini")
+        return result
+
+    def parse_with_intent(
+        self,
+        message: str,
+        context: Optional[Dict[str, Any]] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, Any]:
+        """Detect intent and parse foods with a single Gemini call (for messages keywords can't route).
+
+        Returns the parse result plus "intent", "confidence" and "entities". Only
+        log_food messages carry foods; those are cached exactly like parse() results,
+        and a cached parse answers without any call (only food logs are ever cached).
+        """
+        cache_key = self._cache_key(message, context, history)
+        cached = self.parse_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            cached.update({"intent": "log_food", "entities": {}})
+            return self._finish(cached, message)
+
+        result = self.ai_service.detect_intent_and_parse(message, self._build_context_string(context), history=history)
+        if cache_key and result.get("intent") == "log_food":
+            self.parse_cache.set(cache_key, {k: v for k, v in result.items() if k not in ("intent", "entities")})
+        return self._finish(result, message)
+
+    def _cache_key(
+        self,
+        message: str,
+        context: Optional[Dict[str, Any]],
+        history: Optional[List[Dict[str, str]]]
+    ) -> Optional[str]:
+        """Parse cache key, or None when the message leans on the conversation so far."""
+        if is_referential(message, history):
+            self.parse_cache.record_bypass()
+            return None
+        return ParseCache.make_key(
+            message,
+            meal_time=self._meal_time_bucket(datetime.now()) if context else None,
+            preferred_units=(context or {}).get("preferred_units"),
+            recent_meals=str((context or {}).get("recent_meals") or ""),
+        )
+
+    def _finish(self, result: Dict[str, Any], message: str) -> Dict[str, Any]:
+        """Stamp a parse result and log what was found."""
         # Add timestamp
         result["timestamp"] = datetime.now()
         result["original_message"] = message
@@ -51,16 +142,7 @@ class FoodParserAgent:
         parts = []
         
         # Time of day
-        now = datetime.now()
-        hour = now.hour
-        if 5 <= hour < 12:
-            parts.append("Time: morning (likely breakfast)")
-        elif 12 <= hour < 17:
-            parts.append("Time: afternoon (likely lunch)")
-        elif 17 <= hour < 22:
-            parts.append("Time: evening (likely dinner)")
-        else:
-            parts.append("Time: late night (likely snack)")
+        parts.append(f"Time: {MEAL_TIME_HINTS[self._meal_time_bucket(datetime.now())]}")
         
         # User preferences
         if context.get("preferred_units"):
@@ -72,6 +154,22 @@ class FoodParserAgent:
         
         return " | ".join(parts) if parts else None
     
+    @staticmethod
+    def _meal_time_bucket(now: datetime) -> str:
+        """Part of the day, which decides the meal type hint given to the parser."""
+        hour = now.hour
+        if 5 <= hour < 12:
+            return "morning"
+        elif 12 <= hour < 17:
+            return "afternoon"
+        elif 17 <= hour < 22:
+            return "evening"
+        return "late night"
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """How many messages were parsed without Gemini, locally or from the parse cache."""
+        return {"local_parses": self.local_parses, "parse_cache": self.parse_cache.stats()}
+
     def validate_parsed_foods(self, parsed_data: Dict[str, Any]) -> tuple[bool, List[str]]:
         """Validate that parsed foods have reasonable names and quantities."""
         issues = []
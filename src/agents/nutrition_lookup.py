@@ -4,52 +4,126 @@ Nutrition Lookup Agent - Looks up nutrition data for food items
 
 import json
 import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from typing import Dict, List, Any, Optional
-from ..services.usda_service import get_usda_service
+from ..config import get_settings
+from ..services.usda_service import LOOKUP_PAGE_SIZE, get_usda_service
+from ..utils.food_normalizer import normalize_food_name, food_cache_key
+from ..utils.match_ranker import best_match as rank_best_match
+from ..utils.single_flight import SingleFlight
+from ..utils.units import WEIGHT_UNITS, canonical_unit
 
 logger = logging.getLogger(__name__)
 
+# Nutrients Gemini estimates per 100g
+AI_NUTRIENTS = ("calories", "protein", "carbs", "fat", "fiber", "sugar")
+
+# Nothing edible has more energy per 100g than pure fat (~900 kcal)
+MAX_CALORIES_PER_100G = 950
+
 
 class NutritionAgent:
     """Agent that looks up nutrition data for foods"""
     
     def __init__(self):
         """Initialize nutrition agent"""
+        settings = get_settings()
         self.usda_service = get_usda_service()
+        self.lookup_deadline = settings.nutrition_lookup_deadline
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.nutrition_lookup_workers,
+            thread_name_prefix="nutrition-lookup",
+        )
+        self._ai_inflight = SingleFlight()
+        self._ai_stats = {"batches": 0, "items": 0, "cache_hits": 0}
     
     def lookup_nutrition(
         self,
         parsed_foods: List[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
-        """Look up nutrition data for parsed food items."""
-        enriched_foods = []
-        
+        """Look up nutrition data for parsed food items concurrently, preserving input order.
+
+        Each distinct food name is searched once; items still unresolved when the
+        per-message deadline passes are marked unknown instead of blocking the reply.
+        """
+        deadline = time.monotonic() + self.lookup_deadline
+
+        # Phase 1: one USDA search per distinct food name
+        searches = {}
         for food in parsed_foods:
-            try:
-                enriched = self._lookup_single_food(food)
-                enriched_foods.append(enriched)
-            except Exception as e:
-                logger.error(f"Error looking up nutrition for {food.get('name')}: {e}")
-                # Add food with estimated/default nutrition
-                enriched_foods.append(self._create_fallback_food(food))
-        
+            key = self._lookup_key(food)
+            if key not in searches:
+                searches[key] = self._executor.submit(self._search_usda, food.get("name", ""))
+        wait(searches.values(), timeout=max(0.0, deadline - time.monotonic()))
+
+        # Phase 2: scale matches / run fallbacks per item
+        items = []
+        for food in parsed_foods:
+            search = searches[self._lookup_key(food)]
+            if search.done():
+                items.append(self._executor.submit(self._resolve_food, food, search))
+            else:
+                items.append(None)
+        wait([f for f in items if f is not None], timeout=max(0.0, deadline - time.monotonic()))
+
+        enriched_foods: List[Optional[Dict[str, Any]]] = []
+        timed_out = set()
+        for i, (food, future) in enumerate(zip(parsed_foods, items)):
+            if future is not None and future.done():
+                enriched_foods.append(future.result())
+            else:
+                timed_out.add(i)
+                enriched_foods.append(self._create_unknown_food(food, f"Lookup for '{food.get('name', '')}' timed out"))
+
+        # Phase 3: every item USDA couldn't match goes to Gemini in one batched call
+        unmatched = [i for i, enriched in enumerate(enriched_foods) if enriched is None]
+        if unmatched:
+            fallback = self._executor.submit(self._create_fallback_foods, [parsed_foods[i] for i in unmatched])
+            wait([fallback], timeout=max(0.0, deadline - time.monotonic()))
+            if fallback.done():
+                for i, enriched in zip(unmatched, fallback.result()):
+                    enriched_foods[i] = enriched
+            else:
+                timed_out.update(unmatched)
+                for i in unmatched:
+                    name = parsed_foods[i].get("name", "")
+                    enriched_foods[i] = self._create_unknown_food(parsed_foods[i], f"Lookup for '{name}' timed out")
+
+        for i in sorted(timed_out):
+            logger.warning(f"Nutrition lookup for {parsed_foods[i].get('name')} missed the {self.lookup_deadline}s deadline")
+
         return enriched_foods
+
+    def _resolve_food(self, food: Dict[str, Any], search: Future) -> Optional[Dict[str, Any]]:
+        """Enrich one item from its (finished) USDA search; None means it needs an AI estimate."""
+        try:
+            return self._enrich_with_match(food, search.result())
+        except Exception as e:
+            logger.error(f"Error looking up nutrition for {food.get('name')}: {e}")
+            return None
+
+    @staticmethod
+    def _lookup_key(food: Dict[str, Any]) -> str:
+        """Key used to deduplicate searches for the same food within one message."""
+        return food_cache_key(food.get("name", ""))
+
+    def _search_usda(self, food_name: str) -> List[Dict[str, Any]]:
+        """Search USDA for candidate matches using the canonical form of the food name."""
+        return self.usda_service.search_foods(normalize_food_name(food_name) or food_name, page_size=LOOKUP_PAGE_SIZE)
     
-    def _lookup_single_food(self, food: Dict[str, Any]) -> Dict[str, Any]:
-        """Look up nutrition for a single food item via USDA."""
+    def _enrich_with_match(self, food: Dict[str, Any], search_results: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Scale the best USDA match to the item's serving; None when USDA has no match."""
         food_name = food.get("name", "")
         quantity = food.get("quantity", 1)
         unit = food.get("unit", "serving")
         
-        # Search USDA database
-        search_results = self.usda_service.search_foods(food_name, page_size=5)
-        
         if not search_results:
             logger.warning(f"No USDA results found for: {food_name}")
-            return self._create_fallback_food(food)
+            return None
         
-        # Take the best match (first result)
-        best_match = search_results[0]
+        # Re-rank every candidate locally; USDA's first hit is often a poor fit
+        best_match = rank_best_match(food_name, search_results)
         
         # Calculate nutrition for the specified serving
         nutrition = self.usda_service.calculate_nutrition_for_serving(
@@ -80,30 +154,42 @@ class NutritionAgent:
         
         return enriched
     
-    def _create_fallback_food(self, food: Dict[str, Any]) -> Dict[str, Any]:
+    def _create_fallback_foods(self, foods: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
-        When USDA lookup fails, use AI to estimate nutrition.
+        When USDA lookup fails, use AI to estimate nutrition (one call for all items).
         If AI also fails, mark as unknown.
         """
-        food_name = food.get("name", "").lower()
-        quantity = food.get("quantity", 1)
-        unit = food.get("unit", "serving")
+        estimates = self._ai_estimates(foods)
+        enriched_foods = []
+        for food in foods:
+            food_name = food.get("name", "").lower()
+            estimate = estimates.get(self._lookup_key(food))
+            if not estimate:
+                logger.warning(f"Could not estimate nutrition for: {food_name}")
+                enriched_foods.append(self._create_unknown_food(food))
+                continue
 
-        ai_estimate = self._ai_estimate_nutrition(food_name, quantity, unit)
-        if ai_estimate:
+            nutrition = self.usda_service.calculate_nutrition_for_serving(
+                estimate, food.get("quantity", 1), food.get("unit", "serving")
+            )
             enriched = food.copy()
             enriched.update({
-                "calories": round(ai_estimate["calories"], 2),
-                "protein": round(ai_estimate["protein"], 2),
-                "carbs": round(ai_estimate["carbs"], 2),
-                "fat": round(ai_estimate["fat"], 2),
+                "calories": nutrition["calories"],
+                "protein": nutrition["protein"],
+                "carbs": nutrition["carbs"],
+                "fat": nutrition["fat"],
+                "fiber": nutrition["fiber"],
+                "sugar": nutrition["sugar"],
                 "source": "ai_estimated",
                 "confidence": "medium",
                 "note": "Nutrition estimated by AI (not from USDA database)"
             })
-            logger.info(f"AI estimated nutrition for: {food_name} -> {ai_estimate['calories']} cal")
-            return enriched
+            logger.info(f"AI estimated nutrition for: {food_name} -> {nutrition['calories']} cal")
+            enriched_foods.append(enriched)
+        return enriched_foods
 
+    def _create_unknown_food(self, food: Dict[str, Any], note: Optional[str] = None) -> Dict[str, Any]:
+        """Mark a food as unknown (0 cal) so the user is asked for help."""
         enriched = food.copy()
         enriched.update({
             "calories": 0,
@@ -112,31 +198,77 @@ class NutritionAgent:
             "fat": 0,
             "source": "estimated",
             "confidence": "unknown",
-            "note": f"Could not find nutrition data for '{food.get('name', food_name)}'"
+            "note": note or f"Could not find nutrition data for '{food.get('name', '')}'"
         })
-        logger.warning(f"Could not estimate nutrition for: {food_name}")
         return enriched
 
-    def _ai_estimate_nutrition(self, food_name: str, quantity: float, unit: str) -> Optional[Dict[str, float]]:
-        """Use AI to estimate nutrition when USDA lookup fails."""
+    def _ai_estimates(self, foods: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Per-100g estimates keyed by food cache key: cached ones first, the rest in one Gemini call.
+
+        A cached estimate is reused at any quantity; it is only re-requested when the
+        item's unit is one we have no gram weight for yet.
+        """
+        estimates = self.usda_service.get_ai_estimates([food.get("name", "") for food in foods])
+        self._ai_stats["cache_hits"] += len(estimates)
+
+        wanted: Dict[str, Dict[str, Any]] = {}
+        for food in foods:
+            key = self._lookup_key(food)
+            unit = canonical_unit(food.get("unit", "serving"))
+            known = estimates.get(key)
+            if known and (unit in WEIGHT_UNITS or unit in known.get("portions", {})):
+                continue
+            item = wanted.setdefault(key, {"name": food.get("name", "").lower(), "units": []})
+            if unit not in WEIGHT_UNITS and unit not in item["units"]:
+                item["units"].append(unit)
+
+        if wanted:
+            # Identical concurrent batches (e.g. the same message twice) share one Gemini call
+            flight_key = tuple(sorted((key, tuple(sorted(item["units"]))) for key, item in wanted.items()))
+            fresh = self._ai_inflight.do(flight_key, lambda: self._request_ai_estimates(wanted))
+            for key, estimate in fresh.items():
+                if key in estimates:
+                    # New unit weights for a food we already had
+                    estimate["portions"] = {**estimates[key].get("portions", {}), **estimate["portions"]}
+                estimates[key] = estimate
+            self.usda_service.cache_ai_estimates(fresh)
+        return estimates
+
+    def _request_ai_estimates(self, wanted: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Ask Gemini for per-100g nutrition of several foods in one structured prompt."""
+        keys = list(wanted)
+        self._ai_stats["batches"] += 1
+        self._ai_stats["items"] += len(keys)
         try:
             from ..services.ai_service import get_ai_service
             ai_service = get_ai_service()
 
-            prompt = f"""Estimate the nutritional content for: {quantity} {unit} of {food_name}
+            listing = "\n".join(
+                f"{i}. {wanted[key]['name']}"
+                + (f" (units: {', '.join(wanted[key]['units'])})" if wanted[key]["units"] else "")
+                for i, key in enumerate(keys)
+            )
+            prompt = f"""Estimate the nutritional content per 100 grams of each of these foods:
+{listing}
 
-Return ONLY a JSON object with these fields (numbers only, no text):
-{{
-    "calories": <total calories as number>,
-    "protein": <grams of protein>,
-    "carbs": <grams of carbs>,
-    "fat": <grams of fat>
-}}
+Return ONLY a JSON array with one object per food, in the same order (numbers only, no text):
+[
+    {{
+        "id": <the food's number above>,
+        "calories": <calories per 100g>,
+        "protein": <grams of protein per 100g>,
+        "carbs": <grams of carbs per 100g>,
+        "fat": <grams of fat per 100g>,
+        "fiber": <grams of fiber per 100g>,
+        "sugar": <grams of sugar per 100g>,
+        "grams": {{"<unit>": <typical grams in one of that unit>, ...one entry per listed unit}}
+    }}
+]
 
 Use your knowledge of typical nutritional values. Be as accurate as possible.
-If you truly have no idea what this food is, return: {{"calories": 0, "protein": 0, "carbs": 0, "fat": 0, "unknown": true}}"""
+If you truly have no idea what a food is, return {{"id": <number>, "unknown": true}} for it."""
 
-            result = ai_service.chat_model.invoke(prompt)
+            result = ai_service.invoke(prompt, intent="nutrition_estimate")
             content = result.content.strip()
             if content.startswith("```json"):
                 content = content[7:]
@@ -144,26 +276,51 @@ If you truly have no idea what this food is, return: {{"calories": 0, "protein":
                 content = content[3:]
             if content.endswith("```"):
                 content = content[:-3]
-            content = content.strip()
-
-            data = json.loads(content)
+            data = json.loads(content.strip())
+            if isinstance(data, dict):
+                data = data.get("foods", [data])
+        except Exception as e:
+            logger.error(f"AI nutrition estimation failed for {', '.join(keys)}: {e}")
+            return {}
 
-            if data.get("unknown"):
-                return None
+        estimates = {}
+        for position, entry in enumerate(data if isinstance(data, list) else []):
+            try:
+                item_id = int(entry.get("id", position))
+                # A negative or made-up id would otherwise index some other food
+                if not 0 <= item_id < len(keys):
+                    raise IndexError(f"id {item_id} is not one of the {len(keys)} listed foods")
+                key = keys[item_id]
+                estimate = self._estimate_from_ai(wanted[key]["name"], entry)
+            except (AttributeError, IndexError, TypeError, ValueError) as e:
+                logger.warning(f"Ignoring malformed AI estimate {entry!r}: {e}")
+                continue
+            if estimate:
+                estimates[key] = estimate
+        return estimates
 
-            if data.get("calories", 0) > 0:
-                return {
-                    "calories": float(data["calories"]),
-                    "protein": float(data.get("protein", 0)),
-                    "carbs": float(data.get("carbs", 0)),
-                    "fat": float(data.get("fat", 0))
-                }
+    @staticmethod
+    def _estimate_from_ai(name: str, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Turn one AI answer into a per-100g food record, or None if it is unusable."""
+        if entry.get("unknown"):
             return None
-
-        except Exception as e:
-            logger.error(f"AI nutrition estimation failed for {food_name}: {e}")
+        calories = float(entry.get("calories", 0))
+        if not 0 < calories <= MAX_CALORIES_PER_100G:
             return None
-    
+        estimate: Dict[str, Any] = {
+            "description": name,
+            "serving_size": 100,
+            "serving_unit": "g",
+            "portions": {
+                canonical_unit(unit): float(grams)
+                for unit, grams in (entry.get("grams") or {}).items()
+                if isinstance(grams, (int, float)) and grams > 0
+            },
+        }
+        for field in AI_NUTRIENTS:
+            estimate[field] = round(float(entry.get(field) or 0), 2)
+        return estimate
+
     def _calculate_match_confidence(self, query: str, matched_description: str) -> str:
         """Calculate confidence score for USDA match (high/medium/low)."""
         query_lower = query.lower()
@@ -185,6 +342,16 @@ If you truly have no idea what this food is, return: {{"calories": 0, "protein":
         else:
             return "low"
     
+    def get_stats(self) -> Dict[str, Any]:
+        """AI estimate batching/coalescing metrics and those of the underlying USDA service."""
+        return {
+            "ai_single_flight": self._ai_inflight.stats(),
+            "ai_estimates": dict(self._ai_stats),
+            "usda": self.usda_service.get_cache_stats(),
+            "usda_quota": self.usda_service.get_quota_stats(),
+            "usda_health": self.usda_service.get_health_stats(),
+        }
+    
     def calculate_totals(self, enriched_foods: List[Dict[str, Any]]) -> Dict[str, float]:
         """Sum up nutrition totals from all food items."""
         totals = {
@@ -2,6 +2,7 @@
 Orchestrator - Coordinates all agents using LangGraph
 """
 
+import json
 import logging
 from datetime import date, datetime, timedelta
 from typing import Dict, Any, Optional, TypedDict, Tuple
@@ -11,12 +12,18 @@ from .router_agent import get_router_agent
 from .food_parser import get_food_parser_agent
 from .nutrition_lookup import get_nutrition_agent
 from .storage_agent import get_storage_agent
-from ..utils.formatters import format_food_log_message, format_daily_summary, format_range_summary
+from ..utils.formatters import (
+    format_food_log_message, format_daily_summary, format_range_summary, format_onboarding_progress
+)
 from ..utils.calculations import calculate_tdee, calculate_calorie_goal
+from ..utils.profile_extractor import clean_profile, extract_profile, missing_fields
 from ..utils.rate_limiter import RateLimiter
 
 logger = logging.getLogger(__name__)
 
+# User.preferences key holding onboarding answers collected so far
+ONBOARDING_DRAFT_KEY = "onboarding_draft"
+
 
 class ConversationState(TypedDict):
     """State that flows through the agent graph"""
@@ -186,6 +193,10 @@ class CalorieBotOrchestrator:
         try:
             routing = self.router.route(state["message"], state["user_context"], history=state.get("history"))
             state["intent"] = routing["intent"]
+            if routing.get("parsed") and routing["parsed"].get("foods"):
+                # Foods came back with the intent; parse_food won't call Gemini again.
+                # An empty list isn't a parse: the dedicated parse still gets its try
+                state["parsed_foods"] = routing["parsed"]["foods"]
             logger.info(f"Routed to intent: {routing['intent']}")
         except Exception as e:
             logger.error(f"Error routing intent: {e}")
@@ -214,10 +225,13 @@ class CalorieBotOrchestrator:
     def _parse_food(self, state: ConversationState) -> ConversationState:
         """Parse food from message"""
         try:
-            parsed = self.food_parser.parse(state["message"], state["user_context"], history=state.get("history"))
-            state["parsed_foods"] = parsed["foods"]
+            if state.get("parsed_foods") is None:
+                parsed = self.food_parser.parse(state["message"], state["user_context"], history=state.get("history"))
+                state["parsed_foods"] = parsed["foods"]
+            else:
+                logger.info("Foods already parsed during routing; skipping parse call")
             
-            if not parsed["foods"]:
+            if not state["parsed_foods"]:
                 state["response"] = "I couldn't identify any food items in your message. Could you try describing what you ate?"
                 state["intent"] = END
         except Exception as e:
@@ -401,53 +415,26 @@ Need anything else?"""
         return state
     
     def _handle_onboarding(self, state: ConversationState) -> ConversationState:
-        """Handle onboarding flow - check if user already provided data or show welcome"""
-        from ..services.ai_service import AIService
-        from ..utils.calculations import calculate_tdee, calculate_calorie_goal
-        import re
-        
-        # Try to extract onboarding data from the message
-        ai_service = AIService()
+        """Handle onboarding flow - collect profile details across messages, then set the calorie goal.
+
+        Details are read locally where possible; Gemini is asked only about what is still
+        missing, and only when the message has words the local extractor couldn't place.
+        Partial answers are kept in the user's preferences until the profile is complete.
+        """
+        preferences = dict((state.get("user_context") or {}).get("preferences") or {})
+        stored_draft = preferences.get(ONBOARDING_DRAFT_KEY) or {}
+        data = dict(stored_draft)
         
         try:
-            # Ask AI to extract onboarding information
-            extraction_prompt = f"""Extract the following information from this message if present:
-Message: "{state['message']}"
-
-Return JSON with these fields (use null if not found):
-- age (number)
-- gender ("male" or "female")
-- weight_kg (number, convert from lbs if needed: lbs * 0.453592)
-- height_cm (number, convert from inches if needed: inches * 2.54)
-- activity_level ("sedentary", "lightly_active", "moderately_active", or "very_active")
-- goal ("lose_weight", "maintain_weight", or "gain_weight")
-
-Examples:
-"I'm 30 years old, male, 75kg, 175cm, moderately active, and want to lose weight"
-→ {{"age": 30, "gender": "male", "weight_kg": 75, "height_cm": 175, "activity_level": "moderately_active", "goal": "lose_weight"}}
-
-"25 female 140 lbs 5'6\" sedentary maintain"
-→ {{"age": 25, "gender": "female", "weight_kg": 63.5, "height_cm": 167.64, "activity_level": "sedentary", "goal": "maintain_weight"}}"""
-            
-            result = ai_service.chat_model.invoke(extraction_prompt)
-            import json
-            content = result.content.strip()
-            # Clean markdown if present
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.startswith("```"):
-                content = content[3:]
-            if content.endswith("```"):
-                content = content[:-3]
-            content = content.strip()
-            
-            data = json.loads(content)
-            
-            # Check if we have all required fields
-            required_fields = ["age", "gender", "weight_kg", "height_cm", "activity_level", "goal"]
-            has_all_data = all(data.get(field) is not None for field in required_fields)
+            found, leftover = extract_profile(state["message"], missing_fields(data))
+            data.update(found)
+            missing = missing_fields(data)
+            if missing and leftover:
+                ai_data = self._extract_onboarding_with_ai(state["message"])
+                data.update({field: value for field, value in ai_data.items() if field in missing})
+                missing = missing_fields(data)
             
-            if has_all_data:
+            if not missing:
                 # Process the onboarding data
                 logger.info(f"Processing onboarding data: {data}")
                 
@@ -462,7 +449,8 @@ Examples:
                 
                 calorie_goal = calculate_calorie_goal(tdee, data["goal"])
                 
-                # Update user in database
+                # Update user in database (and drop the draft)
+                preferences.pop(ONBOARDING_DRAFT_KEY, None)
                 self.storage.update_user(state["user_id"], {
                     "age": data["age"],
                     "gender": data["gender"],
@@ -470,7 +458,8 @@ Examples:
                     "height": data["height_cm"],
                     "activity_level": data["activity_level"],
                     "daily_calorie_goal": calorie_goal,
-                    "target_weight": data["weight_kg"] - 5 if data["goal"] == "lose_weight" else data["weight_kg"] + 5 if data["goal"] == "gain_weight" else data["weight_kg"]
+                    "target_weight": data["weight_kg"] - 5 if data["goal"] == "lose_weight" else data["weight_kg"] + 5 if data["goal"] == "gain_weight" else data["weight_kg"],
+                    "preferences": preferences
                 })
                 
                 # Mark as onboarded
@@ -491,6 +480,13 @@ You can now start logging your meals! Just tell me what you eat, like:
 
 Let's get started! :dart:"""
                 return state
+
+            if data != stored_draft:
+                # JSON column: assign a new dict so the change is persisted
+                self.storage.update_user(state["user_id"], {"preferences": {**preferences, ONBOARDING_DRAFT_KEY: data}})
+            if data:
+                state["response"] = format_onboarding_progress(data, missing)
+                return state
                 
         except Exception as e:
             logger.error(f"Error processing onboarding data: {e}")
@@ -514,6 +510,45 @@ You can say something like: _"I'm 30 years old, male, 75kg, 175cm, moderately ac
 (Or we can do this step by step if you prefer!)"""
         return state
     
+    def _extract_onboarding_with_ai(self, message: str) -> Dict[str, Any]:
+        """Ask Gemini for the profile fields in a message the local extractor couldn't fully read."""
+        from ..services.ai_service import get_ai_service
+
+        extraction_prompt = f"""Extract the following information from this message if present:
+Message: "{message}"
+
+Return JSON with these fields (use null if not found):
+- age (number)
+- gender ("male" or "female")
+- weight_kg (number, convert from lbs if needed: lbs * 0.453592)
+- height_cm (number, convert from inches if needed: inches * 2.54)
+- activity_level ("sedentary", "lightly_active", "moderately_active", or "very_active")
+- goal ("lose_weight", "maintain_weight", or "gain_weight")
+
+Examples:
+"I'm 30 years old, male, 75kg, 175cm, moderately active, and want to lose weight"
+→ {{"age": 30, "gender": "male", "weight_kg": 75, "height_cm": 175, "activity_level": "moderately_active", "goal": "lose_weight"}}
+
+"25 female 140 lbs 5'6\" sedentary maintain"
+→ {{"age": 25, "gender": "female", "weight_kg": 63.5, "height_cm": 167.64, "activity_level": "sedentary", "goal": "maintain_weight"}}"""
+        
+        try:
+            # Shared client (and request governor) rather than a new one per message
+            result = get_ai_service().invoke(extraction_prompt, intent="onboarding")
+            content = result.content.strip()
+            # Clean markdown if present
+            if content.startswith("```json"):
+                content = content[7:]
+            if content.startswith("```"):
+                content = content[3:]
+            if content.endswith("```"):
+                content = content[:-3]
+            data = json.loads(content.strip())
+            return clean_profile(data) if isinstance(data, dict) else {}
+        except Exception as e:
+            logger.error(f"AI onboarding extraction failed: {e}")
+            return {}
+    
     def _handle_error(self, state: ConversationState) -> ConversationState:
         """Handle errors"""
         state["response"] = "I'm not sure how to help with that. Try saying something like 'I had an apple' or 'show me today's meals'."
@@ -5,7 +5,9 @@ Router Agent - Determines user intent and routes to appropriate agent
 import re
 import logging
 from typing import Dict, List, Any, Optional
+from ..config import get_settings
 from ..services.ai_service import get_ai_service
+from .food_parser import get_food_parser_agent
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +39,8 @@ class RouterAgent:
 
     def __init__(self):
         self.ai_service = get_ai_service()
+        self.food_parser = get_food_parser_agent()
+        self.combined_parse = get_settings().combined_intent_parse
 
     def route(self, message: str, user_context: Optional[Dict[str, Any]] = None,
               history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
@@ -51,13 +55,25 @@ class RouterAgent:
             logger.info(f"Keyword-matched intent: {keyword_intent} (skipped Gemini)")
             return {"intent": keyword_intent, "confidence": "high", "data": {}}
 
-        intent_result = self.ai_service.detect_intent(message, history=history)
+        # Plain food lists ("2 eggs and toast") are recognised without any Gemini call
+        parsed = self.food_parser.parse_locally(message, history)
+        if parsed is not None:
+            return {"intent": "log_food", "confidence": parsed["confidence"], "data": {}, "parsed": parsed}
+
+        if self.combined_parse:
+            # One call answers both "what is this?" and, for food logs, "which foods?"
+            intent_result = self.food_parser.parse_with_intent(message, user_context, history=history)
+        else:
+            intent_result = self.ai_service.detect_intent(message, history=history)
         intent = intent_result.get("intent", "other")
         confidence = intent_result.get("confidence", "low")
         entities = intent_result.get("entities", {})
         logger.info(f"Gemini-detected intent: {intent} (confidence: {confidence})")
 
-        return {"intent": intent, "confidence": confidence, "data": entities}
+        routing = {"intent": intent, "confidence": confidence, "data": entities}
+        if intent == "log_food" and "foods" in intent_result:
+            routing["parsed"] = intent_result
+        return routing
 
     def _match_by_keywords(self, message: str, intent_map: Dict[str, list]) -> Optional[str]:
         """Try to match message to an intent using keyword lists. Returns None if no match."""
@@ -8,7 +8,7 @@ from datetime import datetime, date, timedelta
 from sqlalchemy import and_
 
 from ..database.database import get_db_session
-from ..database.models import User, FoodLog, MealType, ConversationMessage
+from ..database.models import User, FoodLog, MealType, ActivityLevel, ConversationMessage
 
 logger = logging.getLogger(__name__)
 
@@ -67,6 +67,9 @@ class StorageAgent:
                 raise ValueError(f"User not found: {slack_user_id}")
             
             for key, value in updates.items():
+                # Convert activity_level string to enum (the column stores enum names)
+                if key == "activity_level" and isinstance(value, str):
+                    value = ActivityLevel[value.upper()]
                 if hasattr(user, key):
                     setattr(user, key, value)
             
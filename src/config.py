@@ -3,7 +3,7 @@ Configuration Module - Manages environment variables and application settings
 """
 
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
 
@@ -13,7 +13,36 @@ class Settings(BaseSettings):
     
     # Google Gemini Configuration
     google_api_key: str = Field(..., description="Google API key for Gemini")
-    gemini_model: str = Field(default="gemini-1.5-flash", description="Gemini model to use")
+    gemini_model: str = Field(
+        default="gemini-1.5-flash",
+        description="Gemini model to use (the strong tier for complex messages and escalations when gemini_fast_model is set)"
+    )
+    gemini_fast_model: Optional[str] = Field(
+        default=None,
+        description="Opt-in smaller, cheaper model for intents and short messages (e.g. gemini-2.5-flash-lite, with "
+                    "gemini_model set to a larger one such as gemini-2.5-flash); unset sends everything to gemini_model"
+    )
+    gemini_prices_per_mtok: Dict[str, List[float]] = Field(
+        default_factory=dict,
+        description="USD per million [input, output] tokens by model, added to or overriding the built-in list prices "
+                    "used for the estimated per-tier cost"
+    )
+    gemini_fast_max_chars: int = Field(default=80, description="Longest food message sent to the fast model")
+    gemini_fast_max_items: int = Field(default=2, description="Most food items in a message sent to the fast model")
+    gemini_max_concurrency: int = Field(default=4, description="Max Gemini calls in flight per process")
+    gemini_requests_per_minute: int = Field(
+        default=15,
+        description="Max Gemini calls started per rolling minute; extra calls queue rather than fail"
+    )
+    combined_intent_parse: bool = Field(
+        default=True,
+        description="When keywords can't route a message, detect intent and parse foods in one Gemini call"
+    )
+    prompt_history_max_tokens: int = Field(
+        default=120,
+        description="Token budget for conversation history in a prompt (only sent for messages that refer back to it)"
+    )
+    prompt_history_recent_turns: int = Field(default=2, description="History turns kept verbatim; older user turns are summarized")
     
     # USDA Configuration
     usda_api_key: Optional[str] = Field(default=None, description="USDA FoodData Central API key (optional)")
@@ -21,6 +50,64 @@ class Settings(BaseSettings):
         default="https://api.nal.usda.gov/fdc/v1",
         description="USDA API base URL"
     )
+    usda_max_connections: int = Field(default=20, description="Max open connections in the USDA HTTP pool")
+    usda_max_keepalive_connections: int = Field(default=10, description="Max idle keep-alive connections kept in the USDA pool")
+    usda_keepalive_expiry: float = Field(default=30.0, description="Seconds an idle USDA connection is kept alive")
+    usda_connect_timeout: float = Field(default=3.0, description="USDA connect timeout in seconds")
+    usda_read_timeout: float = Field(default=10.0, description="USDA read timeout in seconds")
+    usda_http2: bool = Field(default=False, description="Use HTTP/2 for USDA requests (requires the 'h2' package)")
+    usda_hourly_quota: int = Field(default=1000, description="USDA API key requests per rolling hour (1000 for a standard key)")
+    usda_quota_wait: float = Field(default=10.0, description="Max seconds a USDA request queues for quota before giving up")
+    usda_max_retries: int = Field(default=3, description="Retries for USDA timeouts, 429s and 5xx responses")
+    usda_retry_base_delay: float = Field(default=0.5, description="First retry backoff in seconds (doubles per attempt, jittered)")
+    usda_retry_max_delay: float = Field(default=8.0, description="Cap on a single USDA retry backoff or Retry-After wait in seconds")
+    usda_breaker_failure_rate: float = Field(default=0.5, description="Share of failed or slow USDA calls that opens the circuit breaker")
+    usda_breaker_min_calls: int = Field(default=5, description="Calls in the window before the breaker can open")
+    usda_breaker_window: int = Field(default=20, description="Recent USDA calls the breaker looks at")
+    usda_breaker_slow_call: float = Field(default=3.0, description="Seconds after which a USDA call counts as slow")
+    usda_breaker_reset_timeout: float = Field(default=30.0, description="Seconds the breaker stays open before a probe call")
+    usda_hedge_enabled: bool = Field(default=True, description="Send a second USDA GET when the first is slower than the hedge percentile")
+    usda_hedge_percentile: float = Field(default=95.0, description="Latency percentile after which a hedged request is sent")
+    usda_hedge_min_delay: float = Field(default=0.2, description="Never hedge earlier than this many seconds")
+    fdc_index_path: Optional[str] = Field(
+        default="data/fdc_index.sqlite",
+        description="Local FoodData Central index (built with `python -m src.services.fdc_index import`); used before the REST API when present"
+    )
+    nutrient_table_path: Optional[str] = Field(
+        default="data/nutrient_table.bin",
+        description="Shared memory-mapped nutrient table (built with `python -m src.services.nutrient_table build`); mapped read-only by every worker when present"
+    )
+    usda_l1_cache_size: int = Field(default=1000, description="Max entries in the in-memory USDA cache (0 disables it)")
+    usda_l1_cache_ttl: float = Field(default=3600.0, description="Seconds an in-memory USDA cache entry stays valid")
+    usda_cache_max_staleness: float = Field(
+        default=30 * 24 * 3600.0,
+        description="Seconds past the 24h TTL a cached USDA entry may still be served while it is refreshed"
+    )
+    usda_refresh_queue_size: int = Field(default=100, description="Max pending background refreshes of stale USDA entries")
+    usda_cache_max_rows: int = Field(default=50000, description="Row cap for nutrition_cache; least recently used rows are evicted")
+    usda_cache_sweep_interval: float = Field(default=3600.0, description="Seconds between nutrition_cache sweeps (0 disables)")
+    usda_cache_sweep_batch_size: int = Field(default=1000, description="Rows deleted per batch during a cache sweep")
+    usda_negative_cache_ttl: float = Field(default=6 * 3600.0, description="Seconds a 'USDA has no match' entry stays cached")
+    
+    # Cache Warm-up Configuration
+    cache_warmup_enabled: bool = Field(default=True, description="Warm the USDA cache from recent food logs at startup")
+    cache_warmup_top_n: int = Field(default=200, description="Number of most frequently logged foods to pre-fetch")
+    cache_warmup_days: int = Field(default=30, description="How many days of food logs to scan for warm-up")
+    cache_warmup_rate: float = Field(default=1.0, description="Max USDA requests per second during warm-up")
+    
+    # Nutrition Lookup Configuration
+    nutrition_lookup_workers: int = Field(default=8, description="Max concurrent per-item nutrition lookups")
+    nutrition_lookup_deadline: float = Field(default=20.0, description="Seconds allowed to resolve all items in one message")
+    
+    # Food Parse Cache Configuration
+    parse_cache_enabled: bool = Field(default=True, description="Reuse Gemini parse results for repeated food messages")
+    parse_cache_size: int = Field(default=2000, description="Max parse results kept in memory")
+    parse_cache_ttl: float = Field(default=7 * 24 * 3600.0, description="Seconds a cached parse result stays valid")
+    rule_parser_enabled: bool = Field(default=True, description="Parse simple food messages locally before asking Gemini")
+    rule_parser_min_confidence: float = Field(
+        default=0.9,
+        description="Minimum confidence (0-1) for a local parse to be used instead of Gemini"
+    )
     
     # Slack Configuration
     slack_bot_token: str = Field(..., description="Slack Bot User OAuth Token")
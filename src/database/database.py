@@ -5,7 +5,7 @@ Database Module - Database connection and session management
 import logging
 from contextlib import contextmanager
 from typing import Generator
-from sqlalchemy import create_engine, event
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.pool import StaticPool
 
@@ -55,12 +55,37 @@ def init_db() -> None:
     # Create all tables
     try:
         Base.metadata.create_all(bind=engine)
+        _add_missing_columns()
         logger.info("[OK] Database tables created successfully")
     except Exception as e:
         logger.error(f"[FAIL] Error creating database tables: {e}")
         raise
 
 
+def _add_missing_columns() -> None:
+    """Add model columns that are missing from existing tables (nullable, additive only).
+
+    create_all() only creates missing tables, so columns added to a model later
+    would otherwise never reach databases created by an older version.
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {col["name"] for col in inspector.get_columns(table.name)}
+        missing = [col for col in table.columns if col.name not in existing]
+        if not missing:
+            continue
+        with engine.begin() as conn:
+            for col in missing:
+                col_type = col.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+                logger.info(f"Added missing column {table.name}.{col.name}")
+        for index in table.indexes:
+            if any(col.name in index.columns for col in missing):
+                index.create(bind=engine, checkfirst=True)
+
+
 @contextmanager
 def get_db_session() -> Generator[Session, None, None]:
     """Context manager for database sessions with auto-commit/rollback."""
@@ -82,7 +107,6 @@ def get_db_session() -> Generator[Session, None, None]:
 def check_db_connection() -> bool:
     """Check if database connection is working."""
     try:
-        from sqlalchemy import text
         with get_db_session() as db:
             db.execute(text("SELECT 1"))
         return True
@@ -11,6 +11,7 @@ from sqlalchemy import (
     Float,
     DateTime,
     JSON,
+    LargeBinary,
     ForeignKey,
     Enum as SQLEnum,
     Text,
@@ -243,4 +244,6 @@ class NutritionCache(Base):
     id = Column(Integer, primary_key=True)
     cache_key = Column(String(255), unique=True, nullable=False, index=True)
     data = Column(JSON, nullable=False)
+    packed = Column(LargeBinary, nullable=True)  # nutrition_codec bytes for food records (data is then JSON null)
     created_at = Column(DateTime, default=datetime.utcnow)
+    last_accessed_at = Column(DateTime, default=datetime.utcnow, index=True)  # drives LRU eviction
@@ -10,6 +10,8 @@ from slack_bolt.adapter.socket_mode import SocketModeHandler
 from .config import get_settings, validate_settings
 from .database.database import init_db, check_db_connection
 from .agents.orchestrator import get_orchestrator
+from .services.usda_service import get_usda_service, close_usda_service
+from .services.cache_warmer import start_cache_warmup
 
 # Configure logging
 logging.basicConfig(
@@ -54,6 +56,10 @@ def create_app() -> tuple[App, SocketModeHandler]:
         logger.error(f"[FAIL] Database initialization failed: {e}")
         sys.exit(1)
     
+    # Keep the nutrition cache table bounded, and pre-fetch popular foods in the background
+    get_usda_service().start_cache_sweeper()
+    start_cache_warmup()
+    
     # Initialize Slack app
     logger.info("Initializing Slack app...")
     app = App(token=settings.slack_bot_token)
@@ -213,6 +219,8 @@ def main():
     except Exception as e:
         logger.error(f"[FAIL] Fatal error: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        close_usda_service()
 
 
 if __name__ == "__main__":
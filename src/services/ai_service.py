@@ -4,38 +4,229 @@ AI Service - Wrapper for Google Gemini API interactions
 
 import json
 import logging
-from typing import Dict, List, Optional, Any
+import time
+from typing import Callable, Dict, List, Optional, Any
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
 from ..config import get_settings
+from ..utils.prompt_budget import TokenUsage, estimate_tokens, history_for_prompt, legacy_history_tokens, message_tokens
+from ..utils.request_governor import RequestGovernor
+from ..utils.rule_parser import count_items
 
 logger = logging.getLogger(__name__)
 
+INTENT_DESCRIPTIONS = """- log_food: Logging food they ate (e.g., "I had pizza", "Ate an apple")
+- query_history: Asking about past meals (e.g., "What did I eat yesterday?")
+- query_today: Asking about today's progress (e.g., "How many calories today?")
+- query_goal: Asking about their goal (e.g., "What's my goal?")
+- update_food: Wants to correct previous entry (e.g., "Actually that was 3 eggs")
+- delete_food: Wants to remove entry (e.g., "Delete my last meal")
+- general_question: General nutrition question (e.g., "How many calories in an apple?")
+- greeting: Greeting or casual chat (e.g., "Hi", "Hello")
+- help: Asking for help (e.g., "How does this work?")
+- other: Unclear or doesn't fit above"""
+
+KNOWN_INTENTS = {line[2:].split(":")[0] for line in INTENT_DESCRIPTIONS.splitlines()}
+
+FOOD_UNIT_GUIDELINES = """IMPORTANT unit guidelines:
+- Use standard units: "serving", "small", "medium", "large", "cup", "piece", "slice", "g", "oz"
+- For fruits/vegetables: "small", "medium", or "large" (e.g., 1 medium apple)
+- For countable items: "piece" or specific names (e.g., 2 pieces)
+- For meals/dishes: "serving" (e.g., 1 serving nachos, 1 serving pasta)
+- For drinks: "cup" or "glass"
+- NEVER use the food name as the unit (wrong: unit="nacho", correct: unit="serving" or "piece")
+
+Examples:
+- "I had an apple" -> quantity: 1, unit: "medium"
+- "2 eggs" -> quantity: 2, unit: "large"
+- "a handful of almonds" -> quantity: 1, unit: "handful"
+- "chicken breast" -> quantity: 1, unit: "medium"
+- "10 nachos" -> quantity: 10, unit: "piece"
+- "a protein bar" -> quantity: 1, unit: "bar"
+- "some nachos" -> quantity: 1, unit: "serving"
+"""
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+# Calls that are short classification or chat, never worth the strong model up front
+FAST_INTENTS = {"detect_intent", "response"}
+
+# Published list prices, USD per million (input, output) tokens, for the per-tier cost
+# estimate only; GEMINI_PRICES_PER_MTOK overrides them or adds other models
+MODEL_PRICES_PER_MTOK = {
+    "gemini-1.5-flash-8b": (0.0375, 0.15),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-pro": (1.25, 10.00),
+}
+
 
 class AIService:
     """Service for interacting with Google Gemini API."""
 
     def __init__(self):
         settings = get_settings()
-        self.chat_model = ChatGoogleGenerativeAI(
-            model=settings.gemini_model,
+        self.chat_model = self._create_model(settings.gemini_model)
+        # Fast tier: classification and short messages; None sends everything to chat_model
+        self.fast_chat_model = None
+        self.tier_models = {STRONG_TIER: settings.gemini_model, FAST_TIER: settings.gemini_model}
+        if settings.gemini_fast_model and settings.gemini_fast_model != settings.gemini_model:
+            self.fast_chat_model = self._create_model(settings.gemini_fast_model)
+            self.tier_models[FAST_TIER] = settings.gemini_fast_model
+        self.model_prices = {**MODEL_PRICES_PER_MTOK, **{
+            model: tuple(prices) for model, prices in settings.gemini_prices_per_mtok.items()
+        }}
+        self.fast_max_chars = settings.gemini_fast_max_chars
+        self.fast_max_items = settings.gemini_fast_max_items
+        # One per process (this service is a singleton): every Gemini call, sync or async, queues here
+        self.governor = RequestGovernor(settings.gemini_max_concurrency, settings.gemini_requests_per_minute)
+        self.history_max_tokens = settings.prompt_history_max_tokens
+        self.history_recent_turns = settings.prompt_history_recent_turns
+        self.usage = TokenUsage()
+        self.tier_usage = TokenUsage()
+
+    @staticmethod
+    def _create_model(model: str) -> ChatGoogleGenerativeAI:
+        settings = get_settings()
+        return ChatGoogleGenerativeAI(
+            model=model,
             google_api_key=settings.google_api_key,
             temperature=0.3,
             convert_system_message_to_human=True,
             response_mime_type="application/json"
         )
 
+    def _model(self, tier: str) -> Any:
+        if tier == FAST_TIER and self.fast_chat_model is not None:
+            return self.fast_chat_model
+        return self.chat_model
+
+    def invoke(self, messages: Any, intent: str = "other", tier: str = STRONG_TIER) -> Any:
+        """The `tier` model's invoke, once the governor has a slot free (waits rather than failing).
+
+        `intent` labels the call in the per-intent token stats.
+        """
+        with self.governor.slot() as waited:
+            self._log_wait(waited)
+            start = time.monotonic()
+            response = self._model(tier).invoke(messages)
+        self._record_usage(intent, tier, messages, response, time.monotonic() - start)
+        return response
+
+    async def ainvoke(self, messages: Any, intent: str = "other", tier: str = STRONG_TIER) -> Any:
+        """The `tier` model's ainvoke, awaiting a governor slot without blocking the event loop."""
+        async with self.governor.slot_async() as waited:
+            self._log_wait(waited)
+            start = time.monotonic()
+            response = await self._model(tier).ainvoke(messages)
+        self._record_usage(intent, tier, messages, response, time.monotonic() - start)
+        return response
+
+    def _record_usage(self, intent: str, tier: str, messages: Any, response: Any, seconds: float) -> None:
+        """Count the call's tokens, preferring the API's own counts when the response has them."""
+        if self.fast_chat_model is None:
+            tier = STRONG_TIER
+        reported = getattr(response, "usage_metadata", None) or {}
+        prompt_tokens = reported.get("input_tokens") or message_tokens(messages)
+        output_tokens = reported.get("output_tokens") or estimate_tokens(str(getattr(response, "content", "")))
+        self.usage.record_call(intent, prompt_tokens, output_tokens, seconds)
+        self.tier_usage.record_call(tier, prompt_tokens, output_tokens, seconds)
+        logger.debug(
+            f"Gemini {intent} ({self.tier_models[tier]}): {prompt_tokens} prompt tokens, "
+            f"{output_tokens} output tokens, {seconds:.2f}s"
+        )
+
+    def _tier_for(self, intent: str, message: str) -> str:
+        """Fast model for classification and short, few-item messages; strong model otherwise."""
+        if self.fast_chat_model is None:
+            return STRONG_TIER
+        if intent in FAST_INTENTS:
+            return FAST_TIER
+        if len(message) <= self.fast_max_chars and count_items(message) <= self.fast_max_items:
+            return FAST_TIER
+        return STRONG_TIER
+
+    def _escalate(self, intent: str, reason: str) -> None:
+        self.usage.record_escalation(intent)
+        logger.info(f"Escalating {intent} from {self.tier_models[FAST_TIER]} to {self.tier_models[STRONG_TIER]}: {reason}")
+
+    def _invoke_tiered(self, messages: List[BaseMessage], intent: str, tier: str,
+                       read: Callable[[str], Dict[str, Any]], valid: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        """Ask the `tier` model; if the fast model errors or its answer fails `valid`, ask the strong one.
+
+        `read` turns the response text into a result dict.
+        """
+        if tier == FAST_TIER:
+            try:
+                result = read(self.invoke(messages, intent=intent, tier=FAST_TIER).content)
+                if valid(result):
+                    return result
+                self._escalate(intent, "answer failed validation")
+            except Exception as e:
+                self._escalate(intent, f"error: {e}")
+        return read(self.invoke(messages, intent=intent, tier=STRONG_TIER).content)
+
+    async def _ainvoke_tiered(self, messages: List[BaseMessage], intent: str, tier: str,
+                              read: Callable[[str], Dict[str, Any]], valid: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+        """Async _invoke_tiered()."""
+        if tier == FAST_TIER:
+            try:
+                result = read((await self.ainvoke(messages, intent=intent, tier=FAST_TIER)).content)
+                if valid(result):
+                    return result
+                self._escalate(intent, "answer failed validation")
+            except Exception as e:
+                self._escalate(intent, f"error: {e}")
+        return read((await self.ainvoke(messages, intent=intent, tier=STRONG_TIER)).content)
+
     @staticmethod
-    def _format_history(history: Optional[List[Dict[str, str]]]) -> str:
-        """Turn a list of {role, content} dicts into a text block for prompt injection."""
-        if not history:
-            return ""
-        lines = ["Recent conversation:"]
-        for msg in history:
-            prefix = "User" if msg["role"] == "user" else "Bot"
-            lines.append(f"  {prefix}: {msg['content'][:200]}")
-        return "\n".join(lines)
+    def _valid_foods(result: Dict[str, Any]) -> bool:
+        """A confident parse with at least one named food and a positive numeric quantity each."""
+        foods = result.get("foods")
+        if not isinstance(foods, list) or not foods or result.get("confidence") == "low":
+            return False
+        for food in foods:
+            if not isinstance(food, dict) or not str(food.get("name") or "").strip():
+                return False
+            quantity = food.get("quantity")
+            if isinstance(quantity, bool) or not isinstance(quantity, (int, float)) or quantity <= 0:
+                return False
+        return True
+
+    @staticmethod
+    def _valid_intent(result: Dict[str, Any]) -> bool:
+        return result.get("intent") in KNOWN_INTENTS and result.get("confidence") != "low"
+
+    @staticmethod
+    def _log_wait(waited: float) -> None:
+        if waited >= 0.5:
+            logger.info(f"Waited {waited:.2f}s in the Gemini request queue")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Governor load (calls in flight, queue waits), token usage per intent and per model tier, with an estimated cost."""
+        tiers = self.tier_usage.stats()
+        for tier, entry in tiers.items():
+            entry["model"] = self.tier_models[tier]
+            prices = self.model_prices.get(self.tier_models[tier])
+            entry["estimated_cost_usd"] = round(
+                (entry["prompt_tokens"] * prices[0] + entry["output_tokens"] * prices[1]) / 1_000_000, 6
+            ) if prices else None
+        return {"governor": self.governor.stats(), "tokens": self.usage.stats(), "tiers": tiers}
+
+    def _format_history(self, message: str, history: Optional[List[Dict[str, str]]], intent: str) -> str:
+        """History block for a prompt about `message` ("" unless the message refers back to it).
+
+        Bot formatting is stripped and older turns are summarized to fit the token budget.
+        """
+        history_text = history_for_prompt(message, history, self.history_max_tokens, self.history_recent_turns)
+        self.usage.record_history(intent, estimate_tokens(history_text), legacy_history_tokens(history))
+        return history_text
 
     def _clean_json_response(self, content: str) -> str:
         """Strip markdown fences from AI response."""
@@ -51,6 +242,25 @@ class AIService:
     def parse_food_message(self, message: str, context: Optional[str] = None,
                            history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
         """Parse a natural language food message into structured data."""
+        messages = self._food_parse_messages(message, context, history)
+        try:
+            return self._invoke_tiered(messages, "parse_food", self._tier_for("parse_food", message),
+                                       self._food_parse_result, self._valid_foods)
+        except Exception as e:
+            return self._food_parse_failed(e)
+
+    async def aparse_food_message(self, message: str, context: Optional[str] = None,
+                                  history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Async parse_food_message()."""
+        messages = self._food_parse_messages(message, context, history)
+        try:
+            return await self._ainvoke_tiered(messages, "parse_food", self._tier_for("parse_food", message),
+                                              self._food_parse_result, self._valid_foods)
+        except Exception as e:
+            return self._food_parse_failed(e)
+
+    def _food_parse_messages(self, message: str, context: Optional[str],
+                             history: Optional[List[Dict[str, str]]]) -> List[BaseMessage]:
         system_prompt = """You are a nutrition assistant that extracts food items from natural language.
 
 Extract all food items mentioned with their quantities and units. Be smart about inferring:
@@ -74,73 +284,68 @@ Return a JSON object with this structure:
     "clarifications_needed": ["list of questions if ambiguous"]
 }
 
-IMPORTANT unit guidelines:
-- Use standard units: "serving", "small", "medium", "large", "cup", "piece", "slice", "g", "oz"
-- For fruits/vegetables: "small", "medium", or "large" (e.g., 1 medium apple)
-- For countable items: "piece" or specific names (e.g., 2 pieces)
-- For meals/dishes: "serving" (e.g., 1 serving nachos, 1 serving pasta)
-- For drinks: "cup" or "glass"
-- NEVER use the food name as the unit (wrong: unit="nacho", correct: unit="serving" or "piece")
-
-Examples:
-- "I had an apple" -> quantity: 1, unit: "medium"
-- "2 eggs" -> quantity: 2, unit: "large"
-- "a handful of almonds" -> quantity: 1, unit: "handful"
-- "chicken breast" -> quantity: 1, unit: "medium"
-- "10 nachos" -> quantity: 10, unit: "piece"
-- "a protein bar" -> quantity: 1, unit: "bar"
-- "some nachos" -> quantity: 1, unit: "serving"
-
+""" + FOOD_UNIT_GUIDELINES + """
 Be concise but accurate. If unsure about quantity, default to 1 serving."""
 
-        history_text = self._format_history(history)
+        history_text = self._format_history(message, history, "parse_food")
         user_prompt = f"Parse this food message: {message}"
         if context:
             user_prompt += f"\n\nContext: {context}"
         if history_text:
             user_prompt += f"\n\n{history_text}"
+        user_prompt += "\n\nIMPORTANT: Respond ONLY with valid JSON, no other text."
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
 
+    def _food_parse_result(self, content: str) -> Dict[str, Any]:
         try:
-            user_prompt += "\n\nIMPORTANT: Respond ONLY with valid JSON, no other text."
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ]
-            response = self.chat_model.invoke(messages)
-            content = self._clean_json_response(response.content)
-            result = json.loads(content)
-            logger.info(f"Parsed food message: {len(result.get('foods', []))} items")
-            return result
-
+            result = json.loads(self._clean_json_response(content))
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse AI response as JSON: {e}")
             return {
                 "foods": [], "confidence": "low", "meal_type": "other",
                 "clarifications_needed": ["Could not understand the food description. Please try again."]
             }
-        except Exception as e:
-            logger.error(f"Error calling Gemini API: {e}")
-            return {
-                "foods": [], "confidence": "low", "meal_type": "other",
-                "clarifications_needed": ["An error occurred. Please try again."]
-            }
+        if not isinstance(result, dict):
+            return self._food_parse_failed(TypeError(f"AI returned non-dict result: {type(result)}"))
+        logger.info(f"Parsed food message: {len(result.get('foods', []))} items")
+        return result
+
+    @staticmethod
+    def _food_parse_failed(error: Exception) -> Dict[str, Any]:
+        logger.error(f"Error calling Gemini API: {error}")
+        return {
+            "foods": [], "confidence": "low", "meal_type": "other",
+            "clarifications_needed": ["An error occurred. Please try again."]
+        }
 
     def detect_intent(self, message: str,
                        history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
         """Classify user message into an intent (log_food, query_today, greeting, etc.)."""
+        messages = self._intent_messages(message, history)
+        try:
+            return self._invoke_tiered(messages, "detect_intent", self._tier_for("detect_intent", message),
+                                       self._intent_result, self._valid_intent)
+        except Exception as e:
+            return self._intent_failed(e)
+
+    async def adetect_intent(self, message: str,
+                             history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Async detect_intent()."""
+        messages = self._intent_messages(message, history)
+        try:
+            return await self._ainvoke_tiered(messages, "detect_intent", self._tier_for("detect_intent", message),
+                                              self._intent_result, self._valid_intent)
+        except Exception as e:
+            return self._intent_failed(e)
+
+    def _intent_messages(self, message: str, history: Optional[List[Dict[str, str]]]) -> List[BaseMessage]:
         system_prompt = """You are an intent classifier for a calorie tracking bot.
 
 Classify the user's message into one of these intents:
-- log_food: Logging food they ate (e.g., "I had pizza", "Ate an apple")
-- query_history: Asking about past meals (e.g., "What did I eat yesterday?")
-- query_today: Asking about today's progress (e.g., "How many calories today?")
-- query_goal: Asking about their goal (e.g., "What's my goal?")
-- update_food: Wants to correct previous entry (e.g., "Actually that was 3 eggs")
-- delete_food: Wants to remove entry (e.g., "Delete my last meal")
-- general_question: General nutrition question (e.g., "How many calories in an apple?")
-- greeting: Greeting or casual chat (e.g., "Hi", "Hello")
-- help: Asking for help (e.g., "How does this work?")
-- other: Unclear or doesn't fit above
+""" + INTENT_DESCRIPTIONS + """
 
 Return JSON:
 {
@@ -149,47 +354,140 @@ Return JSON:
     "entities": {"key": "value"}
 }"""
 
+        history_text = self._format_history(message, history, "detect_intent")
+        history_block = f"\n\n{history_text}" if history_text else ""
+        user_prompt = f"Classify this message: {message}{history_block}\n\nIMPORTANT: Respond ONLY with valid JSON, no other text."
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
+
+    def _intent_result(self, content: str) -> Dict[str, Any]:
+        try:
+            result = json.loads(self._clean_json_response(content))
+        except Exception as e:
+            return self._intent_failed(e)
+
+        if not isinstance(result, dict):
+            logger.warning(f"AI returned non-dict result: {type(result)}")
+            return {"intent": "other", "confidence": "low", "entities": {}}
+
+        logger.info(f"Detected intent: {result.get('intent')} (confidence: {result.get('confidence')})")
+        return result
+
+    @staticmethod
+    def _intent_failed(error: Exception) -> Dict[str, Any]:
+        logger.error(f"Error detecting intent: {error}")
+        return {"intent": "other", "confidence": "low", "entities": {}}
+
+    def detect_intent_and_parse(self, message: str, context: Optional[str] = None,
+                                history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
+        """Classify the message and, if it logs food, extract the food items in the same call.
+
+        Returns the detect_intent fields plus the parse_food_message fields
+        ("foods" is empty unless the intent is log_food).
+        """
+        system_prompt = """You are the message understanding step of a calorie tracking bot.
+
+First classify the user's message into one of these intents:
+""" + INTENT_DESCRIPTIONS + """
+
+If (and only if) the intent is log_food, also extract all food items mentioned with
+their quantities and units, inferring standard serving sizes, common portions and the
+meal type from context. For any other intent leave "foods" empty.
+
+Return JSON:
+{
+    "intent": "intent_name",
+    "confidence": "high/medium/low",
+    "entities": {"key": "value"},
+    "foods": [
+        {
+            "name": "food name (lowercase, descriptive)",
+            "quantity": numeric quantity,
+            "unit": "serving unit (e.g., large, medium, small, slice, cup, grams)",
+            "meal_type": "breakfast/lunch/dinner/snack",
+            "notes": "any preparation method or additional details"
+        }
+    ],
+    "meal_type": "overall meal type if determinable",
+    "clarifications_needed": ["list of questions if ambiguous"]
+}
+
+""" + FOOD_UNIT_GUIDELINES + """
+Be concise but accurate. If unsure about quantity, default to 1 serving."""
+
+        history_text = self._format_history(message, history, "intent_and_parse")
+        user_prompt = f"Classify this message and parse any food in it: {message}"
+        if context:
+            user_prompt += f"\n\nContext: {context}"
+        if history_text:
+            user_prompt += f"\n\n{history_text}"
+        user_prompt += "\n\nIMPORTANT: Respond ONLY with valid JSON, no other text."
+
         try:
-            history_text = self._format_history(history)
-            history_block = f"\n\n{history_text}" if history_text else ""
-            user_prompt = f"Classify this message: {message}{history_block}\n\nIMPORTANT: Respond ONLY with valid JSON, no other text."
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
-            response = self.chat_model.invoke(messages)
-            content = self._clean_json_response(response.content)
-            result = json.loads(content)
+            return self._invoke_tiered(messages, "intent_and_parse", self._tier_for("intent_and_parse", message),
+                                       self._combined_result, self._valid_combined)
+        except Exception as e:
+            logger.error(f"Error detecting intent and parsing: {e}")
+            return {"intent": "other", "confidence": "low", "entities": {}, "foods": []}
 
-            if not isinstance(result, dict):
-                logger.warning(f"AI returned non-dict result: {type(result)}")
-                return {"intent": "other", "confidence": "low", "entities": {}}
+    def _combined_result(self, content: str) -> Dict[str, Any]:
+        try:
+            result = json.loads(self._clean_json_response(content))
+        except json.JSONDecodeError as e:
+            logger.error(f"Failed to parse AI response as JSON: {e}")
+            return {"intent": "other", "confidence": "low", "entities": {}, "foods": []}
+        if not isinstance(result, dict):
+            logger.warning(f"AI returned non-dict result: {type(result)}")
+            return {"intent": "other", "confidence": "low", "entities": {}, "foods": []}
 
-            logger.info(f"Detected intent: {result.get('intent')} (confidence: {result.get('confidence')})")
-            return result
+        result.setdefault("entities", {})
+        if result.get("intent") != "log_food" or not isinstance(result.get("foods"), list):
+            result["foods"] = []
+        logger.info(
+            f"Detected intent: {result.get('intent')} (confidence: {result.get('confidence')}), "
+            f"parsed {len(result['foods'])} items in the same call"
+        )
+        return result
 
-        except Exception as e:
-            logger.error(f"Error detecting intent: {e}")
-            return {"intent": "other", "confidence": "low", "entities": {}}
+    def _valid_combined(self, result: Dict[str, Any]) -> bool:
+        return self._valid_intent(result) and (result["intent"] != "log_food" or self._valid_foods(result))
 
     def generate_response(self, context: str, data: Dict[str, Any]) -> str:
         """Generate a natural language response based on context and data."""
+        try:
+            return self.invoke(self._response_messages(context, data), intent="response", tier=FAST_TIER).content
+        except Exception as e:
+            return self._response_failed(e)
+
+    async def agenerate_response(self, context: str, data: Dict[str, Any]) -> str:
+        """Async generate_response()."""
+        try:
+            return (await self.ainvoke(self._response_messages(context, data), intent="response", tier=FAST_TIER)).content
+        except Exception as e:
+            return self._response_failed(e)
+
+    @staticmethod
+    def _response_messages(context: str, data: Dict[str, Any]) -> List[BaseMessage]:
         system_prompt = """You are a friendly, supportive nutrition coach assistant.
 Generate a warm, encouraging response based on the context and data provided.
 Keep responses concise (2-3 sentences max). Be supportive and non-judgmental."""
 
         user_prompt = f"Context: {context}\nData: {json.dumps(data)}\n\nGenerate an appropriate response."
+        return [
+            SystemMessage(content=system_prompt),
+            HumanMessage(content=user_prompt)
+        ]
 
-        try:
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=user_prompt)
-            ]
-            response = self.chat_model.invoke(messages)
-            return response.content
-        except Exception as e:
-            logger.error(f"Error generating response: {e}")
-            return "I'm having trouble generating a response right now. Please try again."
+    @staticmethod
+    def _response_failed(error: Exception) -> str:
+        logger.error(f"Error generating response: {error}")
+        return "I'm having trouble generating a response right now. Please try again."
 
 
 _ai_service: Optional[AIService] = None
@@ -0,0 +1,113 @@
+"""
+Cache Warmer - Pre-populates the nutrition cache with the most frequently logged foods
+
+Runs in the background at startup (see main.py), or as a cron job:
+    python -m src.services.cache_warmer
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from ..config import get_settings
+from ..database.database import get_db_session
+from ..database.models import FoodLog
+from ..utils.food_normalizer import food_cache_key
+from .usda_service import LOOKUP_PAGE_SIZE, USDAService, get_usda_service
+
+logger = logging.getLogger(__name__)
+
+
+class CacheWarmer:
+    """Scans recent food logs and warms the USDA cache for the top-N foods."""
+
+    def __init__(self, usda_service: Optional[USDAService] = None):
+        settings = get_settings()
+        self.usda_service = usda_service or get_usda_service()
+        self.top_n = settings.cache_warmup_top_n
+        self.lookback = timedelta(days=settings.cache_warmup_days)
+        self.min_interval = 1.0 / settings.cache_warmup_rate if settings.cache_warmup_rate > 0 else 0.0
+
+    def _top_logged(self) -> Tuple[List[Tuple[str, int]], List[int]]:
+        """One pass over recent food logs: the top-N foods as (name, count), grouped by
+        normalized cache key so "Eggs" and "egg" count together, and the top-N matched FDC IDs."""
+        since = datetime.utcnow() - self.lookback
+        counts: Counter = Counter()
+        names: Dict[str, str] = {}
+        fdc_ids: Counter = Counter()
+
+        with get_db_session() as db:
+            rows = db.query(FoodLog.items).filter(FoodLog.logged_at >= since).yield_per(500)
+            for (items,) in rows:
+                for item in items or []:
+                    if item.get("fdc_id"):
+                        fdc_ids[int(item["fdc_id"])] += 1
+                    name = (item.get("name") or "").strip()
+                    if not name:
+                        continue
+                    key = food_cache_key(name)
+                    counts[key] += 1
+                    names.setdefault(key, name)
+
+        foods = [(names[key], count) for key, count in counts.most_common(self.top_n)]
+        return foods, [fdc_id for fdc_id, _ in fdc_ids.most_common(self.top_n)]
+
+    def warm(self, stop: Optional[threading.Event] = None) -> Dict[str, int]:
+        """Look up each top food, pacing USDA calls to the configured rate. Returns counts."""
+        started = time.monotonic()
+        foods, top_ids = self._top_logged()
+        warmed = already_cached = 0
+
+        for name, _ in foods:
+            if stop is not None and stop.is_set():
+                break
+            if self.usda_service.is_search_cached(name, LOOKUP_PAGE_SIZE):
+                already_cached += 1
+                continue
+            call_started = time.monotonic()
+            self.usda_service.search_foods(name, page_size=LOOKUP_PAGE_SIZE)
+            warmed += 1
+            # Rate limit outbound calls so warm-up never competes with live traffic for quota
+            remaining = self.min_interval - (time.monotonic() - call_started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+        # Food records for matched IDs: one batched request per FOODS_BATCH_SIZE IDs
+        food_ids = [] if stop is not None and stop.is_set() else top_ids
+        if food_ids:
+            self.usda_service.get_foods_by_ids(food_ids)
+
+        logger.info(
+            f"Cache warm-up done in {time.monotonic() - started:.1f}s: "
+            f"{warmed} fetched, {already_cached} already cached (top {len(foods)} foods, {len(food_ids)} food IDs)"
+        )
+        return {"candidates": len(foods), "warmed": warmed, "already_cached": already_cached,
+                "food_ids": len(food_ids)}
+
+
+def start_cache_warmup() -> Optional[threading.Thread]:
+    """Warm the cache on a daemon thread so the bot can start serving immediately."""
+    if not get_settings().cache_warmup_enabled:
+        return None
+
+    def run():
+        try:
+            CacheWarmer().warm()
+        except Exception as e:
+            logger.warning(f"Cache warm-up failed: {e}")
+
+    thread = threading.Thread(target=run, name="usda-cache-warmup", daemon=True)
+    thread.start()
+    logger.info("Cache warm-up started in the background")
+    return thread
+
+
+if __name__ == "__main__":
+    from ..database.database import init_db
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    init_db()
+    CacheWarmer().warm()
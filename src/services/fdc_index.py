@@ -0,0 +1,403 @@
+"""
+FDC Index - Offline FoodData Central index with full-text search (SQLite FTS5)
+
+Built from the public FoodData Central bulk downloads (Foundation, SR Legacy,
+FNDDS) so USDAService can answer searches locally without touching the network.
+
+Build or update the index (JSON dumps or a CSV download directory):
+    python -m src.services.fdc_index import FoodData_Central_foundation_food_json.json \\
+        FoodData_Central_sr_legacy_food_json.json FoodData_Central_survey_food_json.json
+    python -m src.services.fdc_index import ./FoodData_Central_csv_2024-04-18/
+
+Files are streamed item by item, so multi-hundred-MB dumps never sit in memory.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO
+
+from ..utils.match_ranker import rank_matches
+from ..utils.units import parse_food_portions
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = "data/fdc_index.sqlite"
+
+# Nutrient IDs -> our field names (same IDs USDAService._parse_food_item matches on)
+NUTRIENT_FIELDS = {1008: "calories", 1003: "protein", 1005: "carbs", 1004: "fat", 1079: "fiber", 2000: "sugar"}
+
+# Used only when the primary nutrient above is missing (Foundation foods often
+# report Atwater energy instead of 1008, and NLEA total sugars instead of 2000)
+FALLBACK_NUTRIENT_FIELDS = {2047: "calories", 2048: "calories", 1063: "sugar"}
+
+NUTRIENT_COLUMNS = ["calories", "protein", "carbs", "fat", "fiber", "sugar"]
+
+# Any-word matches only count when the ranker rates them this close to the query;
+# "chicken tikka masala" must not settle for plain "Chicken, roasted"
+OR_MATCH_MIN_SCORE = 0.6
+
+# CSV data_type values -> the dataType names the REST API uses
+CSV_DATA_TYPES = {
+    "foundation_food": "Foundation",
+    "sr_legacy_food": "SR Legacy",
+    "survey_fndds_food": "Survey (FNDDS)",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS foods (
+    fdc_id INTEGER PRIMARY KEY,
+    description TEXT NOT NULL,
+    data_type TEXT NOT NULL,
+    calories REAL, protein REAL, carbs REAL, fat REAL, fiber REAL, sugar REAL
+);
+CREATE TABLE IF NOT EXISTS portions (
+    fdc_id INTEGER NOT NULL,
+    unit TEXT NOT NULL,
+    grams REAL NOT NULL,
+    PRIMARY KEY (fdc_id, unit)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS foods_fts USING fts5(
+    description, content='foods', content_rowid='fdc_id', tokenize='porter unicode61'
+);
+"""
+
+_FTS_TOKEN = re.compile(r"[a-z0-9]+")
+_SEPARATORS = re.compile(r"[\s,]*")
+
+_BATCH_SIZE = 5000
+
+
+class FDCIndex:
+    """Read side of the local index. Safe to share between threads (one connection each)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    @classmethod
+    def open_if_present(cls, path: Optional[str]) -> Optional["FDCIndex"]:
+        """Return an index for `path` if the file exists, else None (REST API only)."""
+        if not path or not os.path.exists(path):
+            return None
+        index = cls(path)
+        logger.info(f"Using local FoodData Central index at {path} ({index.count()} foods)")
+        return index
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def count(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Full-text search; all words must match, falling back to any word.
+
+        Any-word results are re-ranked and kept only if they score at least
+        OR_MATCH_MIN_SCORE, so a weak partial match falls through to the API.
+        """
+        tokens = _FTS_TOKEN.findall(query.lower())
+        if not tokens:
+            return []
+        quoted = [f'"{t}"' for t in tokens]
+        results = self._match(" ".join(quoted), limit)
+        if not results and len(tokens) > 1:
+            candidates = self._match(" OR ".join(quoted), limit)
+            results = [food for score, food in rank_matches(query, candidates) if score >= OR_MATCH_MIN_SCORE]
+        return results
+
+    def _match(self, fts_query: str, limit: int) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            """
+            SELECT foods.* FROM foods_fts
+            JOIN foods ON foods.fdc_id = foods_fts.rowid
+            WHERE foods_fts MATCH ?
+            ORDER BY bm25(foods_fts)
+            LIMIT ?
+            """,
+            (fts_query, limit),
+        ).fetchall()
+        return self._with_portions([_row_to_food(row) for row in rows])
+
+    def get(self, fdc_id: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM foods WHERE fdc_id = ?", (fdc_id,)).fetchone()
+        return self._with_portions([_row_to_food(row)])[0] if row else None
+
+    def _with_portions(self, foods: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Attach each food's portion weights ({unit: grams}) from the portions table."""
+        if not foods:
+            return foods
+        by_id = {food["fdc_id"]: food for food in foods}
+        for food in foods:
+            food["portions"] = {}
+        placeholders = ",".join("?" * len(by_id))
+        try:
+            rows = self._conn().execute(
+                f"SELECT fdc_id, unit, grams FROM portions WHERE fdc_id IN ({placeholders})", list(by_id)
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return foods  # index built before portions were imported
+        for row in rows:
+            by_id[row["fdc_id"]]["portions"][row["unit"]] = row["grams"]
+        return foods
+
+
+def _row_to_food(row: sqlite3.Row) -> Dict[str, Any]:
+    """Same shape as USDAService._parse_food_item (per 100g)."""
+    food = {
+        "fdc_id": row["fdc_id"],
+        "description": row["description"],
+        "data_type": row["data_type"],
+        "serving_size": 100,
+        "serving_unit": "g",
+    }
+    for col in NUTRIENT_COLUMNS:
+        if row[col] is not None:
+            food[col] = row[col]
+    return food
+
+
+# Import
+
+def iter_json_array_items(fp: TextIO, chunk_size: int = 1 << 20) -> Iterator[Dict[str, Any]]:
+    """Yield the elements of the first JSON array in a file without loading the whole file.
+
+    The FDC JSON dumps are `{"FoundationFoods": [ {...}, {...} ]}`; only the current
+    chunk and the element being decoded are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    # Find the start of the array
+    while "[" not in buf:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        buf += chunk
+    pos = buf.index("[") + 1
+
+    eof = False
+    while True:
+        pos = _SEPARATORS.match(buf, pos).end()
+        if buf.startswith("]", pos):
+            return
+        if pos < len(buf):
+            try:
+                item, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                yield item
+                continue
+        # Element is incomplete: drop what was consumed and read more
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            if eof or pos >= len(buf):
+                return
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+
+def _nutrients_from_dump(food_nutrients: List[Dict[str, Any]]) -> Dict[str, float]:
+    """Extract our nutrient fields from bulk-dump style foodNutrients entries."""
+    found: Dict[str, float] = {}
+    fallback: Dict[str, float] = {}
+    for entry in food_nutrients or []:
+        nutrient = entry.get("nutrient") or {}
+        nutrient_id = nutrient.get("id") or entry.get("nutrientId")
+        amount = entry.get("amount", entry.get("value"))
+        if amount is None:
+            continue
+        if nutrient_id in NUTRIENT_FIELDS:
+            found[NUTRIENT_FIELDS[nutrient_id]] = round(float(amount), 2)
+        elif nutrient_id in FALLBACK_NUTRIENT_FIELDS:
+            fallback.setdefault(FALLBACK_NUTRIENT_FIELDS[nutrient_id], round(float(amount), 2))
+    for field, value in fallback.items():
+        found.setdefault(field, value)
+    return found
+
+
+def _open_for_write(path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(_SCHEMA)
+    return conn
+
+
+def _insert_foods(conn: sqlite3.Connection, rows: List[tuple]) -> None:
+    conn.executemany(
+        "INSERT OR REPLACE INTO foods (fdc_id, description, data_type, calories, protein, carbs, fat, fiber, sugar) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def _insert_portions(conn: sqlite3.Connection, rows: Iterable[tuple]) -> None:
+    conn.executemany("INSERT OR IGNORE INTO portions (fdc_id, unit, grams) VALUES (?, ?, ?)", rows)
+
+
+def import_json_dump(conn: sqlite3.Connection, path: str) -> int:
+    """Stream one FDC JSON dump into the foods and portions tables. Returns foods written."""
+    written = 0
+    batch: List[tuple] = []
+    portions: List[tuple] = []
+    with open(path, encoding="utf-8") as fp:
+        for food in iter_json_array_items(fp):
+            nutrients = _nutrients_from_dump(food.get("foodNutrients", []))
+            if "calories" not in nutrients:
+                continue
+            batch.append((
+                food["fdcId"], food.get("description", "Unknown"), food.get("dataType", ""),
+                *(nutrients.get(col) for col in NUTRIENT_COLUMNS),
+            ))
+            conn.execute("DELETE FROM portions WHERE fdc_id = ?", (food["fdcId"],))
+            portions.extend((food["fdcId"], unit, grams) for unit, grams in parse_food_portions(food).items())
+            if len(batch) >= _BATCH_SIZE:
+                _insert_foods(conn, batch)
+                _insert_portions(conn, portions)
+                portions = []
+                conn.commit()
+                written += len(batch)
+                batch = []
+    if batch:
+        _insert_foods(conn, batch)
+        _insert_portions(conn, portions)
+        conn.commit()
+        written += len(batch)
+    logger.info(f"Imported {written} foods from {path}")
+    return written
+
+
+def import_csv_dir(conn: sqlite3.Connection, directory: str) -> int:
+    """Stream an FDC CSV download (food.csv + food_nutrient.csv) into the foods table."""
+    nutrient_columns = {**FALLBACK_NUTRIENT_FIELDS, **NUTRIENT_FIELDS}
+    conn.execute("CREATE TEMP TABLE staged_nutrients (fdc_id INTEGER, nutrient_id INTEGER, amount REAL)")
+
+    foods = []
+    with open(os.path.join(directory, "food.csv"), newline="", encoding="utf-8") as fp:
+        for row in csv.DictReader(fp):
+            data_type = CSV_DATA_TYPES.get(row["data_type"])
+            if data_type:
+                foods.append((int(row["fdc_id"]), row["description"], data_type))
+                if len(foods) >= _BATCH_SIZE:
+                    conn.executemany("INSERT OR REPLACE INTO foods (fdc_id, description, data_type) VALUES (?, ?, ?)", foods)
+                    foods = []
+    if foods:
+        conn.executemany("INSERT OR REPLACE INTO foods (fdc_id, description, data_type) VALUES (?, ?, ?)", foods)
+
+    staged = []
+    with open(os.path.join(directory, "food_nutrient.csv"), newline="", encoding="utf-8") as fp:
+        for row in csv.DictReader(fp):
+            nutrient_id = int(row["nutrient_id"])
+            if nutrient_id in nutrient_columns and row["amount"]:
+                staged.append((int(row["fdc_id"]), nutrient_id, float(row["amount"])))
+                if len(staged) >= _BATCH_SIZE:
+                    conn.executemany("INSERT INTO staged_nutrients VALUES (?, ?, ?)", staged)
+                    staged = []
+    if staged:
+        conn.executemany("INSERT INTO staged_nutrients VALUES (?, ?, ?)", staged)
+    conn.execute("CREATE INDEX staged_nutrients_lookup ON staged_nutrients (fdc_id, nutrient_id)")
+
+    # Primary nutrient IDs first, then fallbacks only where the primary is still missing
+    for nutrient_id, column in list(NUTRIENT_FIELDS.items()) + list(FALLBACK_NUTRIENT_FIELDS.items()):
+        conn.execute(
+            f"""
+            UPDATE foods SET {column} = (
+                SELECT ROUND(amount, 2) FROM staged_nutrients s
+                WHERE s.fdc_id = foods.fdc_id AND s.nutrient_id = ?
+            )
+            WHERE {column} IS NULL
+            """,
+            (nutrient_id,),
+        )
+    conn.execute("DROP TABLE staged_nutrients")
+    conn.execute("DELETE FROM foods WHERE calories IS NULL")
+    _import_csv_portions(conn, directory)
+    conn.commit()
+    written = conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+    logger.info(f"Imported CSV download from {directory} ({written} foods in index)")
+    return written
+
+
+def _import_csv_portions(conn: sqlite3.Connection, directory: str) -> None:
+    """Load food_portion.csv (unit names from measure_unit.csv) for foods in the index."""
+    portion_path = os.path.join(directory, "food_portion.csv")
+    if not os.path.exists(portion_path):
+        return
+    unit_names: Dict[str, str] = {}
+    unit_path = os.path.join(directory, "measure_unit.csv")
+    if os.path.exists(unit_path):
+        with open(unit_path, newline="", encoding="utf-8") as fp:
+            unit_names = {row["id"]: row["name"] for row in csv.DictReader(fp)}
+
+    known_ids = {row[0] for row in conn.execute("SELECT fdc_id FROM foods")}
+    replaced = set()
+    rows: List[tuple] = []
+    with open(portion_path, newline="", encoding="utf-8") as fp:
+        for row in csv.DictReader(fp):
+            fdc_id = int(row["fdc_id"])
+            if fdc_id not in known_ids:
+                continue
+            if fdc_id not in replaced:
+                conn.execute("DELETE FROM portions WHERE fdc_id = ?", (fdc_id,))
+                replaced.add(fdc_id)
+            # Same record shape as the JSON dumps so parse_food_portions handles both
+            parsed = parse_food_portions({"foodPortions": [{
+                "gramWeight": row.get("gram_weight"),
+                "amount": row.get("amount") or None,
+                "modifier": row.get("modifier") or "",
+                "portionDescription": row.get("portion_description") or "",
+                "measureUnit": {"name": unit_names.get(row.get("measure_unit_id", ""), "")},
+            }]})
+            rows.extend((fdc_id, unit, grams) for unit, grams in parsed.items())
+            if len(rows) >= _BATCH_SIZE:
+                _insert_portions(conn, rows)
+                rows = []
+    _insert_portions(conn, rows)
+
+
+def build_index(sources: List[str], index_path: str = DEFAULT_INDEX_PATH) -> int:
+    """Import JSON dump files and/or CSV download directories, then rebuild the FTS index."""
+    conn = _open_for_write(index_path)
+    try:
+        for source in sources:
+            if os.path.isdir(source):
+                import_csv_dir(conn, source)
+            else:
+                import_json_dump(conn, source)
+        conn.execute("INSERT INTO foods_fts(foods_fts) VALUES ('rebuild')")
+        conn.commit()
+        total = conn.execute("SELECT COUNT(*) FROM foods").fetchone()[0]
+    finally:
+        conn.close()
+    logger.info(f"FDC index at {index_path} now holds {total} foods")
+    return total
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build the local FoodData Central index")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import FDC JSON dumps or CSV download directories")
+    imp.add_argument("sources", nargs="+")
+    imp.add_argument("--index", default=None, help=f"index file (default: FDC_INDEX_PATH or {DEFAULT_INDEX_PATH})")
+    args = parser.parse_args()
+
+    index_path = args.index or os.environ.get("FDC_INDEX_PATH") or DEFAULT_INDEX_PATH
+    build_index(args.sources, index_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""
+Nutrient Table - Read-only, memory-mapped fdc_id -> nutrients file shared by all worker processes
+
+Every bot process maps the same file, so the OS page cache holds one copy no
+matter how many workers run, and lookups read straight from the mapping
+(binary search, no parsing, no per-process cache to warm).
+
+Build it offline from the nutrition cache and/or the local FDC index, then
+point NUTRIENT_TABLE_PATH at it (workers pick up a rebuilt file on restart):
+    python -m src.services.nutrient_table build --from-cache --from-index data/fdc_index.sqlite
+
+File layout (little-endian):
+    header   4s magic "NTB2", I food count, I name count, I strings offset
+    foods    count x (I fdc_id, 6f calories/protein/carbs/fat/fiber/sugar (NaN = missing),
+             I description offset, I portions offset (NO_PORTIONS = none), B data type code,
+             3x pad), sorted by fdc_id
+    names    name count x (I name offset, I fdc_id), sorted by name
+    strings  H length + UTF-8, addressed by the offsets above; portions are a
+             compact JSON {unit: grams} string
+"""
+
+import argparse
+import json
+import logging
+import math
+import mmap
+import os
+import sqlite3
+import struct
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ..database.database import get_db_session
+from ..database.models import NutritionCache
+from ..utils.food_normalizer import food_cache_key
+from ..utils.match_ranker import best_match
+from ..utils.nutrition_codec import DATA_TYPES, NUTRIENT_FIELDS, decode, unpack
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TABLE_PATH = "data/nutrient_table.bin"
+
+# NTB1 files (no portion weights) are rejected and must be rebuilt
+MAGIC = b"NTB2"
+_HEADER = struct.Struct("<4sIII")
+_FOOD = struct.Struct("<I6fIIB3x")
+_NAME = struct.Struct("<II")
+_LENGTH = struct.Struct("<H")
+
+_DATA_TYPE_CODES = {name: code for code, name in enumerate(DATA_TYPES)}
+
+NO_PORTIONS = 0xFFFFFFFF
+
+
+class NutrientTable:
+    """Zero-copy reader over a nutrient table file. Thread-safe (read-only)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.food_count, self.name_count, self._strings_offset = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path} is not a nutrient table (magic {magic!r})")
+        self._foods_offset = _HEADER.size
+        self._names_offset = self._foods_offset + self.food_count * _FOOD.size
+
+    @classmethod
+    def open_if_present(cls, path: Optional[str]) -> Optional["NutrientTable"]:
+        """Map `path` if it exists and is valid, else None."""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            table = cls(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Ignoring nutrient table at {path}: {e}")
+            return None
+        logger.info(f"Mapped shared nutrient table at {path} ({table.food_count} foods, {table.name_count} names)")
+        return table
+
+    def close(self) -> None:
+        self._mm.close()
+
+    def _string(self, offset: int) -> str:
+        pos = self._strings_offset + offset
+        (length,) = _LENGTH.unpack_from(self._mm, pos)
+        start = pos + _LENGTH.size
+        return self._mm[start:start + length].decode("utf-8")
+
+    def _food_at(self, index: int) -> Tuple[int, ...]:
+        return _FOOD.unpack_from(self._mm, self._foods_offset + index * _FOOD.size)
+
+    def get(self, fdc_id: int) -> Optional[Dict[str, Any]]:
+        """Food record for an FDC ID (same shape as USDAService._parse_food_item), or None."""
+        lo, hi = 0, self.food_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._food_at(mid)[0] < fdc_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.food_count:
+            return None
+        record = self._food_at(lo)
+        if record[0] != fdc_id:
+            return None
+        return self._to_food(record)
+
+    def _to_food(self, record: Tuple[int, ...]) -> Dict[str, Any]:
+        fdc_id, *values, description_offset, portions_offset, type_code = record
+        food: Dict[str, Any] = {
+            "fdc_id": fdc_id,
+            "description": self._string(description_offset),
+            "data_type": DATA_TYPES[type_code] if type_code < len(DATA_TYPES) else "",
+            "serving_size": 100,
+            "serving_unit": "g",
+            "portions": {} if portions_offset == NO_PORTIONS else json.loads(self._string(portions_offset)),
+        }
+        for field, value in zip(NUTRIENT_FIELDS, values):
+            if not math.isnan(value):
+                food[field] = round(value, 2)
+        return food
+
+    def lookup_name(self, name: str) -> Optional[Dict[str, Any]]:
+        """Best known food for a food name (matched on its normalized cache key), or None."""
+        key = food_cache_key(name)
+        lo, hi = 0, self.name_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            name_offset, _ = _NAME.unpack_from(self._mm, self._names_offset + mid * _NAME.size)
+            if self._string(name_offset) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.name_count:
+            return None
+        name_offset, fdc_id = _NAME.unpack_from(self._mm, self._names_offset + lo * _NAME.size)
+        if self._string(name_offset) != key:
+            return None
+        return self.get(fdc_id)
+
+
+# Build
+
+def write_table(foods: Iterable[Dict[str, Any]], names: Dict[str, int], path: str) -> int:
+    """Write foods and a {cache key: fdc_id} name index to `path` atomically. Returns food count."""
+    by_id = {int(food["fdc_id"]): food for food in foods}
+    names = {key: fdc_id for key, fdc_id in names.items() if fdc_id in by_id}
+
+    strings = bytearray()
+    string_offsets: Dict[str, int] = {}
+
+    def intern(text: str) -> int:
+        if text not in string_offsets:
+            encoded = text.encode("utf-8")[:0xFFFF]
+            string_offsets[text] = len(strings)
+            strings.extend(_LENGTH.pack(len(encoded)) + encoded)
+        return string_offsets[text]
+
+    body = bytearray()
+    for fdc_id in sorted(by_id):
+        food = by_id[fdc_id]
+        values = [math.nan if food.get(f) is None else float(food[f]) for f in NUTRIENT_FIELDS]
+        portions = food.get("portions")
+        portions_offset = intern(json.dumps(portions, separators=(",", ":"), sort_keys=True)) if portions else NO_PORTIONS
+        body += _FOOD.pack(fdc_id, *values, intern(str(food.get("description", "Unknown"))), portions_offset,
+                           _DATA_TYPE_CODES.get(food.get("data_type", ""), 0))
+    for key in sorted(names):
+        body += _NAME.pack(intern(key), names[key])
+
+    header = _HEADER.pack(MAGIC, len(by_id), len(names), _HEADER.size + len(body))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write then rename, so processes that already mapped the old file keep a consistent view
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "wb") as fp:
+        fp.write(header)
+        fp.write(body)
+        fp.write(strings)
+    os.replace(tmp_path, path)
+    logger.info(f"Wrote nutrient table {path}: {len(by_id)} foods, {len(names)} names")
+    return len(by_id)
+
+
+def foods_from_cache() -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Foods and name -> fdc_id pairs from the nutrition_cache table."""
+    foods: List[Dict[str, Any]] = []
+    names: Dict[str, int] = {}
+    with get_db_session() as db:
+        rows = db.query(NutritionCache.cache_key, NutritionCache.data, NutritionCache.packed).yield_per(500)
+        for cache_key, data, packed in rows:
+            try:
+                data = unpack(packed) if packed is not None else decode(data)
+            except (ValueError, struct.error):
+                continue
+            if cache_key.startswith("food:") and isinstance(data, dict) and "calories" in data:
+                foods.append(data)
+            elif cache_key.startswith("search:") and isinstance(data, list) and data:
+                query = cache_key.split(":")[1]
+                candidates = [item for item in data if isinstance(item, dict) and "calories" in item]
+                match = best_match(query, candidates)
+                if match:
+                    foods.extend(candidates)
+                    names[food_cache_key(query)] = int(match["fdc_id"])
+    return foods, names
+
+
+def foods_from_index(index_path: str) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Every food in a local FDC index (with its portion weights), named by its description's cache key."""
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    foods: List[Dict[str, Any]] = []
+    names: Dict[str, int] = {}
+    portions: Dict[int, Dict[str, float]] = {}
+    try:
+        try:
+            for fdc_id, unit, grams in conn.execute("SELECT fdc_id, unit, grams FROM portions"):
+                portions.setdefault(fdc_id, {})[unit] = grams
+        except sqlite3.OperationalError:
+            pass  # index built before portions were imported
+        for row in conn.execute("SELECT * FROM foods"):
+            food = {key: row[key] for key in row.keys()}
+            food["portions"] = portions.get(food["fdc_id"], {})
+            foods.append(food)
+            names.setdefault(food_cache_key(food["description"]), food["fdc_id"])
+    finally:
+        conn.close()
+    return foods, names
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Build the shared memory-mapped nutrient table")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="build from the nutrition cache and/or a local FDC index")
+    build.add_argument("--from-cache", action="store_true", help="include foods from the nutrition_cache table")
+    build.add_argument("--from-index", default=None, help="include every food in this FDC index file")
+    build.add_argument("--out", default=None, help=f"table file (default: NUTRIENT_TABLE_PATH or {DEFAULT_TABLE_PATH})")
+    args = parser.parse_args()
+    if not args.from_cache and not args.from_index:
+        parser.error("choose at least one of --from-cache / --from-index")
+
+    foods: List[Dict[str, Any]] = []
+    names: Dict[str, int] = {}
+    if args.from_index:
+        foods, names = foods_from_index(args.from_index)
+    if args.from_cache:
+        from ..database.database import init_db
+
+        init_db()
+        cache_foods, cache_names = foods_from_cache()
+        foods += cache_foods
+        # Names users actually typed win over description-derived ones
+        names.update(cache_names)
+
+    write_table(foods, names, args.out or os.environ.get("NUTRIENT_TABLE_PATH") or DEFAULT_TABLE_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Parse Cache - Reuses Gemini food-parse results for repeated messages
+
+"had a coffee" or "2 eggs and toast" come up constantly across users. Results
+are keyed by the normalized message text plus every input that changes the
+parse (meal-time bucket, preferred units), kept in memory and persisted in the
+nutrition_cache table under a "parse:" prefix so they survive restarts.
+"""
+
+import copy
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from ..config import get_settings
+from ..database.database import get_db_session
+from ..database.models import NutritionCache
+from ..utils.message_text import normalize_message
+from ..utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "parse:"
+
+
+class ParseCache:
+    """Two-tier (memory + DB) cache of parse results with a TTL."""
+
+    def __init__(self):
+        settings = get_settings()
+        self.enabled = settings.parse_cache_enabled
+        self.ttl = timedelta(seconds=settings.parse_cache_ttl)
+        self._l1 = TTLCache(maxsize=settings.parse_cache_size, ttl_seconds=settings.parse_cache_ttl)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypassed": 0, "stored": 0}
+
+    @staticmethod
+    def make_key(message: str, **inputs: Optional[str]) -> str:
+        """Cache key from the normalized message and the other inputs that affect the parse."""
+        parts = [normalize_message(message)] + [f"{name}={inputs[name] or ''}" for name in sorted(inputs)]
+        digest = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+        return f"{KEY_PREFIX}{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """A copy of the cached parse for `key`, or None."""
+        if not self.enabled:
+            return None
+        result = self._l1.get(key)
+        if result is None:
+            result = self._get_persisted(key)
+            if result is not None:
+                self._l1.set(key, result)
+        self._count("hits" if result is not None else "misses")
+        # Callers add timestamps etc. to the result; never hand out the cached object
+        return copy.deepcopy(result) if result is not None else None
+
+    def _get_persisted(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with get_db_session() as db:
+                row = db.query(NutritionCache).filter(NutritionCache.cache_key == key).first()
+                if row is None:
+                    return None
+                if datetime.utcnow() - row.created_at > self.ttl:
+                    db.delete(row)
+                    return None
+                row.last_accessed_at = datetime.utcnow()
+                return row.data
+        except Exception as e:
+            logger.warning(f"Parse cache read error: {e}")
+            return None
+
+    def set(self, key: str, result: Dict[str, Any]) -> None:
+        """Store a successful parse (one with foods and no clarifying questions)."""
+        if not self.enabled or not result.get("foods") or result.get("clarifications_needed"):
+            return
+        result = copy.deepcopy(result)
+        self._l1.set(key, result)
+        self._count("stored")
+        try:
+            with get_db_session() as db:
+                now = datetime.utcnow()
+                row = db.query(NutritionCache).filter(NutritionCache.cache_key == key).first()
+                if row:
+                    row.data = result
+                    row.created_at = now
+                    row.last_accessed_at = now
+                else:
+                    db.add(NutritionCache(cache_key=key, data=result, created_at=now, last_accessed_at=now))
+        except Exception as e:
+            logger.warning(f"Parse cache write error: {e}")
+
+    def record_bypass(self) -> None:
+        self._count("bypassed")
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, memory=self._l1.stats())
+
+    def clear(self) -> None:
+        self._l1.clear()
@@ -4,16 +4,79 @@ USDA Service - Wrapper for USDA FoodData Central API
 
 import json
 import logging
-from typing import Dict, List, Optional, Any
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Tuple, Any
 import httpx
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from sqlalchemy import JSON, func
 
 from ..config import get_settings
 from ..database.database import get_db_session
 from ..database.models import NutritionCache
+from ..utils.circuit_breaker import CircuitBreaker, CircuitOpenError
+from ..utils.food_normalizer import normalize_food_name, food_cache_key
+from ..utils.latency_tracker import LatencyTracker
+from ..utils import nutrition_codec
+from ..utils.single_flight import SingleFlight
+from ..utils.token_bucket import TokenBucket
+from ..utils.ttl_cache import TTLCache
+from ..utils.units import grams_per_unit, parse_food_portions
+from .fdc_index import FDCIndex
+from .nutrient_table import NutrientTable
+from .parse_cache import KEY_PREFIX as PARSE_KEY_PREFIX
 
 logger = logging.getLogger(__name__)
 
+# Cached in place of results when USDA has no match, so known-unknown foods skip the API
+NEGATIVE_CACHE_ENTRY = {"negative": True}
+
+# Page size NutritionAgent searches with; warm-up must use the same one to share cache keys
+LOOKUP_PAGE_SIZE = 5
+
+# nutrition_cache prefix for Gemini per-100g estimates of foods USDA doesn't know
+AI_ESTIMATE_PREFIX = "ai:"
+
+# Max IDs FoodData Central accepts in one POST /foods request
+FOODS_BATCH_SIZE = 20
+
+# Legacy nutrient numbers used by the abridged /food(s) format -> nutrient IDs
+NUTRIENT_NUMBERS = {"208": 1008, "203": 1003, "205": 1005, "204": 1004, "291": 1079, "269": 2000}
+
+# Responses worth retrying: rate limited or a transient server-side failure
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# Responses that mean USDA has nothing for this request; safe to cache as a miss
+NO_MATCH_STATUS = {400, 404}
+
+# The API key was rejected: nothing is wrong with the food, so never cache a miss
+AUTH_ERROR_STATUS = {401, 403}
+
+
+def _read_nutrient(entry: Dict[str, Any]) -> Tuple[int, str, str, Optional[float]]:
+    """(id, name, unit, value) of one foodNutrients entry in any USDA shape.
+
+    Search results use nutrientId/value; /food and /foods return the full shape
+    ({"nutrient": {"id": ...}, "amount": ...}) or, abridged, number/amount.
+    """
+    nutrient = entry.get("nutrient") or {}
+    nutrient_id = entry.get("nutrientId") or nutrient.get("id") or NUTRIENT_NUMBERS.get(str(entry.get("number")), 0)
+    name = (entry.get("nutrientName") or nutrient.get("name") or entry.get("name") or "").lower()
+    unit = (entry.get("unitName") or nutrient.get("unitName") or "").lower()
+    return nutrient_id, name, unit, entry.get("value", entry.get("amount"))
+
+
+class USDAQuotaExhausted(Exception):
+    """No USDA quota became available within USDA_QUOTA_WAIT seconds."""
+
+# Reads refresh a row's last_accessed_at at most this often, to keep cache hits write-free
+ACCESS_TOUCH_INTERVAL = timedelta(hours=1)
+
 
 class USDAService:
     """Service for interacting with USDA FoodData Central API"""
@@ -23,62 +86,471 @@ class USDAService:
         self.base_url = settings.usda_base_url
         self.api_key = settings.usda_api_key
         self._cache_ttl = timedelta(hours=24)
+        self._negative_cache_ttl = timedelta(seconds=settings.usda_negative_cache_ttl)
+        self._l1_cache = TTLCache(maxsize=settings.usda_l1_cache_size, ttl_seconds=settings.usda_l1_cache_ttl)
+        self._db_hits = 0
+        self._db_misses = 0
+        self._negative_hits = 0
+        self._reencoded = 0
+        self._max_staleness = timedelta(seconds=settings.usda_cache_max_staleness)
+        self._refresh_queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=settings.usda_refresh_queue_size)
+        self._refresh_pending: set = set()
+        self._refresh_lock = threading.Lock()
+        self._refresh_worker: Optional[threading.Thread] = None
+        self._refresh_stats = {"stale_served": 0, "enqueued": 0, "dropped": 0, "completed": 0}
+        self._max_rows = settings.usda_cache_max_rows
+        self._sweep_interval = settings.usda_cache_sweep_interval
+        self._sweep_batch_size = settings.usda_cache_sweep_batch_size
+        self._sweep_stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+        self._inflight = SingleFlight()
+        self._local_index = FDCIndex.open_if_present(settings.fdc_index_path)
+        self._local_hits = 0
+        self._local_misses = 0
+        self._nutrient_table = NutrientTable.open_if_present(settings.nutrient_table_path)
+        self._table_hits = 0
+        # One bucket per service; the service is a process-wide singleton, so is the quota
+        self._quota = TokenBucket(settings.usda_hourly_quota, settings.usda_hourly_quota / 3600.0)
+        self._quota_wait = settings.usda_quota_wait
+        self._max_retries = settings.usda_max_retries
+        self._retry_base_delay = settings.usda_retry_base_delay
+        self._retry_max_delay = settings.usda_retry_max_delay
+        self._retry_stats = {"retries": 0, "rate_limited": 0, "gave_up": 0}
+        self._reported_remaining: Optional[int] = None
+        self._breaker = CircuitBreaker(
+            failure_rate=settings.usda_breaker_failure_rate,
+            min_calls=settings.usda_breaker_min_calls,
+            window_size=settings.usda_breaker_window,
+            slow_call_seconds=settings.usda_breaker_slow_call,
+            reset_timeout=settings.usda_breaker_reset_timeout,
+        )
+        self._latency = LatencyTracker()
+        self._hedge_enabled = settings.usda_hedge_enabled
+        self._hedge_percentile = settings.usda_hedge_percentile
+        self._hedge_min_delay = settings.usda_hedge_min_delay
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+        self._hedge_stats = {"sent": 0, "won": 0}
+        self._auth_failures = 0
+        self._client = self._build_client(settings)
+
+    @staticmethod
+    def _build_client(settings) -> httpx.Client:
+        """Create the long-lived, thread-safe connection pool used for all USDA calls."""
+        http2 = settings.usda_http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("USDA_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+                http2 = False
+
+        return httpx.Client(
+            base_url=settings.usda_base_url,
+            http2=http2,
+            timeout=httpx.Timeout(settings.usda_read_timeout, connect=settings.usda_connect_timeout),
+            limits=httpx.Limits(
+                max_connections=settings.usda_max_connections,
+                max_keepalive_connections=settings.usda_max_keepalive_connections,
+                keepalive_expiry=settings.usda_keepalive_expiry,
+            ),
+        )
+
+    def _get_json(self, path: str, params: Dict[str, Any]) -> Any:
+        """GET a USDA endpoint over the pooled client and return the decoded JSON body."""
+        return self._request_json("GET", path, params=params)
+
+    def _post_json(self, path: str, body: Dict[str, Any]) -> Any:
+        """POST a JSON body to a USDA endpoint and return the decoded JSON response."""
+        return self._request_json("POST", path, body=body)
+
+    def _request_json(self, method: str, path: str, params: Optional[Dict[str, Any]] = None,
+                      body: Optional[Dict[str, Any]] = None) -> Any:
+        """Send one USDA request within the hourly quota, retrying timeouts, 429s and 5xx
+        with jittered exponential backoff (honoring Retry-After)."""
+        params = dict(params or {})
+        if self.api_key:
+            params["api_key"] = self.api_key
+
+        for attempt in range(self._max_retries + 1):
+            # While USDA is down or crawling, fail fast so callers use cache/local index/AI instead
+            if not self._breaker.allow():
+                raise CircuitOpenError("USDA circuit breaker is open")
+
+            last_attempt = attempt == self._max_retries
+            try:
+                # Queue for quota instead of failing; only give up after USDA_QUOTA_WAIT seconds
+                if not self._quota.acquire(timeout=self._quota_wait):
+                    raise USDAQuotaExhausted(f"USDA hourly quota exhausted; waited {self._quota_wait:.0f}s")
+                started = time.monotonic()
+                response = self._send(method, path, params, body)
+                elapsed = time.monotonic() - started
+                if response.status_code >= 500:
+                    self._breaker.record_failure()
+                else:
+                    # 4xx (including 429) means USDA is up and answering
+                    self._breaker.record_success(elapsed)
+                    self._latency.record(elapsed)
+            except httpx.TransportError as e:
+                self._breaker.record_failure()
+                if last_attempt:
+                    self._retry_stats["gave_up"] += 1
+                    raise
+                delay = self._backoff(attempt)
+                logger.warning(f"USDA {method} {path} failed ({e.__class__.__name__}); retrying in {delay:.1f}s")
+                self._retry_stats["retries"] += 1
+                time.sleep(delay)
+                continue
+            finally:
+                # A half-open probe that ended with no outcome (quota timeout, unexpected error)
+                # must not leave the breaker waiting for it forever
+                self._breaker.release_probe()
+
+            self._track_rate_limit(response)
+            if response.status_code not in RETRYABLE_STATUS:
+                response.raise_for_status()
+                return response.json()
+            if last_attempt:
+                self._retry_stats["gave_up"] += 1
+                response.raise_for_status()
+
+            delay = self._backoff(attempt)
+            if response.status_code == 429:
+                self._retry_stats["rate_limited"] += 1
+                retry_after = self._retry_after(response)
+                if retry_after is not None:
+                    delay = min(retry_after, self._retry_max_delay)
+                # Hold every other USDA caller too, not just this one
+                self._quota.pause(delay)
+            logger.warning(f"USDA {method} {path} returned HTTP {response.status_code}; retrying in {delay:.1f}s")
+            self._retry_stats["retries"] += 1
+            time.sleep(delay)
+
+    def _send(self, method: str, path: str, params: Dict[str, Any], body: Optional[Dict[str, Any]]) -> httpx.Response:
+        """Send one request; a GET still running after the p95 latency gets a hedged duplicate."""
+        delay = self._hedge_delay() if method == "GET" else None
+        if delay is None:
+            return self._client.request(method, path, params=params, json=body)
+
+        pool = self._get_hedge_pool()
+        primary = pool.submit(self._client.request, method, path, params=params, json=body)
+        done, _ = wait([primary], timeout=delay)
+        # The hedge is a real request, so it needs quota too; never wait for it
+        if done or not self._quota.acquire(timeout=0):
+            return primary.result()
+
+        self._hedge_stats["sent"] += 1
+        hedge = pool.submit(self._client.request, method, path, params=params, json=body)
+        done, _ = wait([primary, hedge], return_when=FIRST_COMPLETED)
+        winner: Future = done.pop()
+        if winner.exception() is not None:
+            # One attempt failed fast; the other may still succeed
+            winner = hedge if winner is primary else primary
+        if winner is hedge:
+            self._hedge_stats["won"] += 1
+        return winner.result()
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None when hedging is off or latency is still unknown."""
+        if not self._hedge_enabled:
+            return None
+        p = self._latency.percentile(self._hedge_percentile)
+        return None if p is None else max(p, self._hedge_min_delay)
+
+    def _get_hedge_pool(self) -> ThreadPoolExecutor:
+        if self._hedge_pool is None:
+            with self._refresh_lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(
+                        max_workers=get_settings().usda_max_connections, thread_name_prefix="usda-hedge"
+                    )
+        return self._hedge_pool
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff so concurrent retries don't line up."""
+        return random.uniform(0, min(self._retry_max_delay, self._retry_base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        """Seconds from a Retry-After header (delta-seconds or HTTP date), if present."""
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+    def _track_rate_limit(self, response: httpx.Response) -> None:
+        """Keep the local bucket no more optimistic than api.data.gov's own counter."""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        if remaining is None:
+            return
+        try:
+            self._reported_remaining = int(remaining)
+        except ValueError:
+            return
+        self._quota.limit_to(self._reported_remaining)
+
+    def get_quota_stats(self) -> Dict[str, Any]:
+        """Hourly quota left (local bucket and as last reported by USDA) and retry counts."""
+        return {
+            **self._quota.stats(),
+            "reported_remaining": self._reported_remaining,
+            **self._retry_stats,
+        }
+
+    def get_health_stats(self) -> Dict[str, Any]:
+        """Circuit breaker state, observed latency percentiles and hedging counts."""
+        return {
+            "breaker": self._breaker.stats(),
+            "latency_p50": self._latency.percentile(50),
+            "latency_p95": self._latency.percentile(95),
+            "hedge": dict(self._hedge_stats),
+            "auth_failures": self._auth_failures,
+        }
+
+    def close(self) -> None:
+        """Stop the background workers and close the pooled HTTP client."""
+        self._sweep_stop.set()
+        if self._refresh_worker is not None and self._refresh_worker.is_alive():
+            try:
+                self._refresh_queue.put_nowait(None)
+            except queue.Full:
+                pass  # daemon thread; exits with the process
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self._client.close()
+        logger.info("USDA HTTP client closed")
+
+    @staticmethod
+    def _row_value(row: NutritionCache) -> Any:
+        """The cached value of a row, from the packed column or the JSON one."""
+        if row.packed is not None:
+            return nutrition_codec.unpack(row.packed)
+        return nutrition_codec.decode(row.data)
+
+    @staticmethod
+    def _stored_columns(data: Any) -> Dict[str, Any]:
+        """Column values for caching `data`: food records packed, everything else as JSON."""
+        if nutrition_codec.is_encodable(data):
+            return {"data": JSON.NULL, "packed": nutrition_codec.pack(data)}
+        return {"data": data, "packed": None}
+
+    @staticmethod
+    def _is_negative(data: Any) -> bool:
+        """True for a cached "no match" entry (legacy rows stored an empty list)."""
+        return data == [] or data == NEGATIVE_CACHE_ENTRY
+
+    def _get_from_cache(self, key: str, refresh: Optional[Callable[[], Any]] = None) -> Optional[Any]:
+        """Get data from the in-memory tier, then the DB-backed cache if not expired.
+
+        DB hits are promoted into the in-memory tier. Negative entries expire after the
+        shorter negative TTL. A positive entry past its TTL but within the max staleness
+        is still returned while `refresh` re-fetches it in the background; entries older
+        than that are deleted.
+        """
+        data = self._l1_cache.get(key)
+        if data is not None:
+            logger.debug(f"L1 cache hit for: {key}")
+            return data
 
-    def _get_from_cache(self, key: str) -> Optional[Any]:
-        """Get data from DB-backed cache if not expired. Lazily deletes stale entries."""
         try:
             with get_db_session() as db:
                 row = db.query(NutritionCache).filter(NutritionCache.cache_key == key).first()
                 if row is None:
+                    self._db_misses += 1
                     return None
-                if datetime.utcnow() - row.created_at > self._cache_ttl:
-                    db.delete(row)
-                    db.commit()
-                    return None
-                logger.debug(f"Cache hit for: {key}")
-                return row.data
+                negative = self._is_negative(row.data)
+                age = datetime.utcnow() - row.created_at
+                ttl = self._negative_cache_ttl if negative else self._cache_ttl
+                if age > ttl:
+                    if negative or refresh is None or age > ttl + self._max_staleness:
+                        db.delete(row)
+                        db.commit()
+                        self._db_misses += 1
+                        return None
+                    logger.debug(f"Serving stale cache entry for: {key}")
+                    self._refresh_stats["stale_served"] += 1
+                    self._schedule_refresh(key, refresh)
+                else:
+                    logger.debug(f"Cache hit for: {key}")
+                now = datetime.utcnow()
+                if row.last_accessed_at is None or now - row.last_accessed_at > ACCESS_TOUCH_INTERVAL:
+                    row.last_accessed_at = now
+                self._db_hits += 1
+                data = self._row_value(row)
+                # Stale rows are left alone: the refresh worker may already be rewriting them
+                if age <= ttl and row.packed is None and nutrition_codec.is_encodable(data):
+                    # Legacy JSON row (plain or "nc1:" string): move it to the packed column on first read
+                    for column, value in self._stored_columns(data).items():
+                        setattr(row, column, value)
+                    self._reencoded += 1
         except Exception as e:
             logger.warning(f"Cache read error: {e}")
             return None
 
+        self._set_l1(key, data)
+        return data
+
+    def _schedule_refresh(self, key: str, refresh: Callable[[], Any]) -> None:
+        """Queue a background re-fetch of a stale entry (at most one per key, bounded queue)."""
+        with self._refresh_lock:
+            if key in self._refresh_pending:
+                return
+            try:
+                self._refresh_queue.put_nowait((key, refresh))
+            except queue.Full:
+                self._refresh_stats["dropped"] += 1
+                logger.debug(f"Refresh queue full, not refreshing: {key}")
+                return
+            self._refresh_pending.add(key)
+            self._refresh_stats["enqueued"] += 1
+            if self._refresh_worker is None or not self._refresh_worker.is_alive():
+                self._refresh_worker = threading.Thread(
+                    target=self._run_refresh_worker, name="usda-cache-refresh", daemon=True
+                )
+                self._refresh_worker.start()
+
+    def _run_refresh_worker(self) -> None:
+        """Refresh stale entries one at a time so a burst of expirations can't stampede USDA."""
+        while True:
+            item = self._refresh_queue.get()
+            if item is None:
+                return
+            key, refresh = item
+            try:
+                refresh()
+                self._refresh_stats["completed"] += 1
+                logger.debug(f"Refreshed stale cache entry: {key}")
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key}: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refresh_pending.discard(key)
+                self._refresh_queue.task_done()
+
+    def _set_l1(self, key: str, data: Any) -> None:
+        """Store in the in-memory tier, capping negative entries at the negative TTL."""
+        if self._is_negative(data):
+            ttl = min(self._l1_cache.ttl_seconds, self._negative_cache_ttl.total_seconds())
+            self._l1_cache.set(key, data, ttl_seconds=ttl)
+        else:
+            self._l1_cache.set(key, data)
+
     def _add_to_cache(self, key: str, data: Any) -> None:
-        """Write data to DB-backed cache, replacing any existing entry for this key."""
+        """Write data to the in-memory tier and through to the DB-backed cache."""
+        self._set_l1(key, data)
         try:
             with get_db_session() as db:
                 row = db.query(NutritionCache).filter(NutritionCache.cache_key == key).first()
+                now = datetime.utcnow()
+                stored = self._stored_columns(data)
                 if row:
-                    row.data = data
-                    row.created_at = datetime.utcnow()
+                    row.data = stored["data"]
+                    row.packed = stored["packed"]
+                    row.created_at = now
+                    row.last_accessed_at = now
                 else:
-                    db.add(NutritionCache(cache_key=key, data=data, created_at=datetime.utcnow()))
+                    db.add(NutritionCache(cache_key=key, created_at=now, last_accessed_at=now, **stored))
+                db.commit()
+        except Exception as e:
+            logger.warning(f"Cache write error: {e}")
+    
+    def _add_many_to_cache(self, entries: Dict[str, Any]) -> None:
+        """Write several entries to both tiers using one DB session."""
+        if not entries:
+            return
+        for key, data in entries.items():
+            self._set_l1(key, data)
+        try:
+            with get_db_session() as db:
+                now = datetime.utcnow()
+                existing = {
+                    row.cache_key: row
+                    for row in db.query(NutritionCache).filter(NutritionCache.cache_key.in_(list(entries)))
+                }
+                for key, data in entries.items():
+                    row = existing.get(key)
+                    stored = self._stored_columns(data)
+                    if row:
+                        row.data = stored["data"]
+                        row.packed = stored["packed"]
+                        row.created_at = now
+                        row.last_accessed_at = now
+                    else:
+                        db.add(NutritionCache(cache_key=key, created_at=now, last_accessed_at=now, **stored))
                 db.commit()
         except Exception as e:
             logger.warning(f"Cache write error: {e}")
     
     def search_foods(self, query: str, page_size: int = 10) -> List[Dict[str, Any]]:
-        """Search for foods in USDA database."""
-        # Check cache
-        cache_key = f"search:{query}:{page_size}"
-        cached = self._get_from_cache(cache_key)
-        if cached:
+        """Search for foods in USDA database (the query is normalized to its canonical form first)."""
+        query = normalize_food_name(query) or query.strip().lower()
+        
+        # Local FoodData Central index first: no network, no API quota
+        local = self._search_local_index(query, page_size)
+        if local:
+            return local
+        
+        # Then the shared memory-mapped table (one best match per known food name)
+        if self._nutrient_table is not None:
+            shared = self._nutrient_table.lookup_name(query)
+            if shared:
+                self._table_hits += 1
+                return [shared]
+        
+        # Check cache (order-insensitive key, so "eggs, scrambled" hits "scrambled eggs")
+        cache_key = f"search:{food_cache_key(query)}:{page_size}"
+        cached = self._get_from_cache(cache_key, refresh=lambda: self._fetch_search(query, page_size, cache_key))
+        if cached is not None:
+            if self._is_negative(cached):
+                self._negative_hits += 1
+                logger.info(f"Negative cache hit for query: {query} (USDA has no match)")
+                return []
             return cached
         
-        # Build URL
-        url = f"{self.base_url}/foods/search"
+        # Concurrent misses for the same key share one outbound request
+        return self._inflight.do(cache_key, lambda: self._fetch_search(query, page_size, cache_key))
+
+    def _search_local_index(self, query: str, page_size: int) -> List[Dict[str, Any]]:
+        """Search the offline FDC index, if one is installed. Empty list means fall back to the API."""
+        if self._local_index is None:
+            return []
+        try:
+            results = self._local_index.search(query, limit=page_size)
+        except sqlite3.Error as e:
+            logger.warning(f"Local FDC index search failed: {e}")
+            return []
+        if results:
+            self._local_hits += 1
+            logger.debug(f"Local index hit for: {query}")
+        else:
+            self._local_misses += 1
+        return results
+
+    def is_search_cached(self, query: str, page_size: int = 10) -> bool:
+        """True if a search for this query needs no API call (local index, or a positive/negative cache entry)."""
+        query = normalize_food_name(query) or query.strip().lower()
+        if self._search_local_index(query, page_size):
+            return True
+        if self._nutrient_table is not None and self._nutrient_table.lookup_name(query):
+            return True
+        return self._get_from_cache(f"search:{food_cache_key(query)}:{page_size}") is not None
+
+    def _fetch_search(self, query: str, page_size: int, cache_key: str) -> List[Dict[str, Any]]:
+        """Call the USDA search endpoint and write the parsed results to the cache."""
         params = {
             "query": query,
             "pageSize": page_size,
             "dataType": ["Survey (FNDDS)", "Foundation", "SR Legacy"],  # Most comprehensive types
         }
         
-        if self.api_key:
-            params["api_key"] = self.api_key
-        
         try:
-            with httpx.Client(timeout=10.0) as client:
-                response = client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
+            data = self._get_json("/foods/search", params)
             
             # Parse and format results
             results = []
@@ -91,14 +563,18 @@ class USDAService:
                     logger.warning(f"Error parsing food item: {e}")
                     continue
             
-            # Cache results
-            self._add_to_cache(cache_key, results)
+            # Cache results (or remember that USDA has no match)
+            self._add_to_cache(cache_key, results or NEGATIVE_CACHE_ENTRY)
             
             logger.info(f"Found {len(results)} foods for query: {query}")
             return results
             
+        except CircuitOpenError:
+            logger.debug(f"USDA circuit open; skipping search for: {query}")
+            return []
         except httpx.HTTPStatusError as e:
             logger.error(f"USDA API HTTP error: {e.response.status_code}")
+            self._handle_http_error(e, cache_key)
             return []
         except httpx.TimeoutException:
             logger.error("USDA API timeout")
@@ -106,35 +582,130 @@ class USDAService:
         except Exception as e:
             logger.error(f"Error calling USDA API: {e}")
             return []
+
+    def _handle_http_error(self, error: httpx.HTTPStatusError, cache_key: Optional[str] = None) -> None:
+        """Cache a miss under `cache_key` only when USDA has no answer for the request (400/404).
+
+        Auth errors are not a property of the food: they are counted and logged
+        loudly instead, so a bad or expired key doesn't fill the cache with misses.
+        """
+        status = error.response.status_code
+        if status in AUTH_ERROR_STATUS:
+            self._auth_failures += 1
+            logger.error(f"USDA rejected the API key (HTTP {status}); check USDA_API_KEY")
+        elif status in NO_MATCH_STATUS and cache_key is not None:
+            self._add_to_cache(cache_key, NEGATIVE_CACHE_ENTRY)
     
+    def _get_local_food(self, fdc_id: int) -> Optional[Dict[str, Any]]:
+        """A food from the local FDC index or the shared nutrient table, without network or DB."""
+        if self._local_index is not None:
+            try:
+                local = self._local_index.get(fdc_id)
+                if local:
+                    self._local_hits += 1
+                    return local
+            except sqlite3.Error as e:
+                logger.warning(f"Local FDC index lookup failed: {e}")
+        if self._nutrient_table is not None:
+            shared = self._nutrient_table.get(fdc_id)
+            if shared:
+                self._table_hits += 1
+                return shared
+        return None
+
     def get_food_by_id(self, fdc_id: int) -> Optional[Dict[str, Any]]:
         """Get detailed food information by FDC ID."""
+        local = self._get_local_food(fdc_id)
+        if local:
+            return local
+        
         # Check cache
         cache_key = f"food:{fdc_id}"
-        cached = self._get_from_cache(cache_key)
-        if cached:
+        cached = self._get_from_cache(cache_key, refresh=lambda: self._fetch_food(fdc_id, cache_key))
+        if cached is not None:
+            if self._is_negative(cached):
+                self._negative_hits += 1
+                return None
             return cached
         
-        url = f"{self.base_url}/food/{fdc_id}"
-        params = {}
-        
-        if self.api_key:
-            params["api_key"] = self.api_key
-        
+        return self._inflight.do(cache_key, lambda: self._fetch_food(fdc_id, cache_key))
+
+    def get_foods_by_ids(self, fdc_ids: List[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        """Resolve many FDC IDs at once: local index and cache first, then the
+        multi-ID `/foods` endpoint for the rest (FOODS_BATCH_SIZE IDs per request).
+
+        Returns {fdc_id: food or None}. Every fetched ID is cached, so a later
+        get_food_by_id for any of them is a cache hit.
+        """
+        results: Dict[int, Optional[Dict[str, Any]]] = {}
+        missing: List[int] = []
+
+        for fdc_id in dict.fromkeys(int(i) for i in fdc_ids):
+            local = self._get_local_food(fdc_id)
+            if local:
+                results[fdc_id] = local
+                continue
+
+            cached = self._get_from_cache(f"food:{fdc_id}")
+            if cached is None:
+                missing.append(fdc_id)
+            elif self._is_negative(cached):
+                self._negative_hits += 1
+                results[fdc_id] = None
+            else:
+                results[fdc_id] = cached
+
+        for start in range(0, len(missing), FOODS_BATCH_SIZE):
+            results.update(self._fetch_foods_batch(missing[start:start + FOODS_BATCH_SIZE]))
+
+        return results
+
+    def _fetch_foods_batch(self, fdc_ids: List[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        """One POST /foods call for up to FOODS_BATCH_SIZE IDs; caches every ID, found or not."""
         try:
-            with httpx.Client(timeout=10.0) as client:
-                response = client.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
+            data = self._post_json("/foods", {"fdcIds": fdc_ids})
+        except CircuitOpenError:
+            logger.debug(f"USDA circuit open; skipping fetch of {len(fdc_ids)} foods")
+            return {fdc_id: None for fdc_id in fdc_ids}
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Error fetching {len(fdc_ids)} foods by ID: HTTP {e.response.status_code}")
+            self._handle_http_error(e)
+            return {fdc_id: None for fdc_id in fdc_ids}
+        except Exception as e:
+            logger.error(f"Error fetching {len(fdc_ids)} foods by ID: {e}")
+            return {fdc_id: None for fdc_id in fdc_ids}
+
+        parsed: Dict[int, Optional[Dict[str, Any]]] = {fdc_id: None for fdc_id in fdc_ids}
+        for item in data or []:
+            food = self._parse_food_item(item)
+            if food and food["fdc_id"] in parsed:
+                parsed[food["fdc_id"]] = food
+
+        # IDs USDA didn't return (or returned without calories) are cached as negative
+        self._add_many_to_cache({
+            f"food:{fdc_id}": food or NEGATIVE_CACHE_ENTRY for fdc_id, food in parsed.items()
+        })
+        return parsed
+
+    def _fetch_food(self, fdc_id: int, cache_key: str) -> Optional[Dict[str, Any]]:
+        """Call the USDA single-food endpoint and write the parsed result to the cache."""
+        try:
+            data = self._get_json(f"/food/{fdc_id}", {})
             
             parsed = self._parse_food_item(data)
             
-            # Cache result
-            if parsed:
-                self._add_to_cache(cache_key, parsed)
+            # Cache result (or remember that it has no usable nutrition data)
+            self._add_to_cache(cache_key, parsed or NEGATIVE_CACHE_ENTRY)
             
             return parsed
             
+        except CircuitOpenError:
+            logger.debug(f"USDA circuit open; skipping food {fdc_id}")
+            return None
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Error getting food by ID {fdc_id}: HTTP {e.response.status_code}")
+            self._handle_http_error(e, cache_key)
+            return None
         except Exception as e:
             logger.error(f"Error getting food by ID {fdc_id}: {e}")
             return None
@@ -149,15 +720,16 @@ class USDAService:
                 "data_type": food_data.get("dataType", ""),
                 "serving_size": 100,  # Default to 100g
                 "serving_unit": "g",
+                # Food-specific gram weights per unit ("cup": 30 for spinach)
+                "portions": parse_food_portions(food_data),
             }
             
             # Extract nutrients
             nutrients = {}
             for nutrient in food_data.get("foodNutrients", []):
-                nutrient_name = nutrient.get("nutrientName", "").lower()
-                nutrient_unit = nutrient.get("unitName", "").lower()
-                nutrient_value = nutrient.get("value", 0)
-                nutrient_id = nutrient.get("nutrientId", 0)
+                nutrient_id, nutrient_name, nutrient_unit, nutrient_value = _read_nutrient(nutrient)
+                if nutrient_value is None:
+                    continue
                 
                 # Match by nutrient ID (most reliable) or by name
                 if nutrient_id == 1008 or (nutrient_name == "energy" and nutrient_unit == "kcal"):
@@ -185,6 +757,19 @@ class USDAService:
         except Exception as e:
             logger.error(f"Error parsing food item: {e}")
             return None
+
+    def get_ai_estimates(self, names: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Cached AI per-100g estimates for the given food names, keyed by food cache key."""
+        estimates = {}
+        for key in dict.fromkeys(food_cache_key(name) for name in names):
+            cached = self._get_from_cache(f"{AI_ESTIMATE_PREFIX}{key}")
+            if isinstance(cached, dict) and not self._is_negative(cached):
+                estimates[key] = cached
+        return estimates
+
+    def cache_ai_estimates(self, estimates: Dict[str, Dict[str, Any]]) -> None:
+        """Store AI per-100g estimates (keyed by food cache key) alongside USDA results."""
+        self._add_many_to_cache({f"{AI_ESTIMATE_PREFIX}{key}": data for key, data in estimates.items()})
     
     def calculate_nutrition_for_serving(
         self,
@@ -192,74 +777,14 @@ class USDAService:
         quantity: float,
         unit: str
     ) -> Dict[str, float]:
-        """Scale USDA nutrition (per 100g) to the user's serving size."""
-        # Weight-based units (exact)
-        weight_units = {
-            "g": 1, "gram": 1, "grams": 1,
-            "kg": 1000, "kilogram": 1000,
-            "oz": 28.35, "ounce": 28.35, "ounces": 28.35,
-            "lb": 453.592, "pound": 453.592, "pounds": 453.592,
-        }
-
-        # Volume/portion units (approximate grams)
-        portion_units = {
-            "cup": 240, "cups": 240,
-            "tbsp": 15, "tablespoon": 15, "tablespoons": 15,
-            "tsp": 5, "teaspoon": 5, "teaspoons": 5,
-            "bowl": 300, "bowls": 300,
-            "plate": 300, "plates": 300,
-            "glass": 240,
-        }
+        """Scale USDA nutrition (per 100g) to the user's serving size.
 
-        # Size descriptors (grams per item)
-        size_units = {
-            "small": 80, "medium": 130, "large": 180,
-            "standard": 100, "regular": 130,
-        }
-
-        # Countable item units (grams per piece)
-        piece_units = {
-            "piece": 30, "pieces": 30,
-            "slice": 30, "slices": 30,
-            "chip": 5, "chips": 5,
-            "nacho": 7, "nachos": 7,
-            "cracker": 5, "crackers": 5,
-            "cookie": 30, "cookies": 30,
-            "strip": 20, "strips": 20,
-            "nugget": 18, "nuggets": 18,
-            "wing": 30, "wings": 30,
-            "bite": 15, "bites": 15,
-            "scoop": 70, "scoops": 70,
-            "handful": 30,
-            "bar": 50, "bars": 50,
-            "patty": 85, "patties": 85,
-            "fillet": 170, "fillets": 170,
-            "breast": 170, "breasts": 170,
-            "thigh": 115, "thighs": 115,
-            "drumstick": 75, "drumsticks": 75,
-            "egg": 50, "eggs": 50,
-            "wrap": 60, "wraps": 60,
-            "tortilla": 50, "tortillas": 50,
-            "roll": 50, "rolls": 50,
-        }
-
-        # "Serving" means 1 USDA standard portion (100g)
-        serving_units = {
-            "serving": 100, "servings": 100,
-            "portion": 100, "portions": 100,
-        }
+        Uses the food's own portion weights when USDA has them, else the generic unit table.
+        """
+        per_unit = grams_per_unit(unit, food_data.get("portions"))
 
-        unit_lower = unit.lower().strip()
-
-        all_units = {}
-        all_units.update(weight_units)
-        all_units.update(portion_units)
-        all_units.update(size_units)
-        all_units.update(piece_units)
-        all_units.update(serving_units)
-
-        if unit_lower in all_units:
-            grams = quantity * all_units[unit_lower]
+        if per_unit is not None:
+            grams = quantity * per_unit
         else:
             # Unknown unit - if quantity is small (1-2), treat as servings (100g each)
             # If quantity is larger, treat as individual pieces (~30g each)
@@ -287,8 +812,111 @@ class USDAService:
         
         return result
     
+    def sweep_cache(self) -> Dict[str, int]:
+        """Bulk-delete expired rows, then evict least recently used rows above the row cap.
+
+        Each row expires by its own TTL: USDA results after the TTL plus max staleness,
+        negative entries after the negative TTL, parse results after the parse-cache TTL.
+        Rows are deleted in batches (one transaction each) so a large sweep never holds
+        long locks on the table. Returns how many rows were reclaimed.
+        """
+        now = datetime.utcnow()
+        cutoff = now - (self._cache_ttl + self._max_staleness)
+        parse_cutoff = now - timedelta(seconds=get_settings().parse_cache_ttl)
+        is_parse = NutritionCache.cache_key.like(f"{PARSE_KEY_PREFIX}%")
+        expired = self._delete_in_batches(
+            lambda db: db.query(NutritionCache.id)
+            .filter(NutritionCache.created_at < cutoff, ~is_parse)
+        )
+        expired += self._delete_in_batches(
+            lambda db: db.query(NutritionCache.id)
+            .filter(NutritionCache.created_at < parse_cutoff, is_parse)
+        )
+        expired += self._delete_ids(self._expired_negative_ids(now - self._negative_cache_ttl))
+
+        evicted = 0
+        with get_db_session() as db:
+            excess = db.query(NutritionCache).count() - self._max_rows
+        if excess > 0:
+            evicted = self._delete_in_batches(
+                lambda db: db.query(NutritionCache.id).order_by(
+                    func.coalesce(NutritionCache.last_accessed_at, NutritionCache.created_at).asc()
+                ),
+                limit=excess,
+            )
+
+        logger.info(f"Cache sweep reclaimed {expired + evicted} rows ({expired} expired, {evicted} evicted over cap)")
+        return {"expired": expired, "evicted": evicted}
+
+    def _expired_negative_ids(self, cutoff: datetime) -> List[int]:
+        """Ids of negative entries created before `cutoff` (they live in the JSON column, so checked here)."""
+        with get_db_session() as db:
+            rows = (
+                db.query(NutritionCache.id, NutritionCache.data)
+                .filter(NutritionCache.created_at < cutoff, NutritionCache.packed.is_(None))
+                .yield_per(self._sweep_batch_size)
+            )
+            return [row_id for row_id, data in rows if self._is_negative(data)]
+
+    def _delete_ids(self, ids: List[int]) -> int:
+        """Delete rows by id, one batch per transaction."""
+        for start in range(0, len(ids), self._sweep_batch_size):
+            batch = ids[start:start + self._sweep_batch_size]
+            with get_db_session() as db:
+                db.query(NutritionCache).filter(NutritionCache.id.in_(batch)).delete(synchronize_session=False)
+        return len(ids)
+
+    def _delete_in_batches(self, select_ids: Callable, limit: Optional[int] = None) -> int:
+        """Delete rows whose ids the query selects, batch by batch, up to an optional limit."""
+        deleted = 0
+        while limit is None or deleted < limit:
+            batch = self._sweep_batch_size if limit is None else min(self._sweep_batch_size, limit - deleted)
+            with get_db_session() as db:
+                ids = [row_id for (row_id,) in select_ids(db).limit(batch).all()]
+                if not ids:
+                    break
+                db.query(NutritionCache).filter(NutritionCache.id.in_(ids)).delete(synchronize_session=False)
+            deleted += len(ids)
+            if len(ids) < batch:
+                break
+        return deleted
+
+    def start_cache_sweeper(self) -> None:
+        """Run sweep_cache() periodically on a daemon thread."""
+        if self._sweep_interval <= 0 or (self._sweeper is not None and self._sweeper.is_alive()):
+            return
+
+        def run():
+            while not self._sweep_stop.wait(self._sweep_interval):
+                try:
+                    self.sweep_cache()
+                except Exception as e:
+                    logger.warning(f"Cache sweep failed: {e}")
+
+        self._sweep_stop.clear()
+        self._sweeper = threading.Thread(target=run, name="usda-cache-sweeper", daemon=True)
+        self._sweeper.start()
+        logger.info(f"Cache sweeper started (every {self._sweep_interval:.0f}s, cap {self._max_rows} rows)")
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for the cache tiers plus refresh and request-coalescing metrics."""
+        return {
+            "l1": self._l1_cache.stats(),
+            "db": {"hits": self._db_hits, "misses": self._db_misses, "reencoded": self._reencoded},
+            "negative_hits": self._negative_hits,
+            "refresh": dict(self._refresh_stats, pending=self._refresh_queue.qsize()),
+            "single_flight": self._inflight.stats(),
+            "local_index": {
+                "enabled": self._local_index is not None,
+                "hits": self._local_hits,
+                "misses": self._local_misses,
+            },
+            "nutrient_table": {"enabled": self._nutrient_table is not None, "hits": self._table_hits},
+        }
+
     def clear_cache(self) -> None:
-        """Delete all entries from the persistent nutrition cache."""
+        """Delete all entries from the in-memory and persistent nutrition caches."""
+        self._l1_cache.clear()
         try:
             with get_db_session() as db:
                 db.query(NutritionCache).delete()
@@ -308,3 +936,11 @@ def get_usda_service() -> USDAService:
     if _usda_service is None:
         _usda_service = USDAService()
     return _usda_service
+
+
+def close_usda_service() -> None:
+    """Close the USDA service singleton's connection pool, if it was created."""
+    global _usda_service
+    if _usda_service is not None:
+        _usda_service.close()
+        _usda_service = None
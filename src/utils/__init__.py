@@ -5,6 +5,8 @@ Utilities Package - Helper functions for calculations and formatting
 from .calculations import calculate_tdee, calculate_calorie_goal
 from .formatters import format_food_log_message, format_daily_summary, format_range_summary
 from .rate_limiter import RateLimiter
+from .single_flight import SingleFlight
+from .ttl_cache import TTLCache
 
 __all__ = [
     "calculate_tdee",
@@ -13,4 +15,6 @@ __all__ = [
     "format_daily_summary",
     "format_range_summary",
     "RateLimiter",
+    "SingleFlight",
+    "TTLCache",
 ]
@@ -0,0 +1,118 @@
+"""
+Circuit Breaker - Stops calling a dependency that is failing or too slow
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency while its breaker is open."""
+
+
+class CircuitBreaker:
+    """Classic closed / open / half-open breaker over a rolling window of calls.
+
+    A call is "bad" if it failed or took longer than `slow_call_seconds`. Once the
+    last `window_size` calls hold at least `min_calls` outcomes and the bad share
+    reaches `failure_rate`, the breaker opens and `allow()` returns False for
+    `reset_timeout` seconds. Then one probe call is let through: success closes
+    the breaker, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_rate: float = 0.5, min_calls: int = 5, window_size: int = 20,
+                 slow_call_seconds: float = 3.0, reset_timeout: float = 30.0):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self._outcomes: Deque[bool] = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_owner = None
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.short_circuited = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return self._state
+
+    def _maybe_half_open(self, now: float) -> None:
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
+            self._probe_owner = None
+
+    def allow(self) -> bool:
+        """True if a call may go out now (always when closed; one probe when half-open)."""
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_owner = threading.get_ident()
+                return True
+            self.short_circuited += 1
+            return False
+
+    def release_probe(self) -> None:
+        """Free this thread's half-open probe if it ended without recording an outcome.
+
+        A no-op once the probe recorded success or failure, or when the calling
+        thread doesn't hold the probe.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._probe_owner == threading.get_ident():
+                self._probe_in_flight = False
+                self._probe_owner = None
+
+    def record_success(self, elapsed: float) -> None:
+        """Record a completed call; a slow one counts against the breaker."""
+        self._record(bad=elapsed > self.slow_call_seconds)
+
+    def record_failure(self) -> None:
+        self._record(bad=True)
+
+    def _record(self, bad: bool) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                if bad:
+                    self._open()
+                else:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                return
+            if self._state == self.OPEN:
+                return
+            self._outcomes.append(bad)
+            if len(self._outcomes) >= self.min_calls and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate:
+                self._open()
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._outcomes.clear()
+        self.opened += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open(time.monotonic())
+            return {
+                "state": self._state,
+                "recent_calls": len(self._outcomes),
+                "recent_bad": sum(self._outcomes),
+                "opened": self.opened,
+                "short_circuited": self.short_circuited,
+            }
@@ -0,0 +1,212 @@
+"""
+Food Normalizer - Canonical food names for USDA searches and cache keys
+"""
+
+import difflib
+import re
+from functools import lru_cache
+from typing import List, Tuple
+
+# Regional names, abbreviations and common variants -> the name USDA uses
+SYNONYMS = {
+    "oj": "orange juice",
+    "pb": "peanut butter",
+    "pbj": "peanut butter and jelly sandwich",
+    "pb and j": "peanut butter and jelly sandwich",
+    "fries": "french fries",
+    "coke": "cola",
+    "yoghurt": "yogurt",
+    "aubergine": "eggplant",
+    "brinjal": "eggplant",
+    "courgette": "zucchini",
+    "garbanzo": "chickpea",
+    "garbanzo bean": "chickpea",
+    "chana": "chickpea",
+    "capsicum": "bell pepper",
+    "coriander": "cilantro",
+    "prawn": "shrimp",
+    "mince": "ground beef",
+    "beef mince": "ground beef",
+    "lamb mince": "ground lamb",
+    "pork mince": "ground pork",
+    "turkey mince": "ground turkey",
+    "chicken mince": "ground chicken",
+    "porridge": "oatmeal",
+    "oats": "oatmeal",
+    "curd": "yogurt",
+    "donut": "doughnut",
+    "ice-cream": "ice cream",
+    "mac and cheese": "macaroni and cheese",
+    "mac n cheese": "macaroni and cheese",
+    "spag bol": "spaghetti bolognese",
+    "latte": "coffee latte",
+    "cappucino": "cappuccino",
+    "omelette": "omelet",
+}
+
+# Synonyms that mean something else inside a longer name ("bean curd" is tofu, "mince pie"
+# is fruit, "coke zero" is its own drink): applied only when they are the whole name
+WHOLE_NAME_SYNONYMS = {"curd", "mince", "coke"}
+
+# Plurals the suffix rules would get wrong
+IRREGULAR_PLURALS = {
+    "cookies": "cookie",
+    "pies": "pie",
+    "brownies": "brownie",
+    "smoothies": "smoothie",
+    "veggies": "veggie",
+    "leaves": "leaf",
+    "loaves": "loaf",
+    "halves": "half",
+    "knives": "knife",
+    "mice": "mouse",
+}
+
+# Words that end in "s" but are not plurals (or must stay plural to match)
+NON_PLURALS = {
+    "hummus", "couscous", "asparagus", "swiss", "molasses", "grits", "fries",
+    "oats", "brussels", "chips", "nachos", "greens", "bass", "watercress",
+}
+
+# Dropped entirely - they never change which food is meant
+STOP_WORDS = {"a", "an", "the", "some", "of", "my", "few", "bit", "little"}
+
+# Known food words used for light spell correction
+FOOD_VOCABULARY = {
+    "apple", "avocado", "bacon", "bagel", "banana", "barley", "bean", "beef", "berry",
+    "biscuit", "blueberry", "bread", "breast", "broccoli", "brownie", "burger", "burrito",
+    "butter", "cabbage", "cake", "carrot", "cauliflower", "cereal", "cheese", "cheddar",
+    "cherry", "chicken", "chickpea", "chocolate", "cinnamon", "coffee", "cookie", "corn",
+    "cracker", "cream", "croissant", "cucumber", "curry", "doughnut", "eggplant", "french",
+    "fried", "grilled", "granola", "grape", "hamburger", "honey", "juice", "lasagna",
+    "lemon", "lettuce", "macaroni", "mango", "milk", "muffin", "mushroom", "noodle",
+    "oatmeal", "omelet", "onion", "orange", "pancake", "pasta", "peanut", "pepper",
+    "pineapple", "pizza", "popcorn", "pork", "potato", "pretzel", "pumpkin", "quinoa",
+    "raspberry", "salad", "salmon", "sandwich", "sausage", "scrambled", "shrimp",
+    "smoothie", "spaghetti", "spinach", "steak", "strawberry", "sugar", "sweet", "tomato",
+    "tortilla", "turkey", "vegetable", "waffle", "walnut", "watermelon", "whole", "wheat",
+    "yogurt", "zucchini", "almond", "cashew", "cappuccino", "espresso",
+    "boiled", "baked", "roasted", "steamed", "sauce", "salsa", "guacamole", "hummus",
+    "tuna", "cod", "tilapia", "lentil", "rice", "brown", "white", "toast", "egg",
+}
+
+# Real words that are close to a vocabulary word but mean something else
+# ("creamy" is not a typo of "cream"); spell correction leaves them alone
+KNOWN_WORDS = {
+    "creamy", "buttery", "chocolatey", "lemony", "cheesy", "crispy", "crunchy", "spicy", "fresh",
+    "frozen", "raw", "cooked", "smoked", "sliced", "diced", "chopped", "mashed", "whipped",
+    "toasted", "frosted", "buttered", "peppered", "broiled", "poached", "breaded", "battered",
+    "stuffed", "glazed", "iced", "creamed", "curried", "sauteed", "seared", "pickled", "marinated",
+    "dried", "canned", "salted", "unsalted", "sweetened", "unsweetened", "skim", "skimmed",
+    "lowfat", "nonfat", "greek", "plain", "vanilla", "caramel", "honeyed", "omelette",
+    "cheeseburger", "pepperoni", "peppermint", "buttermilk", "cornbread", "pancetta", "shortbread",
+    "cottage", "ricotta", "mozzarella", "parmesan", "granola", "muesli", "crepe", "scone",
+    "steamer", "brownie", "cupcake", "pastry", "custard", "pudding", "sorbet", "sherbet",
+}
+
+_PUNCTUATION = re.compile(r"[^a-z0-9\s-]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def singularize(word: str) -> str:
+    """Reduce a plural food word to its singular form using simple English rules."""
+    if word in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[word]
+    if word in NON_PLURALS or len(word) <= 3 or word.endswith(("ss", "us", "is")):
+        return word
+    if word.endswith("ies"):
+        return word[:-3] + "y"
+    if word.endswith("oes"):
+        return word[:-2]
+    if word.endswith(("ches", "shes", "xes", "sses")):
+        return word[:-2]
+    if word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def _correct_spelling(word: str) -> str:
+    """Snap near-miss spellings ("brocoli", "chiken") onto the known food vocabulary.
+
+    Only unknown words are touched, and never onto a word they merely extend
+    ("lemony" is not a typo of "lemon").
+    """
+    if len(word) < 5 or word in FOOD_VOCABULARY or word in KNOWN_WORDS or word in SYNONYMS:
+        return word
+    matches = difflib.get_close_matches(word, FOOD_VOCABULARY, n=1, cutoff=0.85)
+    if not matches or word.startswith(matches[0]):
+        return word
+    return matches[0]
+
+
+# Synonym phrases as token tuples, longest first so "garbanzo bean" wins over "garbanzo"
+_SYNONYM_PHRASES = sorted(
+    ((tuple(phrase.split()), replacement.split()) for phrase, replacement in SYNONYMS.items()),
+    key=lambda item: len(item[0]), reverse=True,
+)
+
+
+def _adds_qualifier(phrase: Tuple[str, ...], replacement: List[str]) -> bool:
+    """True when the replacement is the phrase with words in front ("fries" -> "french fries")."""
+    return tuple(replacement[-len(phrase):]) == phrase
+
+
+def _apply_synonyms(tokens: List[str]) -> List[str]:
+    """Replace whole-word synonym phrases with their canonical wording.
+
+    A synonym that only adds a qualifier ("fries" -> "french fries") applies to
+    the bare word alone: "sweet potato fries" already says which fries it is.
+    So do the ambiguous ones in WHOLE_NAME_SYNONYMS.
+    """
+    result: List[str] = []
+    i = 0
+    while i < len(tokens):
+        for phrase, replacement in _SYNONYM_PHRASES:
+            end = i + len(phrase)
+            if tuple(tokens[i:end]) != phrase:
+                continue
+            whole_name_only = _adds_qualifier(phrase, replacement) or " ".join(phrase) in WHOLE_NAME_SYNONYMS
+            if whole_name_only and len(tokens) > len(phrase):
+                continue
+            result.extend(replacement)
+            # "pbj sandwich": the replacement already ends with the next word
+            if end < len(tokens) and tokens[end] == replacement[-1]:
+                end += 1
+            i = end
+            break
+        else:
+            result.append(tokens[i])
+            i += 1
+    return result
+
+
+def _undo_inversion(name: str) -> str:
+    """"eggs, scrambled" -> "scrambled eggs"; names with more commas keep their order."""
+    parts = [part.strip() for part in name.split(",")]
+    if len(parts) == 2 and all(parts):
+        return f"{parts[1]} {parts[0]}"
+    return name.replace(",", " ")
+
+
+@lru_cache(maxsize=4096)
+def normalize_food_name(name: str) -> str:
+    """Canonical search phrase for a food: "Scrambled Eggs " -> "scrambled egg".
+
+    Lowercases, strips punctuation and articles, singularizes, applies the
+    synonym table and light spell correction. Word order is preserved, except
+    that a single "X, Y" inversion is read as "Y X".
+    """
+    text = _PUNCTUATION.sub(" ", _undo_inversion(name.lower().replace("&", " and ")))
+    tokens = [t for t in _WHITESPACE.split(text.strip()) if t and t not in STOP_WORDS]
+    tokens = [_correct_spelling(singularize(t)) for t in tokens]
+    tokens = _apply_synonyms(tokens)
+    return " ".join(tokens)
+
+
+def food_cache_key(name: str) -> str:
+    """Cache key for a food: "Scrambled Eggs" and "eggs, scrambled" share one entry.
+
+    Word order matters ("milk chocolate" is not "chocolate milk"), so this is
+    the normalized name itself.
+    """
+    return normalize_food_name(name)
@@ -150,6 +150,38 @@ def format_range_summary(
     return "\n".join(lines)
 
 
+_PROFILE_LABELS = {
+    "age": "your age",
+    "gender": "your gender (male/female)",
+    "weight_kg": "your weight (kg or lbs)",
+    "height_cm": "your height (cm or ft/in)",
+    "activity_level": "your activity level (sedentary / lightly active / moderately active / very active)",
+    "goal": "your goal (lose / maintain / gain weight)",
+}
+
+
+def format_onboarding_progress(profile: Dict[str, Any], missing: List[str]) -> str:
+    """Confirm the onboarding details collected so far and ask for the rest."""
+    known = []
+    if profile.get("age") is not None:
+        known.append(f"{profile['age']} years")
+    if profile.get("gender"):
+        known.append(profile["gender"])
+    if profile.get("weight_kg") is not None:
+        known.append(f"{_fmt(profile['weight_kg'], 1)} kg")
+    if profile.get("height_cm") is not None:
+        known.append(f"{_fmt(profile['height_cm'], 1)} cm")
+    if profile.get("activity_level"):
+        known.append(profile["activity_level"].replace("_", " "))
+    if profile.get("goal"):
+        known.append(profile["goal"].replace("_", " "))
+
+    lines = [f":memo: *Got it!* So far: {', '.join(known)}", "", "I still need:"]
+    lines += [f"{i}. {_PROFILE_LABELS[field].capitalize()}" for i, field in enumerate(missing, 1)]
+    lines += ["", "Send them all at once or one at a time."]
+    return "\n".join(lines)
+
+
 def create_progress_bar(current: float, goal: float, length: int = 10) -> str:
     if goal == 0:
         filled = 0
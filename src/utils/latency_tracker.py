@@ -0,0 +1,32 @@
+"""
+Latency Tracker - Rolling window of call durations with percentile lookups
+"""
+
+import threading
+from collections import deque
+from typing import Deque, Optional
+
+
+class LatencyTracker:
+    """Keeps the last `window_size` durations (seconds) for percentile queries."""
+
+    def __init__(self, window_size: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """The pct-th percentile (nearest rank), or None until min_samples are recorded."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+        return ordered[rank]
+
+    def __len__(self) -> int:
+        return len(self._samples)
@@ -0,0 +1,136 @@
+"""
+Match Ranker - Picks the most relevant USDA candidate for a food name
+
+USDA search order is tuned for its own search box, not for logging: "egg"
+can come back as "Bread, egg" or "Egg, whole, dried" ahead of "Egg, whole,
+raw, fresh". The ranker re-scores every returned candidate locally.
+"""
+
+import re
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from .food_normalizer import STOP_WORDS, normalize_food_name, singularize
+
+# Curated data sets describe generic foods; Branded entries are one product's label
+DATA_TYPE_BONUS = {
+    "Foundation": 0.10,
+    "SR Legacy": 0.08,
+    "Survey (FNDDS)": 0.06,
+    "Branded": 0.0,
+}
+
+# Preparation words: a mismatch means a somewhat different food ("egg, fried" vs "egg")
+PREPARATION_WORDS = {
+    "raw", "cooked", "boiled", "fried", "baked", "roasted", "grilled", "steamed",
+    "scrambled", "poached", "broiled", "braised", "stewed", "sauteed", "toasted",
+    "microwaved", "smoked", "pickled", "mashed", "breaded",
+}
+
+# Concentrated or processed forms whose per-100g values are far off the plain food
+CONCENTRATED_WORDS = {
+    "dried", "dry", "dehydrated", "powder", "powdered", "concentrate", "frozen", "canned",
+    "stabilized", "flour", "syrup", "infant", "baby", "babyfood",
+}
+
+# USDA category prefixes that come before the actual food ("Fish, salmon, ...")
+CATEGORY_PREFIXES = {"fish", "beverage", "cereal", "snack", "spice", "candy", "soup", "game meat"}
+
+# Connecting words in descriptions that carry no meaning for matching
+FILLER_WORDS = STOP_WORDS | {"and", "or", "with", "without", "only", "in", "not", "made", "from", "for"}
+
+TOKEN_WEIGHT = 0.55
+TRIGRAM_WEIGHT = 0.25
+HEAD_WEIGHT = 0.15
+PREPARATION_PENALTY = 0.08
+CONCENTRATED_PENALTY = 0.20
+# An extra word in the lead segment names a different dish ("Oatmeal cookie" vs "oatmeal")
+HEAD_EXTRA_PENALTY = 0.15
+EXTRA_TOKEN_PENALTY = 0.02
+
+_WORD = re.compile(r"[a-z]+")
+
+
+class _Description:
+    """Precomputed tokens for one USDA description, shared across queries."""
+
+    __slots__ = ("tokens", "head", "trigrams")
+
+    def __init__(self, description: str):
+        parts = [_tokenize(part) for part in description.lower().split(",")]
+        parts = [part for part in parts if part]
+        # USDA puts the food itself first: "Egg, whole, raw" vs "Bread, egg"
+        if len(parts) > 1 and " ".join(parts[0]) in CATEGORY_PREFIXES:
+            parts = parts[1:]
+        self.tokens: FrozenSet[str] = frozenset(t for part in parts for t in part)
+        self.head: FrozenSet[str] = frozenset(parts[0]) if parts else frozenset()
+        self.trigrams = _trigrams(" ".join(t for part in parts for t in part))
+
+
+def _tokenize(text: str) -> List[str]:
+    """Singular word tokens without filler. Deliberately no spell correction or synonyms:
+    USDA wording is already canonical, and "smooth" must not become "smoothie"."""
+    return [singularize(word) for word in _WORD.findall(text) if word not in FILLER_WORDS]
+
+
+def _matched_tokens(query_tokens: FrozenSet[str], desc_tokens: FrozenSet[str]) -> FrozenSet[str]:
+    """Description tokens the query asked for; "toast" also matches "toasted"."""
+    return frozenset(
+        t for t in desc_tokens
+        if t in query_tokens or t.endswith("ed") and (t[:-2] in query_tokens or t[:-1] in query_tokens)
+    )
+
+
+def _trigrams(text: str) -> FrozenSet[str]:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+@lru_cache(maxsize=8192)
+def _index_description(description: str) -> _Description:
+    return _Description(description)
+
+
+@lru_cache(maxsize=4096)
+def _index_query(query: str) -> Tuple[FrozenSet[str], FrozenSet[str]]:
+    tokens = _tokenize(normalize_food_name(query))
+    return frozenset(tokens), _trigrams(" ".join(tokens))
+
+
+def score_match(query: str, candidate: Dict[str, Any]) -> float:
+    """Relevance of one candidate to the query; higher is better (roughly 0-1)."""
+    query_tokens, query_trigrams = _index_query(query)
+    desc = _index_description(candidate.get("description", ""))
+    if not query_tokens or not desc.tokens:
+        return 0.0
+
+    matched = _matched_tokens(query_tokens, desc.tokens)
+    score = TOKEN_WEIGHT * min(len(matched), len(query_tokens)) / len(query_tokens)
+    score += TRIGRAM_WEIGHT * len(query_trigrams & desc.trigrams) / len(query_trigrams | desc.trigrams)
+    if matched & desc.head:
+        score += HEAD_WEIGHT
+    score -= HEAD_EXTRA_PENALTY * len(desc.head - matched - PREPARATION_WORDS - CONCENTRATED_WORDS)
+    score += DATA_TYPE_BONUS.get(candidate.get("data_type", ""), 0.0)
+
+    unrequested = desc.tokens - matched
+    score -= PREPARATION_PENALTY * len(unrequested & PREPARATION_WORDS)
+    score -= CONCENTRATED_PENALTY * len(unrequested & CONCENTRATED_WORDS)
+    # Prefer the plainest description among otherwise equal matches
+    score -= EXTRA_TOKEN_PENALTY * len(unrequested - desc.head - PREPARATION_WORDS - CONCENTRATED_WORDS)
+    return score
+
+
+def rank_matches(query: str, candidates: List[Dict[str, Any]]) -> List[Tuple[float, Dict[str, Any]]]:
+    """All candidates as (score, candidate), best first. Ties keep USDA's order."""
+    scored = [(score_match(query, candidate), candidate) for candidate in candidates]
+    return sorted(scored, key=lambda pair: pair[0], reverse=True)
+
+
+def best_match(query: str, candidates: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """The single most relevant candidate in one pass, or None if there are none."""
+    best, best_score = None, float("-inf")
+    for candidate in candidates:
+        score = score_match(query, candidate)
+        if score > best_score:
+            best, best_score = candidate, score
+    return best
@@ -0,0 +1,43 @@
+"""
+Message Text - Normalization and reference detection for user messages
+"""
+
+import re
+from typing import Dict, List, Optional
+
+# Leading phrases that never change which foods a message describes
+_LEADING_FILLER = re.compile(
+    r"^(?:(?:so|ok|okay|well|just|also)\s+)*(?:i\s+(?:just\s+)?(?:had|ate|have had|'ve had|drank)|"
+    r"i've\s+(?:just\s+)?had|just\s+(?:had|ate)|had|ate|drank)\s+"
+)
+_PUNCTUATION = re.compile(r"[^\w\s./'%-]")
+_WHITESPACE = re.compile(r"\s+")
+
+# Words that point back at something said earlier ("same as yesterday", "another one",
+# "make that 3") - the parse then depends on history, not just on the text
+REFERENTIAL_WORDS = {
+    "that", "it", "this", "those", "these", "them", "same", "again", "another",
+    "more", "other", "rest", "previous", "earlier", "before", "usual", "instead",
+    "also", "too", "yesterday", "last",
+}
+_WORD = re.compile(r"[a-z']+")
+
+
+def normalize_message(text: str) -> str:
+    """Canonical form of a message for caching: "I had 2 Eggs & toast!" -> "2 eggs and toast"."""
+    text = text.lower().replace("&", " and ").replace("’", "'")
+    text = _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", text)).strip(" .")
+    return _LEADING_FILLER.sub("", text).strip()
+
+
+def is_referential(message: str, history: Optional[List[Dict[str, str]]] = None) -> bool:
+    """True if the message refers back to earlier conversation ("another one", "same as before").
+
+    Such messages can't be answered from a text-keyed cache: the same words mean
+    different foods depending on what came before.
+    """
+    words = set(_WORD.findall(message.lower()))
+    if words & REFERENTIAL_WORDS:
+        return True
+    # A bare number or unit ("3", "2 cups") only makes sense as a reply to the bot
+    return bool(history) and len(words) <= 2 and any(ch.isdigit() for ch in message)
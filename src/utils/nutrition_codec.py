@@ -0,0 +1,138 @@
+"""
+Nutrition Codec - Compact, versioned encoding for cached USDA food records
+
+nutrition_cache rows used to hold the parsed JSON list as-is: every food
+repeated "description", "calories", "serving_unit"... as keys. The codec keeps
+only the fields the lookup pipeline reads, packs the nutrients as a fixed-layout
+integer vector, and the bytes go in the binary NutritionCache.packed column,
+so a DB hit is one unpack with no JSON parsing at all.
+
+Layout (version 1, little-endian), column-wise so decoding is one unpack
+for all numbers and one UTF-8 decode for all text:
+    B version, B kind (0 = list of foods, 1 = single food), H count
+    count x I   fdc_id
+    count x B   data type code
+    count x 6i  nutrients in hundredths (MISSING = not reported)
+    rest        UTF-8 text; per food "description US portions", foods joined
+                by RS, portions as "unit=grams" pairs joined by ";"
+
+Anything that isn't a food record (negative entries, other payloads) stays
+plain JSON in the data column. decode() reads that column: plain JSON passes
+through, and "nc1:<base64>" strings (what the first version of the codec wrote
+there) are unpacked, so old rows keep working.
+"""
+
+import base64
+import struct
+from functools import lru_cache
+from typing import Any, Dict, List
+
+CODEC_VERSION = 1
+PREFIX = f"nc{CODEC_VERSION}:"
+
+NUTRIENT_FIELDS = ("calories", "protein", "carbs", "fat", "fiber", "sugar")
+
+# dataType codes; 0 keeps room for "unknown"
+DATA_TYPES = ("", "Foundation", "SR Legacy", "Survey (FNDDS)", "Branded")
+_DATA_TYPE_CODES = {name: code for code, name in enumerate(DATA_TYPES)}
+
+_KIND_LIST = 0
+_KIND_SINGLE = 1
+
+MISSING = -(2 ** 31)
+
+_HEADER = struct.Struct("<BBH")
+_RS = "\x1e"  # between foods
+_US = "\x1f"  # between a description and its portions
+
+
+def _is_food(value: Any) -> bool:
+    return isinstance(value, dict) and value.get("fdc_id") is not None and "calories" in value
+
+
+def is_encodable(data: Any) -> bool:
+    """True for a food record or a non-empty list of them."""
+    if isinstance(data, list):
+        return bool(data) and all(_is_food(item) for item in data)
+    return _is_food(data)
+
+
+def is_encoded(data: Any) -> bool:
+    """True for a food record stored as an "nc1:" string in the JSON column."""
+    return isinstance(data, str) and data.startswith(PREFIX)
+
+
+@lru_cache(maxsize=64)
+def _layout(count: int) -> struct.Struct:
+    return struct.Struct(f"<{count}I{count}B{count * 6}i")
+
+
+def _clean(text: str) -> str:
+    return text.replace(_RS, " ").replace(_US, " ")
+
+
+def pack(data: Any) -> bytes:
+    """Pack a food record or list of them (see is_encodable) into bytes."""
+    if not is_encodable(data):
+        raise ValueError("Only food records can be packed")
+    foods = data if isinstance(data, list) else [data]
+    numbers: List[int] = [int(food["fdc_id"]) for food in foods]
+    numbers += [_DATA_TYPE_CODES.get(food.get("data_type", ""), 0) for food in foods]
+    for food in foods:
+        numbers += [MISSING if food.get(f) is None else int(round(food[f] * 100)) for f in NUTRIENT_FIELDS]
+    text = _RS.join(
+        _clean(str(food.get("description", "Unknown"))) + _US
+        + ";".join(f"{_clean(unit).replace('=', ' ').replace(';', ' ')}={grams:g}"
+                   for unit, grams in (food.get("portions") or {}).items())
+        for food in foods
+    )
+    header = _HEADER.pack(CODEC_VERSION, _KIND_LIST if isinstance(data, list) else _KIND_SINGLE, len(foods))
+    return header + _layout(len(foods)).pack(*numbers) + text.encode("utf-8")
+
+
+def decode(data: Any) -> Any:
+    """Value of a JSON-column row: "nc1:" strings are unpacked, plain JSON is passed through."""
+    if not is_encoded(data):
+        return data
+    return unpack(base64.b64decode(data[len(PREFIX):]))
+
+
+def unpack(buf: bytes) -> Any:
+    """Inverse of pack()."""
+    version, kind, count = _HEADER.unpack_from(buf, 0)
+    if version != CODEC_VERSION:
+        raise ValueError(f"Unsupported nutrition codec version {version}")
+    layout = _layout(count)
+    numbers = layout.unpack_from(buf, _HEADER.size)
+    texts = buf[_HEADER.size + layout.size:].decode("utf-8").split(_RS)
+
+    data_types = [DATA_TYPES[code] if code < len(DATA_TYPES) else "" for code in numbers[count:2 * count]]
+    nutrients = [value / 100 if value != MISSING else None for value in numbers[2 * count:]]
+    foods: List[Dict[str, Any]] = []
+    for i in range(count):
+        description, _, portion_text = texts[i].partition(_US)
+        calories, protein, carbs, fat, fiber, sugar = nutrients[6 * i:6 * i + 6]
+        food: Dict[str, Any] = {
+            "fdc_id": numbers[i],
+            "description": description,
+            "data_type": data_types[i],
+            "serving_size": 100,
+            "serving_unit": "g",
+            "calories": calories,
+            "protein": protein,
+            "carbs": carbs,
+            "fat": fat,
+            "fiber": fiber,
+            "sugar": sugar,
+        }
+        if None in (calories, protein, carbs, fat, fiber, sugar):
+            # Nutrients USDA didn't report stay absent, as in the parsed record
+            food = {key: value for key, value in food.items() if value is not None}
+        portions = {}
+        if portion_text:
+            for pair in portion_text.split(";"):
+                unit, _, grams = pair.partition("=")
+                portions[unit] = float(grams)
+        food["portions"] = portions
+        foods.append(food)
+    return foods if kind == _KIND_LIST else foods[0]
@@ -0,0 +1,199 @@
+"""
+Profile Extractor - Reads onboarding details (age, weight, height...) from a message locally
+
+Covers the usual answers: "30 male 75kg 175cm moderately active lose weight",
+"25 f 140 lbs 5'6\" sedentary maintain", or one detail at a time ("I'm 30").
+Only what is clearly there is returned; whatever is left over is reported so
+the caller can decide whether Gemini is worth asking about the rest.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+REQUIRED_FIELDS = ("age", "gender", "weight_kg", "height_cm", "activity_level", "goal")
+
+LBS_TO_KG = 0.453592
+INCH_TO_CM = 2.54
+
+# Plausible ranges; anything outside is treated as a misread
+AGE_RANGE = (13, 100)
+WEIGHT_KG_RANGE = (30, 300)
+HEIGHT_CM_RANGE = (100, 250)
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_KG = r"(?:kg|kgs|kilos?|kilograms?)"
+_LBS = r"(?:lbs?|pounds?)"
+
+_WEIGHT_PATTERNS = (
+    (re.compile(_NUMBER + r"\s*" + _KG + r"\b"), 1.0),
+    (re.compile(_NUMBER + r"\s*" + _LBS + r"\b"), LBS_TO_KG),
+)
+# "I weigh 180" could be kg or lbs; the number is left for Gemini rather than guessed
+_UNITLESS_WEIGHT = re.compile(r"\bweigh(?:t|s)?(?:\s+is)?[:\s]+" + _NUMBER + r"\b(?!\s*(?:" + _KG + "|" + _LBS + r")\b)")
+# Amounts to lose/gain or a goal weight ("lose 20 lbs", "my goal is 65kg") are not the current
+# weight; the number and its unit are dropped and the goal word is kept
+_TARGET_AMOUNT = re.compile(
+    r"\b(lose|losing|lost|gain|gaining|drop|cut|goal(?:\s+weight)?(?:\s+is)?|target(?:\s+weight)?(?:\s+is)?"
+    r"|get(?:\s+down|\s+up)?\s+to|reach)\s+(?:another\s+|about\s+|around\s+)?"
+    + _NUMBER + r"\s*(?:" + _KG + "|" + _LBS + r")?\b"
+)
+_FEET_INCHES = re.compile(r"\b(\d)\s*(?:'|ft|feet|foot)\s*(?:(\d{1,2}(?:\.\d+)?)\s*(?:\"|''|in|inches|inch)?)?")
+_HEIGHT_PATTERNS = (
+    (re.compile(_NUMBER + r"\s*(?:cm|cms|centimet(?:er|re)s?)\b"), 1.0),
+    (re.compile(r"\b(\d\.\d{1,2})\s*(?:m|meters?|metres?)\b"), 100.0),
+    (re.compile(_NUMBER + r"\s*(?:in|inches)\b"), INCH_TO_CM),
+    (re.compile(r"\bheight(?:\s+is)?[:\s]+" + _NUMBER + r"\b"), 1.0),
+)
+_AGE_PATTERNS = (
+    re.compile(r"\b(\d{1,3})\s*(?:years?|yrs?|y/?o|yo)\b(?:\s*old)?"),
+    re.compile(r"\bage[:\s]+(\d{1,3})\b"),
+)
+
+_GENDER = re.compile(r"(?<![\w'])(male|female|man|woman|guy|girl|boy|m|f)(?![\w'])")
+_GENDERS = {"male": "male", "man": "male", "guy": "male", "boy": "male", "m": "male",
+            "female": "female", "woman": "female", "girl": "female", "f": "female"}
+
+# Checked in order, so "very active" wins over a bare "active"
+_ACTIVITY = (
+    (re.compile(r"\b(?:very|extremely|super|highly)\s+active\b|\bathlete\b"), "very_active"),
+    (re.compile(r"\bmoderately?\s+active\b|\bmoderate(?:ly)?\b"), "moderately_active"),
+    (re.compile(r"\blight(?:ly)?\s+active\b|\blightly\b|\blight\b"), "lightly_active"),
+    (re.compile(r"\bsedentary\b|\bnot\s+(?:very\s+)?active\b|\binactive\b|\bdesk\s+job\b"), "sedentary"),
+    (re.compile(r"\bactive\b"), "moderately_active"),
+)
+ACTIVITY_LEVELS = ("sedentary", "lightly_active", "moderately_active", "very_active")
+GOALS = ("lose_weight", "maintain_weight", "gain_weight")
+
+_GOAL = (
+    (re.compile(r"\b(?:lose|losing|lost|cut|cutting|drop)\b(?:\s+(?:some\s+)?weight)?|\bweight\s+loss\b"), "lose_weight"),
+    (re.compile(r"\b(?:gain|gaining|bulk|bulking|build\s+muscle)\b(?:\s+(?:some\s+)?weight)?"), "gain_weight"),
+    (re.compile(r"\b(?:maintain|maintaining|maintenance|stay\s+the\s+same)\b(?:\s+(?:my\s+)?weight)?"), "maintain_weight"),
+)
+_NUMERIC_FIELDS = {"age": AGE_RANGE, "weight_kg": WEIGHT_KG_RANGE, "height_cm": HEIGHT_CM_RANGE}
+# Not followed by a unit: "20 lbs" left over after the patterns above is no age
+_BARE_NUMBER = re.compile(
+    r"\b" + _NUMBER + r"\b(?!\s*(?:" + _KG + "|" + _LBS + r"|cm|cms|in|inches|ft|feet|foot|m|meters?|metres?|'|\")\b)"
+)
+
+# Words that carry no profile information
+FILLER_WORDS = {
+    "i", "im", "i'm", "am", "a", "an", "and", "the", "my", "is", "to", "want", "would", "like",
+    "years", "old", "weight", "height", "weigh", "tall", "age", "gender", "activity", "level",
+    "goal", "me", "about", "around", "currently", "its", "it's", "i'd", "of", "so", "yes", "ok",
+    "okay", "please", "thanks", "also", "with", "be", "hi", "hello", "hey", "there", "sure",
+    "start", "let's", "go", "ready",
+}
+_WORD = re.compile(r"[a-z']+")
+
+
+def _in_range(value: float, bounds: Tuple[float, float]) -> bool:
+    return bounds[0] <= value <= bounds[1]
+
+
+def _take(pattern: "re.Pattern[str]", text: str) -> Tuple[Optional["re.Match[str]"], str]:
+    """First match of `pattern` and the text with that match blanked out."""
+    match = pattern.search(text)
+    if not match:
+        return None, text
+    return match, text[:match.start()] + " " + text[match.end():]
+
+
+def extract_profile(message: str, missing: Optional[List[str]] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """Profile fields found in `message`, plus the leftover words nothing explained.
+
+    `missing` lists the fields still needed; a bare number ("75") is only
+    attributed to an outstanding field whose plausible range it fits.
+    """
+    text = message.lower().replace("’", "'")
+    found: Dict[str, Any] = {}
+    unplaced: List[str] = []
+
+    text = _TARGET_AMOUNT.sub(lambda m: m.group(1), text)
+    match, rest = _take(_UNITLESS_WEIGHT, text)
+    if match:
+        unplaced.append(match.group(1))
+        text = rest
+
+    for pattern, factor in _WEIGHT_PATTERNS:
+        match, rest = _take(pattern, text)
+        if match and _in_range(float(match.group(1)) * factor, WEIGHT_KG_RANGE):
+            found["weight_kg"] = round(float(match.group(1)) * factor, 1)
+            text = rest
+            break
+
+    match, rest = _take(_FEET_INCHES, text)
+    if match:
+        height = (int(match.group(1)) * 12 + float(match.group(2) or 0)) * INCH_TO_CM
+        if _in_range(height, HEIGHT_CM_RANGE):
+            found["height_cm"] = round(height, 1)
+            text = rest
+    if "height_cm" not in found:
+        for pattern, factor in _HEIGHT_PATTERNS:
+            match, rest = _take(pattern, text)
+            if match and _in_range(float(match.group(1)) * factor, HEIGHT_CM_RANGE):
+                found["height_cm"] = round(float(match.group(1)) * factor, 1)
+                text = rest
+                break
+
+    for pattern in _AGE_PATTERNS:
+        match, rest = _take(pattern, text)
+        if match and _in_range(int(match.group(1)), AGE_RANGE):
+            found["age"] = int(match.group(1))
+            text = rest
+            break
+
+    for patterns, field in ((_ACTIVITY, "activity_level"), (_GOAL, "goal")):
+        for pattern, value in patterns:
+            match, rest = _take(pattern, text)
+            if match:
+                found[field] = value
+                text = rest
+                break
+
+    match, rest = _take(_GENDER, text)
+    if match:
+        found["gender"] = _GENDERS[match.group(1)]
+        text = rest
+
+    # Bare numbers: in a full answer the first one is the age ("30 male 75kg"); in a
+    # step-by-step reply it answers the one outstanding field whose range it fits
+    outstanding = [f for f in (missing or REQUIRED_FIELDS) if f not in found]
+    for match in list(_BARE_NUMBER.finditer(text)):
+        value = float(match.group(1))
+        fits = [f for f, bounds in _NUMERIC_FIELDS.items() if f in outstanding and _in_range(value, bounds)]
+        if len(fits) > 1 and "age" in fits:
+            fits = ["age"]
+        if len(fits) != 1:
+            continue
+        field = fits[0]
+        found[field] = int(value) if field == "age" else value
+        outstanding.remove(field)
+        text = text.replace(match.group(0), " ", 1)
+
+    leftover = unplaced + [w for w in _WORD.findall(text) if w not in FILLER_WORDS]
+    return found, leftover
+
+
+def clean_profile(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep only valid, in-range values from an untrusted profile dict (e.g. an LLM's answer)."""
+    cleaned: Dict[str, Any] = {}
+    for field, bounds in _NUMERIC_FIELDS.items():
+        try:
+            value = float(data.get(field))
+        except (TypeError, ValueError):
+            continue
+        if _in_range(value, bounds):
+            cleaned[field] = int(value) if field == "age" else round(value, 1)
+    gender = str(data.get("gender") or "").lower()
+    if gender in _GENDERS:
+        cleaned["gender"] = _GENDERS[gender]
+    if data.get("activity_level") in ACTIVITY_LEVELS:
+        cleaned["activity_level"] = data["activity_level"]
+    if data.get("goal") in GOALS:
+        cleaned["goal"] = data["goal"]
+    return cleaned
+
+
+def missing_fields(profile: Dict[str, Any]) -> List[str]:
+    """Required onboarding fields not yet known."""
+    return [field for field in REQUIRED_FIELDS if profile.get(field) is None]
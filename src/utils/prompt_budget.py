@@ -0,0 +1,165 @@
+"""
+Prompt Budget - Sizing and trimming what goes into a Gemini prompt
+
+Conversation history is only worth its tokens when the message points back at
+it ("same as yesterday", "make that 3"). For those messages the history is
+stripped of bot formatting (Slack emoji, progress bars, markdown), the last
+turns are kept and older ones are summarized, all within a token budget.
+TokenUsage keeps per-call-type counts so the savings show up in stats.
+"""
+
+import math
+import re
+import threading
+from typing import Any, Dict, List, Optional
+
+from .message_text import is_referential
+
+# Rough size of a Gemini token for English text; good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# What AIService used to inject: every history message, cut to 200 chars
+LEGACY_HISTORY_CHARS = 200
+
+RECENT_TURN_CHARS = 160
+SUMMARY_TURN_CHARS = 60
+
+_SHORTCODE = re.compile(r":[a-z0-9_+\-]+:")
+_EMOJI = re.compile("[\U0001F000-\U0001FAFF\u2580-\u259F\u2600-\u27BF\u2B00-\u2BFF\uFE0F\u200D]")
+_MARKDOWN = re.compile(r"[*_~`>]+")
+_BULLET = re.compile(r"^\s*(?:[-\u2022]|\d+[.)])\s+", re.MULTILINE)
+_SPACES = re.compile(r"[ \t]+")
+_WORD = re.compile(r"[a-z']+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text`."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def strip_bot_formatting(text: str) -> str:
+    """Plain one-line text from a Slack-formatted bot reply."""
+    text = _EMOJI.sub(" ", _SHORTCODE.sub(" ", text))
+    text = _BULLET.sub("", _MARKDOWN.sub("", text))
+    lines = [_SPACES.sub(" ", line).strip() for line in text.splitlines()]
+    return "; ".join(line for line in lines if line)
+
+
+def _shorten(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return text[:max(0, limit - 3)].rstrip() + "..."
+
+
+def needs_history(message: str, history: Optional[List[Dict[str, str]]]) -> bool:
+    """True if the message can't be understood without the conversation so far."""
+    if not history:
+        return False
+    if is_referential(message, history):
+        return True
+    # A short answer ("two", "yes, lunch") to a question the bot just asked
+    last = history[-1]
+    return last["role"] != "user" and last["content"].rstrip().endswith("?") and len(_WORD.findall(message.lower())) <= 3
+
+
+def compress_history(history: Optional[List[Dict[str, str]]], max_tokens: int, recent_turns: int = 2) -> str:
+    """History as a prompt block: the last `recent_turns` kept, older user turns summarized.
+
+    Lines are dropped oldest-first (the summary goes first) until the block fits
+    `max_tokens`; the latest turn is cut down rather than dropped.
+    """
+    if not history or max_tokens <= 0:
+        return ""
+    turns = [
+        (msg["role"], strip_bot_formatting(msg["content"]) if msg["role"] != "user" else " ".join(msg["content"].split()))
+        for msg in history
+    ]
+    turns = [(role, content) for role, content in turns if content]
+    if not turns:
+        return ""
+    recent_turns = max(1, recent_turns)
+    older, recent = turns[:-recent_turns], turns[-recent_turns:]
+
+    lines = []
+    earlier = [_shorten(content, SUMMARY_TURN_CHARS) for role, content in older if role == "user"]
+    if earlier:
+        lines.append("  Earlier the user said: " + "; ".join(f'"{text}"' for text in earlier))
+    for role, content in recent:
+        lines.append(f"  {'User' if role == 'user' else 'Bot'}: {_shorten(content, RECENT_TURN_CHARS)}")
+
+    header = "Recent conversation:"
+    while len(lines) > 1 and estimate_tokens("\n".join([header] + lines)) > max_tokens:
+        lines.pop(0)
+    room = max_tokens * CHARS_PER_TOKEN - len(header) - 1
+    if len(lines[0]) > room:
+        lines[0] = _shorten(lines[0], room)
+    return "\n".join([header] + lines)
+
+
+def history_for_prompt(message: str, history: Optional[List[Dict[str, str]]],
+                       max_tokens: int, recent_turns: int = 2) -> str:
+    """The history block to put in a prompt about `message` ("" when it isn't needed)."""
+    if not needs_history(message, history):
+        return ""
+    return compress_history(history, max_tokens, recent_turns)
+
+
+def legacy_history_tokens(history: Optional[List[Dict[str, str]]]) -> int:
+    """Tokens the uncompressed history block (every message, 200 chars each) would have cost."""
+    if not history:
+        return 0
+    text = "Recent conversation:\n" + "\n".join(f"  User: {msg['content'][:LEGACY_HISTORY_CHARS]}" for msg in history)
+    return estimate_tokens(text)
+
+
+def message_tokens(messages: Any) -> int:
+    """Approximate prompt size of a chat-model input (a string or a list of messages)."""
+    if isinstance(messages, str):
+        return estimate_tokens(messages)
+    return sum(estimate_tokens(str(getattr(msg, "content", msg))) for msg in messages)
+
+
+class TokenUsage:
+    """Token and latency totals per label: a call type ("detect_intent", "parse_food", ...) or a model tier."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_intent: Dict[str, Dict[str, float]] = {}
+
+    def _entry(self, intent: str) -> Dict[str, float]:
+        return self._by_intent.setdefault(intent, {
+            "calls": 0, "prompt_tokens": 0, "output_tokens": 0, "history_tokens": 0,
+            "history_tokens_saved": 0, "escalations": 0, "seconds": 0.0,
+        })
+
+    def record_history(self, intent: str, used: int, legacy: int) -> None:
+        with self._lock:
+            entry = self._entry(intent)
+            entry["history_tokens"] += used
+            entry["history_tokens_saved"] += max(0, legacy - used)
+
+    def record_escalation(self, intent: str) -> None:
+        with self._lock:
+            self._entry(intent)["escalations"] += 1
+
+    def record_call(self, intent: str, prompt_tokens: int, output_tokens: int, seconds: float) -> None:
+        with self._lock:
+            entry = self._entry(intent)
+            entry["calls"] += 1
+            entry["prompt_tokens"] += prompt_tokens
+            entry["output_tokens"] += output_tokens
+            entry["seconds"] += seconds
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Totals per call type, with average prompt tokens and latency per call."""
+        with self._lock:
+            result = {}
+            for intent, entry in self._by_intent.items():
+                calls = entry["calls"]
+                result[intent] = dict(
+                    entry,
+                    seconds=round(entry["seconds"], 3),
+                    avg_prompt_tokens=round(entry["prompt_tokens"] / calls, 1) if calls else None,
+                    avg_seconds=round(entry["seconds"] / calls, 3) if calls else None,
+                )
+            return result
@@ -0,0 +1,130 @@
+"""
+Request Governor - Process-wide concurrency and requests-per-minute limit for an LLM API
+
+One governor is shared by every caller, sync or async. Callers over either
+limit queue until a slot frees up instead of getting an error, and the time
+they spent queued is tracked so it shows up in stats.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional
+
+from .latency_tracker import LatencyTracker
+
+WINDOW_SECONDS = 60.0
+
+# How often async waiters re-check for a free slot (they can't block on the thread condition)
+ASYNC_POLL_SECONDS = 0.05
+
+
+class RequestGovernor:
+    """At most `max_concurrent` calls in flight and `requests_per_minute` started per rolling minute."""
+
+    def __init__(self, max_concurrent: int, requests_per_minute: int, window_seconds: float = WINDOW_SECONDS):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.requests_per_minute = max(1, int(requests_per_minute))
+        self.window_seconds = window_seconds
+        self._started: Deque[float] = deque()
+        self._active = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+        self._queue_wait = LatencyTracker(window_size=500, min_samples=1)
+        self.acquired = 0
+        self.queued = 0
+
+    def _try_acquire(self, now: float) -> Optional[float]:
+        """Take a slot if both limits allow (returns 0), else the seconds to wait (None = until a release)."""
+        while self._started and now - self._started[0] >= self.window_seconds:
+            self._started.popleft()
+        if self._active >= self.max_concurrent:
+            return None
+        if len(self._started) >= self.requests_per_minute:
+            return self._started[0] + self.window_seconds - now
+        self._active += 1
+        self._started.append(now)
+        self.acquired += 1
+        return 0.0
+
+    def _record_wait(self, seconds: float) -> None:
+        if seconds > 0.001:
+            self.queued += 1
+        self._queue_wait.record(seconds)
+
+    def acquire(self) -> float:
+        """Block until a slot is free. Returns the seconds spent queued."""
+        start = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    wait = self._try_acquire(time.monotonic())
+                    if wait == 0:
+                        break
+                    self._cond.wait(wait)
+            finally:
+                self._waiting -= 1
+            waited = time.monotonic() - start
+            self._record_wait(waited)
+        return waited
+
+    async def acquire_async(self) -> float:
+        """Wait (without blocking the event loop) until a slot is free. Returns the seconds spent queued."""
+        start = time.monotonic()
+        with self._cond:
+            self._waiting += 1
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(time.monotonic())
+                if wait == 0:
+                    break
+                await asyncio.sleep(ASYNC_POLL_SECONDS if wait is None else min(wait, ASYNC_POLL_SECONDS * 10))
+        finally:
+            with self._cond:
+                self._waiting -= 1
+        waited = time.monotonic() - start
+        with self._cond:
+            self._record_wait(waited)
+        return waited
+
+    def release(self) -> None:
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self) -> Iterator[float]:
+        """`with governor.slot() as waited:` - hold a slot for one call."""
+        waited = self.acquire()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def slot_async(self) -> AsyncIterator[float]:
+        """`async with governor.slot_async() as waited:` - hold a slot for one call."""
+        waited = await self.acquire_async()
+        try:
+            yield waited
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Slots in use, callers queued right now, and how long callers have waited."""
+        with self._cond:
+            now = time.monotonic()
+            recent = sum(1 for started in self._started if now - started < self.window_seconds)
+            return {
+                "in_flight": self._active,
+                "waiting": self._waiting,
+                "started_last_minute": recent,
+                "acquired": self.acquired,
+                "queued": self.queued,
+                "queue_wait_p50": self._queue_wait.percentile(50),
+                "queue_wait_p95": self._queue_wait.percentile(95),
+            }
@@ -0,0 +1,233 @@
+"""
+Rule Parser - Deterministic parsing of simple food messages
+
+Handles the common shapes ("2 eggs and toast", "a banana", "200g chicken
+breast for lunch") without an LLM call: items are split on conjunctions, and
+each is read as [quantity] [unit] [of] name using the unit vocabulary in
+units.py. Every parse carries a 0-1 confidence score; anything unusual
+(hedging words, long names, no known food word, questions, references to
+earlier messages)
+scores low so the caller can hand the message to Gemini instead.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .food_normalizer import FOOD_VOCABULARY, SYNONYMS, singularize
+from .message_text import normalize_message
+from .units import UNIT_ALIASES, WEIGHT_UNITS, canonical_unit
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+    "half": 0.5, "dozen": 12, "couple": 2,
+}
+
+MEAL_PATTERN = re.compile(
+    r"\b(?:for|at|with|during|as(?: an?)?)\s+(?:my\s+)?(breakfast|brunch|lunch|dinner|supper|snack|dessert)\b"
+    r"|^(breakfast|brunch|lunch|dinner|supper|snack)\s*[:\-]\s*"
+)
+MEAL_TYPES = {"brunch": "breakfast", "supper": "dinner", "dessert": "snack"}
+
+# Dish names containing a conjunction, protected from item splitting
+COMPOUND_FOODS = (
+    "mac and cheese", "macaroni and cheese", "fish and chips", "peanut butter and jelly",
+    "bread and butter", "rice and beans", "chips and salsa", "chips and guacamole",
+    "eggs and bacon", "biscuits and gravy", "shrimp and grits", "sweet and sour",
+    "chicken and waffles", "bangers and mash", "cookies and cream", "salt and vinegar",
+)
+_SEPARATORS = re.compile(r"\s*(?:,|;|\+|\n|\band\b|\bplus\b)\s*")
+_AMOUNT = re.compile(r"^(\d+(?:\.\d+)?)(?:\s*/\s*(\d+))?([a-z]+)?$")
+
+# Words that turn a "food" into something else: questions, commands, other intents
+NON_FOOD_WORDS = {
+    "how", "what", "when", "why", "which", "who", "where", "can", "could", "should", "would",
+    "is", "are", "was", "were", "do", "does", "did", "my", "me", "i", "you", "your", "we",
+    "calorie", "calories", "goal", "today", "week", "delete", "remove", "update", "change",
+    "log", "set", "show", "help", "thanks", "thank", "please", "actually", "not", "no", "yes",
+    "am", "pm", "oclock", "hour", "hours", "minute", "minutes",
+}
+
+# Units that are never a food on their own: "2 cups" names no food, while "2 eggs" does
+MEASURE_UNITS = WEIGHT_UNITS | {
+    "cup", "tbsp", "tsp", "bowl", "plate", "glass", "small", "medium", "large", "standard",
+    "regular", "piece", "slice", "bite", "scoop", "handful", "serving", "portion",
+}
+
+# Words that mean the amount or the item is fuzzy; Gemini reads these better
+HEDGE_WORDS = {
+    "some", "few", "bit", "little", "lot", "lots", "bunch", "with", "without", "extra",
+    "leftover", "leftovers", "like", "maybe", "about", "around", "approx", "mostly",
+    "homemade", "quarter", "big", "huge", "tiny",
+}
+
+# Dishes default to a serving, drinks to a cup, bread-like foods to a slice;
+# everything else counts pieces
+DRINKS = {"coffee", "tea", "latte", "cappuccino", "espresso", "juice", "milk", "soda", "smoothie",
+          "beer", "wine", "water", "lemonade", "kombucha", "shake", "cola", "coke"}
+SLICED = {"toast", "bread", "pizza", "cake", "pie", "cheesecake", "watermelon"}
+
+MAX_NAME_WORDS = 4
+
+# "a question", "10 pushups", "two options" read like foods; a name with none of these
+# words is scored below the default RULE_PARSER_MIN_CONFIDENCE so Gemini decides
+FOOD_WORDS = (
+    FOOD_VOCABULARY | DRINKS | SLICED
+    | {word for phrase in SYNONYMS for word in phrase.split()}
+    | {word for dish in COMPOUND_FOODS for word in dish.split() if word != "and"}
+    | {unit for unit in UNIT_ALIASES.values() if unit not in MEASURE_UNITS}
+)
+UNKNOWN_FOOD_FACTOR = 0.8
+
+
+def _meal_type(text: str) -> Tuple[str, Optional[str]]:
+    """Remove a meal phrase ("for lunch", "breakfast:") and return (text, meal type)."""
+    match = MEAL_PATTERN.search(text)
+    if not match:
+        return text, None
+    meal = match.group(1) or match.group(2)
+    text = (text[:match.start()] + " " + text[match.end():]).strip()
+    return text, MEAL_TYPES.get(meal, meal)
+
+
+def _split_items(text: str) -> List[str]:
+    protected = {}
+    for i, name in enumerate(COMPOUND_FOODS):
+        if name in text:
+            token = f"compound{chr(ord('a') + i)}"
+            protected[token] = name
+            text = text.replace(name, token)
+    items = [item.strip() for item in _SEPARATORS.split(text) if item.strip()]
+    for token, name in protected.items():
+        items = [item.replace(token, name) for item in items]
+    return items
+
+
+def count_items(message: str) -> int:
+    """How many food items a message lists ("eggs, toast and coffee" -> 3), by its separators."""
+    text, _ = _meal_type(message.lower().replace("&", " and "))
+    return len(_split_items(text))
+
+
+def _read_quantity(words: List[str]) -> Tuple[Optional[float], Optional[str], List[str]]:
+    """Leading quantity (and a unit glued to it, as in "200g"), plus the remaining words."""
+    if not words:
+        return None, None, words
+    word = words[0]
+    match = _AMOUNT.match(word)
+    if match:
+        number, denominator, glued_unit = match.groups()
+        quantity = float(number) / float(denominator) if denominator else float(number)
+        if glued_unit and canonical_unit(glued_unit) not in UNIT_ALIASES.values():
+            return None, None, words
+        return quantity, canonical_unit(glued_unit) if glued_unit else None, words[1:]
+    if word in NUMBER_WORDS:
+        rest = words[1:]
+        quantity = float(NUMBER_WORDS[word])
+        if word in ("a", "an") and rest and rest[0] in ("couple", "dozen"):
+            quantity = float(NUMBER_WORDS[rest[0]])
+            rest = rest[1:]
+        elif word == "half" and rest and rest[0] in ("a", "an"):
+            rest = rest[1:]
+        if rest and rest[0] == "of":
+            rest = rest[1:]
+        return quantity, None, rest
+    return None, None, words
+
+
+def _starts_compound(words: List[str]) -> bool:
+    text = " ".join(words)
+    return any(text == name or text.startswith(name + " ") for name in COMPOUND_FOODS)
+
+
+def parse_item(text: str, follows_count: bool = False) -> Tuple[Optional[Dict[str, Any]], float]:
+    """Parse one item ("2 slices of toast") into (food, confidence). Food is None if unreadable.
+
+    `follows_count` marks a bare item after a counted one ("2 eggs and toast"),
+    which reads as one of it.
+    """
+    words = normalize_message(text).split()
+    quantity, unit, words = _read_quantity(words)
+    score = 1.0
+
+    # "2 slices of toast" / "2 large eggs". A food-noun unit only counts as one before "of"
+    # ("3 strips of bacon"): "2 egg whites" and "3 tortilla chips" name the food, as does
+    # the first word of a dish ("eggs and bacon" is not bacon by the egg)
+    if unit is None and len(words) > 1 and not _starts_compound(words):
+        leading = canonical_unit(words[0])
+        if leading in MEASURE_UNITS or leading in UNIT_ALIASES.values() and words[1] == "of":
+            unit = leading
+            words = words[1:]
+    if words and words[0] == "of":
+        words = words[1:]
+
+    name = " ".join(words)
+    if not words or len(words) > MAX_NAME_WORDS or not all(w.replace("'", "").replace("-", "").isalpha() for w in words):
+        return None, 0.0
+    if set(words) & NON_FOOD_WORDS:
+        return None, 0.0
+    # "2 cups" names no food; "chips and salsa dip" is more than one protected dish
+    if len(words) == 1 and canonical_unit(words[0]) in MEASURE_UNITS:
+        return None, 0.0
+    if "and" in words and name not in COMPOUND_FOODS:
+        return None, 0.0
+    # "2 eggs and bacon": two eggs, or two plates of the dish? Leave it to Gemini
+    if quantity is not None and name in COMPOUND_FOODS and canonical_unit(words[0]) in UNIT_ALIASES.values():
+        score *= 0.5
+    if not any(singularize(word) in FOOD_WORDS or word in FOOD_WORDS for word in words):
+        score *= UNKNOWN_FOOD_FACTOR
+    if set(words) & HEDGE_WORDS:
+        score *= 0.5
+    if len(words) > 2:
+        score *= 0.9
+
+    if quantity is None:
+        # A bare noun: a single serving, but we're guessing the amount
+        quantity = 1.0
+        score *= 0.95 if follows_count else 0.7
+    if unit is None:
+        last = words[-1]
+        if name in COMPOUND_FOODS:
+            unit = "serving"
+        elif last in DRINKS:
+            unit = "cup"
+        elif last in SLICED:
+            unit = "slice"
+        else:
+            unit = "piece"
+
+    return {"name": name, "quantity": quantity, "unit": unit, "notes": ""}, score
+
+
+def parse_food_text(message: str) -> Optional[Dict[str, Any]]:
+    """Parse a simple food message without an LLM.
+
+    Returns a result shaped like AIService.parse_food_message plus "confidence_score"
+    (0-1), or None when the message doesn't read as a list of foods.
+    """
+    text = message.lower().strip()
+    if not text or "?" in text:
+        return None
+    text, meal_type = _meal_type(text.replace("&", " and "))
+    items = _split_items(text)
+    if not items:
+        return None
+
+    foods = []
+    scores = []
+    for position, item in enumerate(items):
+        food, score = parse_item(item, follows_count=position > 0 and scores[0] >= 0.9)
+        if food is None:
+            return None
+        food["meal_type"] = meal_type
+        foods.append(food)
+        scores.append(score)
+
+    confidence_score = round(min(scores), 2)
+    return {
+        "foods": foods,
+        "confidence": "high" if confidence_score >= 0.85 else "medium" if confidence_score >= 0.6 else "low",
+        "confidence_score": confidence_score,
+        "meal_type": meal_type,
+        "clarifications_needed": [],
+    }
@@ -0,0 +1,94 @@
+"""
+Token Bucket - Thread-safe blocking rate limiter for an outbound API quota
+"""
+
+import threading
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """Holds up to `capacity` tokens, refilled continuously at `refill_per_second`.
+
+    Sized as capacity=N, refill=N/3600 it models an "N requests per rolling hour"
+    API key. Unlike RateLimiter (which rejects), callers here wait for a token.
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+        self.acquired = 0
+        self.waited = 0
+        self.rejected = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def _wait_time(self, now: float) -> float:
+        """Seconds until a token can be handed out (0 if one is available now)."""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= 1:
+            return 0.0
+        if self.refill_per_second <= 0:
+            return float("inf")
+        return (1 - self._tokens) / self.refill_per_second
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Take one token, waiting up to `timeout` seconds (forever if None). False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        waited = False
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._wait_time(now)
+                if wait == 0:
+                    self._tokens -= 1
+                    self.acquired += 1
+                    if waited:
+                        self.waited += 1
+                    return True
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0 or wait > remaining:
+                        self.rejected += 1
+                        return False
+                    wait = min(wait, remaining)
+                waited = True
+                self._cond.wait(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for `seconds` (e.g. the API answered 429 with Retry-After)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def limit_to(self, remaining: float) -> None:
+        """Never report more tokens than the API itself says are left."""
+        with self._cond:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, max(0.0, float(remaining)))
+
+    def remaining(self) -> float:
+        with self._cond:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def stats(self) -> Dict[str, float]:
+        """Tokens left plus how many acquires succeeded, had to wait, or timed out."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "remaining": round(self._tokens, 2),
+                "capacity": self.capacity,
+                "paused_for": round(max(0.0, self._paused_until - now), 2),
+                "acquired": self.acquired,
+                "waited": self.waited,
+                "rejected": self.rejected,
+            }
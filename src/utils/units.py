@@ -0,0 +1,162 @@
+"""
+Units - Serving units to grams
+
+The generic table is compiled once at import. Food-specific portion weights
+from USDA (`foodPortions` / `foodMeasures`) take precedence when a food has
+them, so "1 cup of spinach" is 30g rather than the 240g of a cup of milk.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# canonical unit: (approximate grams per unit, aliases)
+_UNITS: Dict[str, Tuple[float, Tuple[str, ...]]] = {
+    # Weight-based units (exact)
+    "g": (1, ("gram", "grams", "gm", "gms")),
+    "kg": (1000, ("kilogram", "kilograms", "kgs")),
+    "oz": (28.35, ("ounce", "ounces")),
+    "lb": (453.592, ("pound", "pounds", "lbs")),
+    # Volume/portion units (approximate grams)
+    "cup": (240, ("cups",)),
+    "tbsp": (15, ("tablespoon", "tablespoons", "tbs")),
+    "tsp": (5, ("teaspoon", "teaspoons")),
+    "bowl": (300, ("bowls",)),
+    "plate": (300, ("plates",)),
+    "glass": (240, ("glasses",)),
+    # Size descriptors (grams per item)
+    "small": (80, ()),
+    "medium": (130, ()),
+    "large": (180, ()),
+    "standard": (100, ()),
+    "regular": (130, ()),
+    # Countable item units (grams per piece)
+    "piece": (30, ("pieces", "pc", "pcs")),
+    "slice": (30, ("slices",)),
+    "chip": (5, ("chips",)),
+    "nacho": (7, ("nachos",)),
+    "cracker": (5, ("crackers",)),
+    "cookie": (30, ("cookies",)),
+    "strip": (20, ("strips",)),
+    "nugget": (18, ("nuggets",)),
+    "wing": (30, ("wings",)),
+    "bite": (15, ("bites",)),
+    "scoop": (70, ("scoops",)),
+    "handful": (30, ("handfuls",)),
+    "bar": (50, ("bars",)),
+    "patty": (85, ("patties",)),
+    "fillet": (170, ("fillets",)),
+    "breast": (170, ("breasts",)),
+    "thigh": (115, ("thighs",)),
+    "drumstick": (75, ("drumsticks",)),
+    "egg": (50, ("eggs",)),
+    "wrap": (60, ("wraps",)),
+    "tortilla": (50, ("tortillas",)),
+    "roll": (50, ("rolls",)),
+    # "Serving" means 1 USDA standard portion (100g)
+    "serving": (100, ("servings",)),
+    "portion": (100, ("portions",)),
+}
+
+WEIGHT_UNITS = frozenset({"g", "kg", "oz", "lb"})
+
+UNIT_ALIASES: Dict[str, str] = {
+    alias: canonical for canonical, (_, aliases) in _UNITS.items() for alias in (canonical,) + aliases
+}
+UNIT_GRAMS: Dict[str, float] = {canonical: grams for canonical, (grams, _) in _UNITS.items()}
+
+# Units that just mean "one of it": use the food's own medium portion when USDA has one
+_COUNT_UNITS = frozenset({"piece", "whole", "item", "each", "unit"})
+
+# Measure texts that aren't a unit ("Quantity not specified", "NLEA serving" labelling terms)
+_IGNORED_MEASURES = frozenset({"quantity", "nlea", "guideline", "amount"})
+
+_AMOUNT = re.compile(r"^\s*(\d+(?:\.\d+)?)(?:\s*/\s*(\d+))?\s*")
+_MEASURE_WORD = re.compile(r"[a-z]+")
+
+
+def canonical_unit(unit: str) -> str:
+    """Canonical unit name: "Tablespoons" -> "tbsp", "slices" -> "slice"."""
+    key = unit.lower().strip().rstrip(".")
+    return UNIT_ALIASES.get(key, key)
+
+
+def grams_per_unit(unit: str, portions: Optional[Dict[str, float]] = None) -> Optional[float]:
+    """Grams in one `unit`, preferring the food's own portion table. None if unknown."""
+    key = canonical_unit(unit)
+    if portions and key not in WEIGHT_UNITS:
+        grams = portions.get(key)
+        if grams is None and key in _COUNT_UNITS:
+            grams = portions.get("medium")
+        if grams is not None:
+            return grams
+    return UNIT_GRAMS.get(key)
+
+
+def _portion_entry(text: str, gram_weight: Any, amount: Any = None,
+                   unit: str = "") -> Optional[Tuple[str, float]]:
+    """(unit, grams per 1 unit) from a USDA measure such as "1/2 cup, chopped" weighing 15g.
+
+    The unit comes from `unit` when USDA filled it in, otherwise from the first word of `text`.
+    """
+    try:
+        gram_weight = float(gram_weight)
+        amount = float(amount) if amount is not None else None
+    except (TypeError, ValueError):
+        return None
+
+    text = (text or "").lower()
+    match = _AMOUNT.match(text)
+    if amount is None and match:
+        amount = float(match.group(1)) / float(match.group(2) or 1)
+    if match:
+        text = text[match.end():]
+
+    if unit in ("", "undetermined"):
+        word = _MEASURE_WORD.search(text)
+        unit = word.group(0) if word else ""
+    if not unit or unit in _IGNORED_MEASURES or gram_weight <= 0:
+        return None
+    return canonical_unit(unit), round(gram_weight / (amount or 1.0), 2)
+
+
+def _portion_text(portion: Dict[str, Any]) -> str:
+    """Measure text of a foodPortions entry.
+
+    SR Legacy leaves measureUnit "undetermined" and puts "large" / "cup, chopped" in
+    `modifier`; FNDDS stores a numeric code there ("10205") and the text ("1 cup")
+    in `portionDescription`.
+    """
+    modifier = str(portion.get("modifier") or "")
+    if _MEASURE_WORD.search(modifier.lower()):
+        return modifier
+    return portion.get("portionDescription") or ""
+
+
+def parse_food_portions(food_data: Dict[str, Any]) -> Dict[str, float]:
+    """Per-unit gram weights from a raw USDA food record.
+
+    Reads `foodPortions` (food details endpoint) and `foodMeasures` (search
+    endpoint). The first measure listed for a unit wins.
+    """
+    entries: List[Optional[Tuple[str, float]]] = []
+
+    for portion in food_data.get("foodPortions") or []:
+        entries.append(_portion_entry(
+            _portion_text(portion),
+            portion.get("gramWeight"),
+            portion.get("amount"),
+            ((portion.get("measureUnit") or {}).get("name") or "").lower(),
+        ))
+
+    for measure in food_data.get("foodMeasures") or []:
+        entries.append(_portion_entry(
+            measure.get("disseminationText") or "",
+            measure.get("gramWeight"),
+            unit=(measure.get("measureUnitName") or "").lower(),
+        ))
+
+    portions: Dict[str, float] = {}
+    for entry in entries:
+        if entry and entry[0] not in WEIGHT_UNITS:
+            portions.setdefault(*entry)
+    return portions
@@ -38,6 +38,46 @@ class TestRouterAgent:
         result = agent.route("I had an apple", {"is_onboarded": False})
         assert result["intent"] == "onboarding_needed"
 
+    def test_keyword_miss_parses_foods_in_same_call(self, monkeypatch):
+        """Test a message keywords can't route gets its intent and foods from one Gemini call"""
+        agent = get_router_agent()
+        ai_service = agent.food_parser.ai_service
+        calls = []
+
+        def fake_combined(message, context=None, history=None):
+            calls.append(message)
+            return {"intent": "log_food", "confidence": "high", "entities": {},
+                    "foods": [{"name": "pho", "quantity": 1, "unit": "bowl"}]}
+
+        def unexpected(*args, **kwargs):
+            raise AssertionError("second Gemini call")
+
+        monkeypatch.setattr(ai_service, "detect_intent_and_parse", fake_combined)
+        monkeypatch.setattr(ai_service, "detect_intent", unexpected)
+        monkeypatch.setattr(ai_service, "parse_food_message", unexpected)
+        result = agent.route("a big bowl of pho with extra basil", {"is_onboarded": True})
+
+        assert result["intent"] == "log_food"
+        assert result["parsed"]["foods"][0]["name"] == "pho"
+        assert len(calls) == 1
+
+    def test_counted_non_food_reaches_gemini(self, monkeypatch):
+        """Test that "a/N <noun>" messages without a food word aren't logged without intent detection"""
+        agent = get_router_agent()
+        ai_service = agent.food_parser.ai_service
+        seen = []
+
+        def fake_combined(message, context=None, history=None):
+            seen.append(message)
+            return {"intent": "other", "confidence": "high", "entities": {}}
+
+        monkeypatch.setattr(ai_service, "detect_intent_and_parse", fake_combined)
+        monkeypatch.setattr(agent, "combined_parse", True)
+        messages = ["a question", "3 days", "10 pushups", "a nap", "two options"]
+
+        assert [agent.route(m, {"is_onboarded": True})["intent"] for m in messages] == ["other"] * 5
+        assert seen == messages
+
 
 class TestFoodParserAgent:
     """Test food parser agent functionality"""
@@ -59,6 +99,44 @@ class TestFoodParserAgent:
         assert len(result["foods"]) >= 2
         assert result["meal_type"] == "breakfast"
     
+    def test_repeated_message_served_from_cache(self, monkeypatch):
+        """Test that equivalent messages reuse one Gemini call and referential ones bypass the cache"""
+        init_db()
+        agent = get_food_parser_agent()
+        agent.parse_cache.clear()
+        calls = []
+
+        def fake_gemini(message, context=None, history=None):
+            calls.append(message)
+            return {"foods": [{"name": "coffee", "quantity": 1, "unit": "cup"}], "confidence": "high",
+                    "meal_type": "breakfast", "clarifications_needed": []}
+
+        monkeypatch.setattr(agent.ai_service, "parse_food_message", fake_gemini)
+        context = {"is_onboarded": True}
+
+        first = agent.parse("I had a black coffee with oat milk", context)
+        second = agent.parse("had a Black coffee with oat milk!", context)
+        agent.parse("another one", context, history=[{"role": "user", "content": "a black coffee"}])
+
+        assert first["foods"] == second["foods"]
+        assert second["original_message"] == "had a Black coffee with oat milk!"
+        assert calls == ["I had a black coffee with oat milk", "another one"]
+        assert agent.parse_cache.stats()["hits"] == 1
+        assert agent.parse_cache.stats()["bypassed"] == 1
+
+    def test_simple_message_parsed_without_gemini(self, monkeypatch):
+        """Test that a confident rule-based parse skips the Gemini call"""
+        agent = get_food_parser_agent()
+
+        def unexpected(*args, **kwargs):
+            raise AssertionError("Gemini called for a simple message")
+
+        monkeypatch.setattr(agent.ai_service, "parse_food_message", unexpected)
+        result = agent.parse("I had 2 eggs and a banana for lunch", {"is_onboarded": True})
+
+        assert [f["name"] for f in result["foods"]] == ["eggs", "banana"]
+        assert result["meal_type"] == "lunch"
+
     def test_validate_parsed_foods(self):
         """Test validation of parsed foods"""
         agent = get_food_parser_agent()
@@ -99,6 +177,90 @@ class TestNutritionAgent:
         assert "calories" in enriched[0]
         assert enriched[0]["calories"] > 0
     
+    def test_lookup_preserves_order_and_dedupes(self, monkeypatch):
+        """Test concurrent lookup keeps input order and searches each food once"""
+        agent = get_nutrition_agent()
+        searched = []
+
+        def fake_search(food_name):
+            searched.append(food_name)
+            return [{"fdc_id": len(food_name), "description": food_name, "calories": 100,
+                     "protein": 1, "carbs": 1, "fat": 1}]
+
+        monkeypatch.setattr(agent, "_search_usda", fake_search)
+        foods = [
+            {"name": "egg", "quantity": 2, "unit": "large"},
+            {"name": "toast", "quantity": 1, "unit": "slice"},
+            {"name": "egg", "quantity": 1, "unit": "large"},
+        ]
+
+        enriched = agent.lookup_nutrition(foods)
+
+        assert [f["name"] for f in enriched] == ["egg", "toast", "egg"]
+        assert enriched[0]["calories"] == 2 * enriched[2]["calories"]
+        assert sorted(searched) == ["egg", "toast"]
+    
+    def test_unmatched_foods_estimated_in_one_ai_call(self, monkeypatch):
+        """Test items USDA misses share one batched AI call and reuse cached estimates"""
+        import json
+        from types import SimpleNamespace
+        from src.services.ai_service import get_ai_service
+
+        init_db()
+        agent = get_nutrition_agent()
+        agent.usda_service.clear_cache()
+        prompts = []
+
+        class FakeModel:
+            def invoke(self, prompt):
+                prompts.append(prompt)
+                return SimpleNamespace(content=json.dumps([
+                    {"id": 0, "calories": 150, "protein": 5, "carbs": 20, "fat": 5, "grams": {"bowl": 250}},
+                    {"id": 1, "calories": 300, "protein": 10, "carbs": 30, "fat": 15, "grams": {"slices": 120}},
+                ]))
+
+        monkeypatch.setattr(agent, "_search_usda", lambda food_name: [])
+        monkeypatch.setattr(get_ai_service(), "chat_model", FakeModel())
+        foods = [
+            {"name": "grandma's stew", "quantity": 1, "unit": "bowl"},
+            {"name": "homemade lasagna", "quantity": 2, "unit": "slice"},
+        ]
+
+        enriched = agent.lookup_nutrition(foods)
+
+        assert len(prompts) == 1
+        assert [f["source"] for f in enriched] == ["ai_estimated", "ai_estimated"]
+        assert enriched[0]["calories"] == 375
+        assert enriched[1]["calories"] == 720
+
+        # A different quantity of a known food needs no new call
+        again = agent.lookup_nutrition([{"name": "homemade lasagna", "quantity": 1, "unit": "slice"}])
+        assert len(prompts) == 1
+        assert again[0]["calories"] == 360
+
+    def test_ai_estimates_with_unknown_ids_are_ignored(self, monkeypatch):
+        """Test that an estimate whose id isn't one of the listed foods is dropped, not misassigned"""
+        import json
+        from types import SimpleNamespace
+        from src.services.ai_service import get_ai_service
+
+        agent = get_nutrition_agent()
+        answer = json.dumps([
+            {"id": -1, "calories": 400},
+            {"id": 7, "calories": 500},
+            {"id": 0, "calories": 150},
+        ])
+        monkeypatch.setattr(get_ai_service(), "chat_model",
+                            SimpleNamespace(invoke=lambda prompt: SimpleNamespace(content=answer)))
+
+        estimates = agent._request_ai_estimates({
+            "stew": {"name": "stew", "units": []},
+            "lasagna": {"name": "lasagna", "units": []},
+        })
+
+        assert list(estimates) == ["stew"]
+        assert estimates["stew"]["calories"] == 150
+
     def test_calculate_totals(self):
         """Test calculating nutrition totals"""
         agent = get_nutrition_agent()
@@ -221,6 +383,64 @@ class TestStorageAgent:
         assert daily_totals["calories"] >= 95
 
 
+class TestOnboarding:
+    """Test step-by-step onboarding"""
+
+    def test_partial_answers_kept_across_messages(self, monkeypatch):
+        """Test that details are read locally and accumulated until the profile is complete"""
+        from src.agents.orchestrator import get_orchestrator
+        from src.services.ai_service import get_ai_service
+
+        init_db()
+        orchestrator = get_orchestrator()
+
+        def unexpected(*args, **kwargs):
+            raise AssertionError("Gemini called for a locally readable answer")
+
+        monkeypatch.setattr(get_ai_service(), "invoke", unexpected)
+
+        def send(message):
+            user = orchestrator.storage.get_or_create_user("TEST_ONBOARDING", "TEST_TEAM")
+            state = {"user_id": "TEST_ONBOARDING", "team_id": "TEST_TEAM", "message": message,
+                     "user_context": {"is_onboarded": user["is_onboarded"], "preferences": user["preferences"] or {}}}
+            return orchestrator._handle_onboarding(state)["response"]
+
+        assert "I still need" in send("I'm 30, male, 75kg")
+        assert "I still need" in send("5'9\" and moderately active")
+        assert "You're all set" in send("want to lose weight")
+
+        user = orchestrator.storage.get_or_create_user("TEST_ONBOARDING", "TEST_TEAM")
+        assert user["is_onboarded"]
+        assert user["age"] == 30 and user["height"] == 175.3
+        assert "onboarding_draft" not in (user["preferences"] or {})
+
+
+class TestOrchestrator:
+    """Test the conversation graph nodes"""
+
+    def test_empty_combined_parse_falls_back_to_parser(self, monkeypatch):
+        """Test that log_food with no foods from the combined call still gets a dedicated parse"""
+        from src.agents.orchestrator import get_orchestrator
+
+        orchestrator = get_orchestrator()
+        parses = []
+
+        def fake_parse(message, context=None, history=None):
+            parses.append(message)
+            return {"foods": [{"name": "pho", "quantity": 1, "unit": "bowl"}]}
+
+        monkeypatch.setattr(orchestrator.router, "route", lambda message, context, history=None: {
+            "intent": "log_food", "confidence": "high", "data": {}, "parsed": {"intent": "log_food", "foods": []}})
+        monkeypatch.setattr(orchestrator.food_parser, "parse", fake_parse)
+        state = {"message": "pho tai", "user_context": {"is_onboarded": True}, "history": [], "parsed_foods": None}
+
+        state = orchestrator._parse_food(orchestrator._route_intent(state))
+
+        assert parses == ["pho tai"]
+        assert state["parsed_foods"][0]["name"] == "pho"
+        assert state["intent"] == "log_food"
+
+
 def test_full_workflow():
     """Integration test for full food logging workflow"""
     init_db()
@@ -0,0 +1,454 @@
+"""
+Unit Tests for Services
+"""
+
+import json
+import time
+from datetime import datetime, timedelta
+
+import httpx
+import pytest
+
+from src.database.database import init_db, get_db_session
+from src.database.models import NutritionCache, User, FoodLog
+from src.services.cache_warmer import CacheWarmer
+from src.services.fdc_index import FDCIndex, build_index
+from src.services.nutrient_table import NutrientTable, foods_from_cache, write_table
+from src.services.usda_service import USDAQuotaExhausted, USDAService
+from src.utils import nutrition_codec
+
+
+SEARCH_PAYLOAD = {
+    "foods": [
+        {
+            "fdcId": 171287,
+            "description": "Egg, whole, raw, fresh",
+            "dataType": "SR Legacy",
+            "foodNutrients": [
+                {"nutrientId": 1008, "nutrientName": "Energy", "unitName": "KCAL", "value": 143},
+                {"nutrientId": 1003, "nutrientName": "Protein", "unitName": "G", "value": 12.56},
+                {"nutrientId": 1005, "nutrientName": "Carbohydrate, by difference", "unitName": "G", "value": 0.72},
+                {"nutrientId": 1004, "nutrientName": "Total lipid (fat)", "unitName": "G", "value": 9.51},
+            ],
+        }
+    ]
+}
+
+
+@pytest.fixture
+def usda_service():
+    """USDA service whose HTTP pool is backed by a mock transport that counts requests"""
+    service = USDAService()
+    service.requests_seen = []
+    service.payload = SEARCH_PAYLOAD
+    service.responses = []  # queued responses served before falling back to 200 + payload
+    service.delays = []  # per-request sleep in seconds, consumed in order
+    # Ignore any index/table built under data/; tests that need one inject a temporary file
+    service._local_index = None
+    service._nutrient_table = None
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        service.requests_seen.append(request)
+        if service.delays:
+            time.sleep(service.delays.pop(0))
+        if service.responses:
+            return service.responses.pop(0)
+        return httpx.Response(200, json=service.payload)
+
+    service._client.close()
+    service._client = httpx.Client(base_url=service.base_url, transport=httpx.MockTransport(handler))
+    yield service
+    service.close()
+
+
+class TestUSDAService:
+    """Test USDA service functionality"""
+
+    def test_search_uses_pooled_client(self, usda_service):
+        """Test that searches go through the shared client and keep the base path"""
+        init_db()
+        usda_service.clear_cache()
+        results = usda_service.search_foods("egg", page_size=5)
+
+        assert results[0]["fdc_id"] == 171287
+        assert results[0]["calories"] == 143
+        assert usda_service.requests_seen[0].url.path.endswith("/fdc/v1/foods/search")
+
+    def test_repeat_search_served_from_memory(self, usda_service):
+        """Test that a repeated search is answered by the in-memory cache tier"""
+        init_db()
+        usda_service.clear_cache()
+        usda_service.search_foods("egg", page_size=5)
+        usda_service.search_foods("egg", page_size=5)
+
+        assert len(usda_service.requests_seen) == 1
+        assert usda_service.get_cache_stats()["l1"]["hits"] == 1
+
+    def test_unknown_food_is_negatively_cached(self, usda_service):
+        """Test that a search with no USDA match is not repeated"""
+        init_db()
+        usda_service.clear_cache()
+        usda_service.payload = {"foods": []}
+
+        assert usda_service.search_foods("grandmas mystery stew") == []
+        assert usda_service.search_foods("grandmas mystery stew") == []
+        assert len(usda_service.requests_seen) == 1
+        assert usda_service.get_cache_stats()["negative_hits"] == 1
+
+    def test_auth_error_not_cached_as_miss(self, usda_service):
+        """Test that a rejected API key is reported instead of caching 'no match'"""
+        init_db()
+        usda_service.clear_cache()
+        usda_service.responses = [httpx.Response(403, json={"error": "API_KEY_INVALID"})]
+
+        assert usda_service.search_foods("egg", page_size=5) == []
+        assert usda_service.search_foods("egg", page_size=5)[0]["fdc_id"] == 171287
+        assert len(usda_service.requests_seen) == 2
+        assert usda_service.get_health_stats()["auth_failures"] == 1
+
+    def test_stale_entry_served_while_refreshing(self, usda_service):
+        """Test that an expired entry is returned immediately and refreshed in the background"""
+        init_db()
+        usda_service.clear_cache()
+        stale = [{"fdc_id": 1, "description": "Egg, stale", "calories": 140}]
+        with get_db_session() as db:
+            db.add(NutritionCache(cache_key="search:egg:5", data=stale,
+                                  created_at=datetime.utcnow() - timedelta(days=2)))
+
+        assert usda_service.search_foods("egg", page_size=5) == stale
+
+        usda_service._refresh_queue.join()
+        assert len(usda_service.requests_seen) == 1
+        with get_db_session() as db:
+            row = db.query(NutritionCache).filter(NutritionCache.cache_key == "search:egg:5").first()
+            assert nutrition_codec.unpack(row.packed)[0]["fdc_id"] == 171287
+
+    def test_legacy_rows_reencoded_on_read(self, usda_service):
+        """Test that plain-JSON cache rows are served and rewritten in the compact encoding"""
+        init_db()
+        usda_service.clear_cache()
+        legacy = [{"fdc_id": 1, "description": "Egg, legacy", "data_type": "SR Legacy",
+                   "serving_size": 100, "serving_unit": "g", "calories": 140}]
+        with get_db_session() as db:
+            db.add(NutritionCache(cache_key="search:egg:5", data=legacy))
+
+        assert usda_service.search_foods("egg", page_size=5)[0]["description"] == "Egg, legacy"
+        with get_db_session() as db:
+            row = db.query(NutritionCache).filter(NutritionCache.cache_key == "search:egg:5").first()
+            assert row.data is None
+            assert nutrition_codec.unpack(row.packed)[0]["description"] == "Egg, legacy"
+        usda_service._l1_cache.clear()
+        assert usda_service.search_foods("egg", page_size=5)[0]["calories"] == 140
+        assert usda_service.requests_seen == []
+        assert usda_service.get_cache_stats()["db"]["reencoded"] == 1
+
+    def test_sweep_removes_expired_and_evicts_over_cap(self, usda_service):
+        """Test that a sweep drops expired rows and evicts the least recently used ones"""
+        init_db()
+        usda_service.clear_cache()
+        now = datetime.utcnow()
+        with get_db_session() as db:
+            db.add(NutritionCache(cache_key="search:old:5", data=[{"fdc_id": 1}],
+                                  created_at=now - timedelta(days=365), last_accessed_at=now - timedelta(days=365)))
+            # Past the 6h negative TTL, though well inside the positive one
+            db.add(NutritionCache(cache_key="search:unknown:5", data={"negative": True},
+                                  created_at=now - timedelta(hours=7), last_accessed_at=now))
+            for i in range(3):
+                db.add(NutritionCache(cache_key=f"search:food{i}:5", data=[{"fdc_id": i}],
+                                      created_at=now, last_accessed_at=now - timedelta(minutes=10 - i)))
+        usda_service._max_rows = 2
+
+        assert usda_service.sweep_cache() == {"expired": 2, "evicted": 1}
+        with get_db_session() as db:
+            keys = {row.cache_key for row in db.query(NutritionCache).all()}
+        assert keys == {"search:food1:5", "search:food2:5"}
+
+    def test_retries_rate_limit_and_server_errors(self, usda_service):
+        """Test that 429 (honoring Retry-After) and 5xx responses are retried, not returned as misses"""
+        init_db()
+        usda_service.clear_cache()
+        usda_service._retry_base_delay = 0
+        usda_service.responses = [
+            httpx.Response(429, headers={"Retry-After": "0"}),
+            httpx.Response(503),
+        ]
+
+        results = usda_service.search_foods("egg", page_size=5)
+
+        assert results[0]["fdc_id"] == 171287
+        assert len(usda_service.requests_seen) == 3
+        stats = usda_service.get_quota_stats()
+        assert stats["retries"] == 2
+        assert stats["rate_limited"] == 1
+        assert stats["acquired"] == 3
+
+    def test_gives_up_after_max_retries(self, usda_service):
+        """Test that a persistently failing USDA is not cached as 'no match'"""
+        init_db()
+        usda_service.clear_cache()
+        usda_service._retry_base_delay = 0
+        usda_service._max_retries = 1
+        usda_service.responses = [httpx.Response(503), httpx.Response(503)]
+
+        assert usda_service.search_foods("egg", page_size=5) == []
+        assert usda_service.search_foods("egg", page_size=5)[0]["fdc_id"] == 171287
+        assert usda_service.get_quota_stats()["gave_up"] == 1
+
+    def test_open_breaker_skips_usda(self, usda_service):
+        """Test that repeated USDA failures open the breaker and later searches don't call USDA"""
+        init_db()
+        usda_service.clear_cache()
+        usda_service._retry_base_delay = 0
+        usda_service._max_retries = 0
+        usda_service._breaker.min_calls = 2
+        usda_service.responses = [httpx.Response(503), httpx.Response(503)]
+
+        assert usda_service.search_foods("egg") == []
+        assert usda_service.search_foods("toast") == []
+        assert usda_service.search_foods("banana") == []
+
+        assert len(usda_service.requests_seen) == 2
+        assert usda_service.get_health_stats()["breaker"]["state"] == "open"
+
+    def test_probe_released_when_quota_runs_out(self, usda_service, monkeypatch):
+        """Test that a half-open probe which never reached USDA doesn't block later probes"""
+        init_db()
+        usda_service.clear_cache()
+        breaker = usda_service._breaker
+        breaker.min_calls, breaker.reset_timeout = 1, 0
+        breaker.record_failure()
+        monkeypatch.setattr(usda_service._quota, "acquire", lambda timeout=None: False)
+
+        with pytest.raises(USDAQuotaExhausted):
+            usda_service._get_json("/foods/search", {"query": "egg"})
+        monkeypatch.undo()
+
+        assert usda_service.search_foods("egg", page_size=5)[0]["fdc_id"] == 171287
+        assert breaker.state == "closed"
+
+    def test_slow_request_is_hedged(self, usda_service):
+        """Test that a GET slower than the observed p95 gets a second request, and the fast one wins"""
+        init_db()
+        usda_service.clear_cache()
+        for _ in range(20):
+            usda_service._latency.record(0.01)
+        usda_service._hedge_min_delay = 0.05
+        usda_service.delays = [1.0]
+
+        started = time.monotonic()
+        results = usda_service.search_foods("egg", page_size=5)
+
+        assert results[0]["fdc_id"] == 171287
+        assert time.monotonic() - started < 0.9
+        assert len(usda_service.requests_seen) == 2
+        assert usda_service.get_health_stats()["hedge"] == {"sent": 1, "won": 1}
+
+    def test_batch_fetch_by_ids(self, usda_service):
+        """Test that many FDC IDs are resolved in one request and all of them are cached"""
+        init_db()
+        usda_service.clear_cache()
+        # POST /foods answers in the full format by default; abridged uses number/amount
+        usda_service.payload = [
+            {"fdcId": 171287, "description": "Egg, whole, raw, fresh", "dataType": "SR Legacy",
+             "foodNutrients": [
+                 {"type": "FoodNutrient", "id": 1, "amount": 143,
+                  "nutrient": {"id": 1008, "number": "208", "name": "Energy", "unitName": "kcal"}},
+                 {"type": "FoodNutrient", "id": 2, "amount": 12.56,
+                  "nutrient": {"id": 1003, "number": "203", "name": "Protein", "unitName": "g"}},
+             ],
+             "foodPortions": [{"gramWeight": 50, "amount": 1, "modifier": "large",
+                               "measureUnit": {"name": "undetermined"}}]},
+            {"fdcId": 171288, "description": "Egg, white, raw", "dataType": "SR Legacy",
+             "foodNutrients": [{"number": "208", "name": "Energy", "amount": 52, "unitName": "kcal"}]},
+        ]
+
+        results = usda_service.get_foods_by_ids([171287, 171288, 999, 171287])
+
+        assert results[171287]["description"] == "Egg, whole, raw, fresh"
+        assert results[171287]["calories"] == 143
+        assert results[171287]["protein"] == 12.56
+        assert results[171287]["portions"] == {"large": 50.0}
+        assert results[171288]["calories"] == 52
+        assert results[999] is None
+        assert len(usda_service.requests_seen) == 1
+        assert usda_service.requests_seen[0].method == "POST"
+        assert json.loads(usda_service.requests_seen[0].content) == {"fdcIds": [171287, 171288, 999]}
+
+        assert usda_service.get_food_by_id(171288)["fdc_id"] == 171288
+        assert usda_service.get_food_by_id(999) is None
+        assert len(usda_service.requests_seen) == 1
+
+    def test_local_index_answers_before_api(self, usda_service, tmp_path):
+        """Test that foods in the offline FDC index are served without an API call"""
+        dump = tmp_path / "foundation.json"
+        dump.write_text(json.dumps({"FoundationFoods": [
+            {"fdcId": 9, "description": "Egg, whole, cooked, scrambled", "dataType": "SR Legacy",
+             "foodNutrients": [{"nutrient": {"id": 1008}, "amount": 149},
+                               {"nutrient": {"id": 1003}, "amount": 9.99}],
+             "foodPortions": [{"gramWeight": 61, "amount": 1, "modifier": "large",
+                               "measureUnit": {"name": "undetermined"}}]},
+        ]}))
+        build_index([str(dump)], str(tmp_path / "index.sqlite"))
+        usda_service._local_index = FDCIndex(str(tmp_path / "index.sqlite"))
+
+        results = usda_service.search_foods("Scrambled Eggs", page_size=5)
+
+        assert results[0]["fdc_id"] == 9
+        assert results[0]["calories"] == 149
+        assert results[0]["portions"] == {"large": 61.0}
+        assert usda_service.calculate_nutrition_for_serving(results[0], 2, "large")["grams"] == 122
+        assert usda_service.requests_seen == []
+
+    def test_local_index_weak_match_falls_through_to_api(self, usda_service, tmp_path):
+        """Test that an any-word index hit that is a different food goes to the API instead"""
+        init_db()
+        usda_service.clear_cache()
+        dump = tmp_path / "foundation.json"
+        dump.write_text(json.dumps({"FoundationFoods": [
+            {"fdcId": 5, "description": "Chicken, broilers or fryers, meat only, cooked, roasted",
+             "dataType": "SR Legacy", "foodNutrients": [{"nutrient": {"id": 1008}, "amount": 190}]},
+        ]}))
+        build_index([str(dump)], str(tmp_path / "index.sqlite"))
+        usda_service._local_index = FDCIndex(str(tmp_path / "index.sqlite"))
+
+        assert usda_service._local_index.search("chicken tikka masala") == []
+        assert usda_service._local_index.search("roasted chicken")[0]["fdc_id"] == 5
+
+        usda_service.search_foods("chicken tikka masala", page_size=5)
+        assert len(usda_service.requests_seen) == 1
+
+    def test_shared_nutrient_table_built_from_cache(self, usda_service, tmp_path):
+        """Test that a table built from the nutrition cache answers names and IDs with no DB or API call"""
+        init_db()
+        usda_service.clear_cache()
+        food = dict(SEARCH_PAYLOAD["foods"][0], foodPortions=[
+            {"gramWeight": 50, "amount": 1, "modifier": "large", "measureUnit": {"name": "undetermined"}}])
+        usda_service.payload = {"foods": [food]}
+        usda_service.search_foods("eggs", page_size=5)
+        foods, names = foods_from_cache()
+        write_table(foods, names, str(tmp_path / "nutrients.bin"))
+
+        usda_service.clear_cache()
+        usda_service._nutrient_table = NutrientTable(str(tmp_path / "nutrients.bin"))
+        results = usda_service.search_foods("Egg", page_size=5)
+
+        assert results[0]["fdc_id"] == 171287
+        assert results[0]["protein"] == 12.56
+        assert results[0]["portions"] == {"large": 50.0}
+        assert usda_service.get_food_by_id(171287)["description"] == "Egg, whole, raw, fresh"
+        assert usda_service._nutrient_table.lookup_name("toast") is None
+        assert len(usda_service.requests_seen) == 1
+        assert usda_service.get_cache_stats()["nutrient_table"]["hits"] == 2
+
+
+class TestCacheWarmer:
+    """Test cache warm-up from historical food logs"""
+
+    def test_warms_most_logged_foods(self, usda_service):
+        """Test that the top-N foods are fetched once and grouped by normalized name"""
+        init_db()
+        usda_service.clear_cache()
+        with get_db_session() as db:
+            user = User(slack_user_id="WARMUP_USER", slack_team_id="TEAM")
+            db.add(user)
+            db.flush()
+            for items in (["Eggs", "toast"], ["egg", "banana"], ["eggs"], ["toast"]):
+                db.add(FoodLog(user_id=user.id, raw_text="test", total_calories=0,
+                               items=[{"name": name} for name in items]))
+
+        warmer = CacheWarmer(usda_service)
+        warmer.top_n = 2
+        warmer.min_interval = 0
+
+        assert warmer._top_logged() == ([("Eggs", 3), ("toast", 2)], [])
+        assert warmer.warm() == {"candidates": 2, "warmed": 2, "already_cached": 0, "food_ids": 0}
+        assert warmer.warm() == {"candidates": 2, "warmed": 0, "already_cached": 2, "food_ids": 0}
+        assert len(usda_service.requests_seen) == 2
+
+
+class TestAIService:
+    """Test the Gemini wrapper's async variants"""
+
+    def test_async_variant_uses_governor(self, monkeypatch):
+        """Test that aparse_food_message awaits the model and is counted by the governor"""
+        import asyncio
+        from types import SimpleNamespace
+        from src.services.ai_service import get_ai_service
+        from src.utils.request_governor import RequestGovernor
+
+        service = get_ai_service()
+
+        class FakeModel:
+            async def ainvoke(self, messages):
+                return SimpleNamespace(content='```json\n{"foods": [{"name": "apple", "quantity": 1, "unit": "medium"}]}\n```')
+
+        monkeypatch.setattr(service, "chat_model", FakeModel())
+        monkeypatch.setattr(service, "fast_chat_model", FakeModel())
+        # A governor of its own: the shared one may still be busy with other tests' background calls
+        monkeypatch.setattr(service, "governor", RequestGovernor(max_concurrent=2, requests_per_minute=100))
+
+        result = asyncio.run(service.aparse_food_message("an apple"))
+
+        assert result["foods"][0]["name"] == "apple"
+        assert service.get_stats()["governor"]["acquired"] == 1
+        assert service.get_stats()["governor"]["in_flight"] == 0
+
+    def test_history_and_tokens_per_intent(self, monkeypatch):
+        """Test that self-contained messages are sent without history and tokens are counted per intent"""
+        from types import SimpleNamespace
+        from src.services.ai_service import get_ai_service
+
+        service = get_ai_service()
+        prompts = []
+
+        class FakeModel:
+            def invoke(self, messages):
+                prompts.append(messages[-1].content)
+                return SimpleNamespace(content='{"intent": "log_food", "confidence": "high", "entities": {}}')
+
+        monkeypatch.setattr(service, "chat_model", FakeModel())
+        monkeypatch.setattr(service, "fast_chat_model", FakeModel())
+        history = [{"role": "user", "content": "2 eggs"}, {"role": "assistant", "content": ":egg: *Logged!* " + "x" * 300}]
+        before = service.get_stats()["tokens"].get("detect_intent", {}).get("calls", 0)
+
+        service.detect_intent("chicken salad", history=history)
+        service.detect_intent("make that 3", history=history)
+
+        assert "Recent conversation" not in prompts[0]
+        assert "User: 2 eggs" in prompts[1] and ":egg:" not in prompts[1]
+        tokens = service.get_stats()["tokens"]["detect_intent"]
+        assert tokens["calls"] == before + 2
+        assert tokens["history_tokens_saved"] > 0
+
+    def test_invalid_fast_answer_escalates(self, monkeypatch):
+        """Test that short messages go to the fast model and a bad answer is retried on the strong one"""
+        from types import SimpleNamespace
+        from src.services.ai_service import get_ai_service
+
+        service = get_ai_service()
+        calls = []
+
+        class FakeModel:
+            def __init__(self, tier, content):
+                self.tier = tier
+                self.content = content
+
+            def invoke(self, messages):
+                calls.append(self.tier)
+                return SimpleNamespace(content=self.content)
+
+        monkeypatch.setattr(service, "fast_chat_model", FakeModel("fast", '{"foods": [{"name": "toast", "quantity": "some"}]}'))
+        monkeypatch.setattr(service, "chat_model", FakeModel("strong", json.dumps(
+            {"foods": [{"name": "toast", "quantity": 1, "unit": "slice"}], "confidence": "high"})))
+        before = service.get_stats()
+
+        result = service.parse_food_message("toast")
+        long_meal = "grilled chicken breast, brown rice, steamed broccoli, a side salad and a glass of orange juice"
+        service.parse_food_message(long_meal)
+
+        assert result["foods"][0]["quantity"] == 1
+        assert calls == ["fast", "strong", "strong"]
+        stats = service.get_stats()
+        assert stats["tokens"]["parse_food"]["escalations"] == before["tokens"].get("parse_food", {}).get("escalations", 0) + 1
+        assert stats["tiers"]["fast"]["calls"] == before["tiers"].get("fast", {}).get("calls", 0) + 1
+        assert stats["tiers"]["strong"]["estimated_cost_usd"] > 0
@@ -0,0 +1,459 @@
+"""
+Unit Tests for Utilities
+"""
+
+import asyncio
+import base64
+import json
+import threading
+import time
+
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.food_normalizer import normalize_food_name, food_cache_key, singularize
+from src.utils import nutrition_codec
+from src.utils.message_text import is_referential, normalize_message
+from src.utils.match_ranker import best_match, rank_matches
+from src.utils.profile_extractor import extract_profile, missing_fields
+from src.utils.prompt_budget import compress_history, estimate_tokens, history_for_prompt, strip_bot_formatting
+from src.utils.request_governor import RequestGovernor
+from src.utils.rule_parser import parse_food_text
+from src.utils.single_flight import SingleFlight
+from src.utils.token_bucket import TokenBucket
+from src.utils.units import grams_per_unit, parse_food_portions
+from src.utils.ttl_cache import TTLCache
+
+
+class TestTTLCache:
+    """Test in-memory LRU/TTL cache"""
+
+    def test_evicts_least_recently_used(self):
+        """Test that the oldest untouched entry is evicted when full"""
+        cache = TTLCache(maxsize=2, ttl_seconds=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_expired_entries_miss(self):
+        """Test that entries past their TTL are treated as misses"""
+        cache = TTLCache(maxsize=10, ttl_seconds=60)
+        cache.set("a", 1, ttl_seconds=0)
+
+        assert cache.get("a") is None
+        assert cache.stats()["misses"] == 1
+
+
+class TestFoodNormalizer:
+    """Test canonical food-name normalization"""
+
+    def test_variants_share_cache_key(self):
+        """Test case, whitespace, plural and word-order variants collapse to one key"""
+        keys = {food_cache_key(n) for n in ["Scrambled Eggs", "scrambled eggs ", "eggs, scrambled"]}
+        assert keys == {"scrambled egg"}
+
+    def test_word_order_kept(self):
+        """Test that different foods made of the same words keep distinct keys"""
+        assert food_cache_key("milk chocolate") != food_cache_key("chocolate milk")
+        assert food_cache_key("Egg, whole, raw, fresh") == "egg whole raw fresh"
+
+    def test_synonyms_and_spelling(self):
+        """Test synonym expansion and light spell correction"""
+        assert normalize_food_name("fries") == "french fries"
+        assert normalize_food_name("French Fries") == "french fries"
+        assert normalize_food_name("brocoli") == "broccoli"
+        assert normalize_food_name("hummus") == "hummus"
+        assert normalize_food_name("beef mince") == "ground beef"
+        assert normalize_food_name("sweet potato fries") == "sweet potato fries"
+        assert normalize_food_name("pb&j") == "peanut butter and jelly sandwich"
+        assert normalize_food_name("creamy tomato soup") == "creamy tomato soup"
+
+    def test_ambiguous_synonyms_only_replace_the_whole_name(self):
+        """Test that "curd", "mince" and "coke" aren't rewritten inside other foods' names"""
+        assert normalize_food_name("bean curd") == "bean curd"
+        assert normalize_food_name("lemon curd") == "lemon curd"
+        assert normalize_food_name("mince pie") == "mince pie"
+        assert normalize_food_name("coke zero") == "coke zero"
+        assert normalize_food_name("coke") == "cola"
+
+    def test_normalization_is_idempotent(self):
+        """Test that normalizing an already canonical name leaves it unchanged"""
+        for name in ["OJ", "mac and cheese", "blueberries", "cookies", "latte"]:
+            once = normalize_food_name(name)
+            assert normalize_food_name(once) == once
+
+    def test_singularize(self):
+        """Test the plural rules shared with the match ranker"""
+        assert [singularize(w) for w in ["berries", "tomatoes", "peaches", "eggs", "hummus", "fries"]] == [
+            "berry", "tomato", "peach", "egg", "hummus", "fries"]
+
+
+class TestSingleFlight:
+    """Test coalescing of concurrent identical calls"""
+
+    def test_concurrent_callers_share_one_call(self):
+        """Test that callers arriving while a call is in flight reuse its result"""
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_lookup():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "chicken salad"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("chicken salad", slow_lookup)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("chicken salad", slow_lookup)))
+                     for _ in range(3)]
+        for t in followers:
+            t.start()
+        while flight.stats()["saved"] < 3:
+            time.sleep(0.01)
+        release.set()
+        for t in [leader] + followers:
+            t.join(5)
+
+        assert results == ["chicken salad"] * 4
+        assert len(calls) == 1
+        assert flight.stats() == {"executed": 1, "saved": 3, "in_flight": 0}
+
+
+class TestMatchRanker:
+    """Test local re-ranking of USDA search candidates"""
+
+    def test_prefers_plain_food_over_usda_first_hit(self):
+        """Test that compound dishes and concentrated forms lose to the plain food"""
+        candidates = [
+            {"fdc_id": 1, "description": "Bread, egg", "data_type": "SR Legacy"},
+            {"fdc_id": 2, "description": "Egg, whole, dried", "data_type": "SR Legacy"},
+            {"fdc_id": 3, "description": "Egg, whole, raw, fresh", "data_type": "SR Legacy"},
+        ]
+        assert best_match("eggs", candidates)["fdc_id"] == 3
+        assert [c["fdc_id"] for _, c in rank_matches("eggs", candidates)][0] == 3
+
+    def test_matches_requested_preparation(self):
+        """Test that a preparation word in the query picks the matching description"""
+        candidates = [
+            {"fdc_id": 1, "description": "Egg, whole, raw, fresh", "data_type": "SR Legacy"},
+            {"fdc_id": 2, "description": "Egg, whole, cooked, scrambled", "data_type": "SR Legacy"},
+        ]
+        assert best_match("scrambled eggs", candidates)["fdc_id"] == 2
+
+    def test_no_candidates(self):
+        """Test that an empty result list has no best match"""
+        assert best_match("egg", []) is None
+
+
+class TestUnits:
+    """Test unit-to-gram conversion and USDA portion parsing"""
+
+    def test_usda_portion_weights(self):
+        """Test that foodPortions and foodMeasures become per-unit gram weights"""
+        food = {
+            "foodPortions": [
+                {"gramWeight": 50, "amount": 1, "modifier": "large", "measureUnit": {"name": "undetermined"}},
+                {"gramWeight": 30, "amount": 1, "modifier": "", "measureUnit": {"name": "cup"}},
+            ],
+            "foodMeasures": [
+                {"disseminationText": "1/2 cup", "gramWeight": 12, "measureUnitName": "cup"},
+                {"disseminationText": "2 slices", "gramWeight": 50, "measureUnitName": "undetermined"},
+                {"disseminationText": "Quantity not specified", "gramWeight": 100, "measureUnitName": "undetermined"},
+            ],
+        }
+        assert parse_food_portions(food) == {"large": 50.0, "cup": 30.0, "slice": 25.0}
+
+    def test_fndds_portion_descriptions(self):
+        """Test that FNDDS portions, with a numeric code in modifier, are read from portionDescription"""
+        food = {"foodPortions": [
+            {"gramWeight": 240, "modifier": "10205", "portionDescription": "1 cup",
+             "measureUnit": {"name": "undetermined"}, "sequenceNumber": 1},
+            {"gramWeight": 50, "modifier": "20000", "portionDescription": "1 large",
+             "measureUnit": {"name": "undetermined"}, "sequenceNumber": 2},
+            {"gramWeight": 100, "modifier": "90000", "portionDescription": "Quantity not specified",
+             "measureUnit": {"name": "undetermined"}, "sequenceNumber": 3},
+        ]}
+        assert parse_food_portions(food) == {"cup": 240.0, "large": 50.0}
+
+    def test_food_portions_override_generic_table(self):
+        """Test that a food's own portion wins, and weights stay exact"""
+        portions = {"cup": 30.0, "medium": 118.0}
+        assert grams_per_unit("cups", portions) == 30.0
+        assert grams_per_unit("cups") == 240
+        assert grams_per_unit("piece", portions) == 118.0
+        assert grams_per_unit("Tablespoons") == 15
+        assert grams_per_unit("oz", {"oz": 1.0}) == 28.35
+        assert grams_per_unit("handfulz") is None
+
+
+class TestTokenBucket:
+    """Test the blocking quota token bucket"""
+
+    def test_waits_for_refill_then_times_out(self):
+        """Test that callers queue for a token and give up only after the timeout"""
+        bucket = TokenBucket(capacity=2, refill_per_second=20)
+        assert bucket.acquire(timeout=0)
+        assert bucket.acquire(timeout=0)
+        assert not bucket.acquire(timeout=0)
+        assert bucket.acquire(timeout=1)
+
+        stats = bucket.stats()
+        assert stats["acquired"] == 3
+        assert stats["waited"] == 1
+        assert stats["rejected"] == 1
+
+    def test_pause_and_limit(self):
+        """Test that a Retry-After pause blocks acquires and the API's count caps the bucket"""
+        bucket = TokenBucket(capacity=10, refill_per_second=0)
+        bucket.limit_to(1)
+        assert bucket.remaining() == 1
+        bucket.pause(5)
+        assert not bucket.acquire(timeout=0.05)
+
+
+class TestCircuitBreaker:
+    """Test the failure/latency circuit breaker"""
+
+    def test_opens_on_failures_and_slow_calls(self):
+        """Test that a window of failed or slow calls opens the breaker and short-circuits"""
+        breaker = CircuitBreaker(failure_rate=0.5, min_calls=4, window_size=4, slow_call_seconds=1.0,
+                                 reset_timeout=60)
+        breaker.record_success(0.1)
+        breaker.record_success(5.0)
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_success(0.1)
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow()
+        assert breaker.stats()["short_circuited"] == 1
+
+    def test_half_open_probe(self):
+        """Test that after the reset timeout one probe is allowed and its result decides the state"""
+        breaker = CircuitBreaker(min_calls=1, window_size=1, reset_timeout=0)
+        breaker.record_failure()
+
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success(0.1)
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+class TestNutritionCodec:
+    """Test the compact cache encoding"""
+
+    def test_round_trip(self):
+        """Test that food lists and single foods survive encode/decode"""
+        foods = [
+            {"fdc_id": 171287, "description": "Egg, whole, raw, fresh", "data_type": "SR Legacy",
+             "serving_size": 100, "serving_unit": "g", "calories": 143, "protein": 12.56, "carbs": 0.72,
+             "fat": 9.51, "portions": {"large": 50.0}},
+            {"fdc_id": 2, "description": "Crème brûlée", "data_type": "Survey (FNDDS)",
+             "serving_size": 100, "serving_unit": "g", "calories": 256.3, "fiber": 0, "portions": {}},
+        ]
+        packed = nutrition_codec.pack(foods)
+
+        assert isinstance(packed, bytes)
+        assert len(packed) < len(json.dumps(foods))
+        assert nutrition_codec.unpack(packed) == foods
+        assert nutrition_codec.unpack(nutrition_codec.pack(foods[0])) == foods[0]
+        # Rows the first codec version wrote into the JSON column
+        legacy = "nc1:" + base64.b64encode(packed).decode("ascii")
+        assert nutrition_codec.decode(legacy) == foods
+
+    def test_other_values_pass_through(self):
+        """Test that negative entries and legacy JSON are left alone"""
+        negative = {"negative": True}
+        assert not nutrition_codec.is_encodable(negative)
+        assert not nutrition_codec.is_encodable([])
+        assert nutrition_codec.decode(negative) == negative
+        assert nutrition_codec.decode([{"fdc_id": 1}]) == [{"fdc_id": 1}]
+
+
+class TestMessageText:
+    """Test message normalization and reference detection"""
+
+    def test_normalize_message(self):
+        """Test that filler, case and punctuation don't change the cache form"""
+        assert normalize_message("I had 2 Eggs & toast!") == "2 eggs and toast"
+        assert normalize_message("  had 2 eggs and toast. ") == "2 eggs and toast"
+        assert normalize_message("1.5 cups of rice") == "1.5 cups of rice"
+
+    def test_is_referential(self):
+        """Test that messages pointing back at the conversation are detected"""
+        assert is_referential("same as yesterday")
+        assert is_referential("make that 3")
+        assert is_referential("3", history=[{"role": "assistant", "content": "How many eggs?"}])
+        assert not is_referential("3")
+        assert not is_referential("2 eggs and toast")
+
+
+class TestRuleParser:
+    """Test the deterministic food parser"""
+
+    def test_parses_simple_lists(self):
+        """Test quantities, units, conjunctions and meal keywords"""
+        result = parse_food_text("3 large eggs, 2 slices of toast & a coffee for breakfast")
+
+        assert [(f["quantity"], f["unit"], f["name"]) for f in result["foods"]] == [
+            (3, "large", "eggs"), (2, "slice", "toast"), (1, "cup", "coffee"),
+        ]
+        assert result["meal_type"] == "breakfast"
+        assert result["confidence_score"] == 1.0
+
+        grams = parse_food_text("200g chicken breast")["foods"][0]
+        assert (grams["quantity"], grams["unit"], grams["name"]) == (200, "g", "chicken breast")
+
+    def test_low_confidence_and_rejections(self):
+        """Test that fuzzy or non-food messages are left to Gemini"""
+        assert parse_food_text("2 eggs and toast")["confidence_score"] >= 0.9
+        assert parse_food_text("mac and cheese")["foods"][0]["name"] == "mac and cheese"
+        assert parse_food_text("some pasta with pesto")["confidence_score"] < 0.9
+        assert parse_food_text("coffee")["confidence_score"] < 0.9
+        assert parse_food_text("how many calories in an apple?") is None
+        assert parse_food_text("delete my last meal") is None
+
+    def test_units_and_dishes_are_not_foods(self):
+        """Test that bare units and times aren't logged, and dish names aren't split into unit + name"""
+        assert parse_food_text("2 cups") is None
+        assert parse_food_text("3 pm") is None
+        assert parse_food_text("chips and salsa dip") is None
+
+        dish = parse_food_text("2 eggs and bacon")
+        assert dish["foods"][0]["name"] == "eggs and bacon"
+        assert dish["confidence_score"] < 0.6
+        assert parse_food_text("2 eggs")["foods"][0]["name"] == "eggs"
+
+    def test_food_noun_units_stay_in_the_name(self):
+        """Test that a food word that doubles as a unit isn't split off the food's name"""
+        for message, name in [("2 egg whites", "egg whites"), ("3 tortilla chips", "tortilla chips"),
+                              ("a patty melt", "patty melt"), ("2 egg rolls", "egg rolls")]:
+            food = parse_food_text(message)["foods"][0]
+            assert (food["name"], food["unit"]) == (name, "piece")
+        assert parse_food_text("3 strips of bacon")["foods"][0]["unit"] == "strip"
+
+    def test_unknown_nouns_score_low(self):
+        """Test that counted non-foods ("a nap", "10 pushups") aren't confident food parses"""
+        for message in ["a question", "3 days", "10 pushups", "a nap", "two options"]:
+            assert parse_food_text(message)["confidence_score"] < 0.9
+        assert parse_food_text("3 apples")["confidence_score"] == 1.0
+
+
+class TestRequestGovernor:
+    """Test the shared concurrency + requests-per-minute governor"""
+
+    def test_caps_concurrency_and_queues(self):
+        """Test that callers over the concurrency limit wait instead of failing"""
+        governor = RequestGovernor(max_concurrent=2, requests_per_minute=100)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with governor.slot():
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.05)
+                with lock:
+                    active.pop()
+
+        threads = [threading.Thread(target=call) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        stats = governor.stats()
+        assert max(peak) == 2
+        assert stats["acquired"] == 6
+        assert stats["queued"] >= 3
+        assert stats["queue_wait_p95"] > 0
+
+    def test_rate_limit_applies_to_async_callers(self):
+        """Test that async callers queue for the per-window limit without blocking the loop"""
+        governor = RequestGovernor(max_concurrent=10, requests_per_minute=2, window_seconds=0.2)
+
+        async def call():
+            async with governor.slot_async() as waited:
+                return waited
+
+        async def main():
+            return await asyncio.gather(*(call() for _ in range(3)))
+
+        start = time.monotonic()
+        waits = asyncio.run(main())
+
+        assert time.monotonic() - start >= 0.15
+        assert sorted(waits)[-1] >= 0.15
+        assert governor.stats()["acquired"] == 3
+
+
+class TestProfileExtractor:
+    """Test local extraction of onboarding details"""
+
+    def test_full_answer(self):
+        """Test the common one-line formats, metric and imperial"""
+        profile, leftover = extract_profile("30 male 75kg 175cm moderately active lose weight")
+        assert profile == {"age": 30, "gender": "male", "weight_kg": 75.0, "height_cm": 175.0,
+                           "activity_level": "moderately_active", "goal": "lose_weight"}
+        assert leftover == []
+
+        profile, _ = extract_profile("25 f 140 lbs 5'6\" sedentary maintain")
+        assert profile["weight_kg"] == 63.5
+        assert profile["height_cm"] == 167.6
+        assert missing_fields(profile) == []
+
+    def test_step_by_step_answers(self):
+        """Test that a bare number answers the one outstanding field it fits"""
+        assert extract_profile("I'm 30")[0] == {"age": 30}
+        assert extract_profile("75", missing=["weight_kg", "height_cm", "goal"])[0] == {"weight_kg": 75.0}
+        assert extract_profile("180", missing=["weight_kg", "height_cm"])[0] == {}
+        assert extract_profile("a 30 yo guy who lifts")[1] == ["who", "lifts"]
+
+    def test_target_amounts_are_not_current_weight(self):
+        """Test that weights to lose/gain or reach aren't read as the user's weight or age"""
+        assert extract_profile("I want to lose 70 pounds")[0] == {"goal": "lose_weight"}
+        assert extract_profile("my goal is 65kg")[0] == {}
+
+        # No unit: 180 could be kg or lbs, so it is left for Gemini instead of guessed
+        profile, leftover = extract_profile("I weigh 180 and want to lose 20 lbs")
+        assert profile == {"goal": "lose_weight"}
+        assert leftover == ["180"]
+        assert extract_profile("20 lbs")[0] == {}
+
+
+class TestPromptBudget:
+    """Test history trimming for Gemini prompts"""
+
+    HISTORY = [
+        {"role": "user", "content": "2 eggs and toast for breakfast"},
+        {"role": "assistant", "content": ":white_check_mark: *Logged!*\n:egg: 2 eggs - 140 cal\n:large_green_square::white_large_square: 15%"},
+        {"role": "user", "content": "a banana"},
+        {"role": "assistant", "content": "How many bananas did you have?"},
+    ]
+
+    def test_strip_bot_formatting(self):
+        """Test that emoji, markdown and progress bars are removed from bot replies"""
+        assert strip_bot_formatting(self.HISTORY[1]["content"]) == "Logged!; 2 eggs - 140 cal; 15%"
+
+    def test_history_only_for_referential_messages(self):
+        """Test that self-contained messages get no history, referential ones and short answers do"""
+        assert history_for_prompt("chicken salad for lunch", self.HISTORY, 120) == ""
+        assert "bananas" in history_for_prompt("two", self.HISTORY, 120)
+        block = history_for_prompt("same as yesterday", self.HISTORY, 120)
+        assert 'Earlier the user said: "2 eggs and toast for breakfast"' in block
+        assert ":egg:" not in block
+
+    def test_compress_history_fits_budget(self):
+        """Test that older lines are dropped and the latest turn cut to fit the budget"""
+        block = compress_history(self.HISTORY, max_tokens=15)
+        assert estimate_tokens(block) <= 15
+        assert block.startswith("Recent conversation:\n  Bot: How many")